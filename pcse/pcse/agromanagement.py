@@ -10,6 +10,7 @@ Examples are sowing and harvesting, etc.
 List of routines:
 
 * AgroManagementSingleCrop
+* AgroManagementCropCalendar
 """
 
 import datetime
@@ -148,6 +149,19 @@ class AgroManagementSingleCrop(AncillaryObject):
             self._send_signal(signal=signals.crop_finish, day=day,
                               finish_type=finish_type)
     
+    def quiet_days(self, day):
+        """Returns the number of days following `day` on which no management
+        actions take place, which is only known before the crop is started.
+        """
+        if self.in_crop_cycle or day >= self.params.CROP_START_DATE:
+            return 0
+        return (self.params.CROP_START_DATE - day).days - 1
+
+    def advance(self, days):
+        """Accounts for `days` days without management actions that were
+        simulated without calling the agromanagement, see `quiet_days()`."""
+        self.duration += days
+
     def _start_new_crop(self, day, cropsimulation):
         """Starts a new simulation by sending the apropriate signal and
         variables.
@@ -162,3 +176,159 @@ class AgroManagementSingleCrop(AncillaryObject):
 
         self.in_crop_cycle = False
         self._send_signal(signal=signals.terminate)
+
+
+class AgroManagementCropCalendar(AncillaryObject):
+    """Agromanagement for running successive crop seasons in one simulation.
+
+    The crop calendar is given by a list of campaigns, each with the
+    parameters of `AgroManagementSingleCrop`. For each campaign a new crop
+    simulation object is started on its CROP_START_DATE. The crop is
+    finished at CROP_END_DATE (harvest|earliest), at maturity or when the
+    maximum duration is reached and is then removed from the system, so the
+    soil continues with the state at the end of the previous campaign. The
+    campaigns must be in chronological order and a crop must be finished
+    before the next one is started.
+
+    **Simulation parameters:**
+
+    ================ =========================================== =======  ======
+     Name            Description                                  Type     Unit
+    ================ =========================================== =======  ======
+    CAMPAIGNS        List of dictionaries with the parameters       STi     -
+                     of `AgroManagementSingleCrop` for each
+                     campaign.
+    ================ =========================================== =======  ======
+
+    **Signals sent or handled:**
+
+    * "CROP_START": sent when `day == CROP_START_DATE` of a campaign
+    * "CROP_FINISH": sent when `day == CROP_END_DATE` of a campaign or when
+      the maximum duration is reached.
+    * "TERMINATE": sent when the crop of the last campaign is finished.
+    """
+    # system configuration
+    mconf = Instance(ConfigurationLoader)
+
+    # Placeholders for the parameters that are needed to start the crop
+    soildata = Instance(dict)
+    cropdata = Instance(dict)
+    sitedata = Instance(dict)
+    campaigns = Instance(list)
+    # Index of the current campaign in campaigns
+    campaign = Int(0)
+    duration = Int(0)
+    in_crop_cycle = Bool(False)
+
+    # The crop of each campaign is removed from the system when it finishes
+    crop_rotation = True
+
+    def initialize(self, day, kiosk, mconf, timerdata, soildata, sitedata, cropdata):
+        """
+        :param day: start date of the simulation
+        :param kiosk: variable kiosk of this PyWOFOST instance
+        :param mconf: ConfigurationLoader instance
+        :param timerdata: dictionary with the key CAMPAIGNS, see above
+        :param soildata: idem for soildata
+        :param sitedata: idem for sitedata
+        :param cropdata: idem for cropdata
+        """
+        self.kiosk = kiosk
+        self.mconf = mconf
+        self.duration = 0
+        self.campaign = 0
+
+        self.soildata = soildata
+        self.cropdata = cropdata
+        self.sitedata = sitedata
+
+        self.campaigns = [AgroManagementSingleCrop.Parameters(c)
+                          for c in timerdata["CAMPAIGNS"]]
+        if len(self.campaigns) == 0:
+            msg = "No campaigns defined: crop simulation will never start."
+            raise exc.PCSEError(msg)
+
+        self._connect_signal(self._on_CROP_FINISH, signal=signals.crop_finish)
+
+        # Check if sequence of dates is OK, otherwise a crop will never
+        # start or finish
+        if day > self.campaigns[0].CROP_START_DATE:
+            msg = ("CROP_START_DATE before simulation start day: " +
+                  "crop simulation will never start.")
+            raise exc.PCSEError(msg)
+        for i, p in enumerate(self.campaigns):
+            last_day = p.CROP_START_DATE + datetime.timedelta(days=p.MAX_DURATION)
+            if p.CROP_END_TYPE in ("harvest","earliest"):
+                if p.CROP_END_DATE <= p.CROP_START_DATE:
+                    msg = ("CROP_END_DATE <= CROP_START_DATE: " +
+                           "crop simulation will never finish!")
+                    raise exc.PCSEError(msg)
+                last_day = min(last_day, p.CROP_END_DATE)
+            if i + 1 < len(self.campaigns) and \
+               last_day >= self.campaigns[i+1].CROP_START_DATE:
+                msg = ("Crop of campaign starting at %s may not be finished " +
+                       "before the next campaign starts at %s.")
+                raise exc.PCSEError(msg % (p.CROP_START_DATE,
+                                           self.campaigns[i+1].CROP_START_DATE))
+
+    def __call__(self, day, drv):
+
+        self.duration += 1
+        if self.campaign == len(self.campaigns):
+            return
+        p = self.campaigns[self.campaign]
+
+        # Check if crop sowing/emergence date of the campaign is reached.
+        if day == p.CROP_START_DATE:
+            cropsimulation = self.mconf.CROP(day, self.kiosk, self.cropdata,
+                                             self.soildata, self.sitedata,
+                                             p.CROP_START_TYPE, p.CROP_END_TYPE)
+            self.duration = 0
+            self.in_crop_cycle = True
+            self._send_signal(signal=signals.crop_start, day=day,
+                              cropsimulation=cropsimulation)
+
+        if not self.in_crop_cycle:
+            return
+
+        finish_cropsimulation = False
+        # Check if CROP_END_DATE is reached for CROP_END_TYPE harvest/earliest
+        if p.CROP_END_TYPE in ["harvest","earliest"]:
+            if (day >= p.CROP_END_DATE):
+                finish_cropsimulation = True
+                finish_type = "harvest"
+
+        # Check for forced stop because maximum duration is reached
+        if self.duration >= p.MAX_DURATION:
+            finish_cropsimulation = True
+            finish_type = "max_duration"
+
+        # If finish condition is reached send a signal to finish the crop
+        if finish_cropsimulation == True:
+            self._send_signal(signal=signals.crop_finish, day=day,
+                              finish_type=finish_type, crop_delete=True)
+
+    def quiet_days(self, day):
+        """Returns the number of days following `day` on which no management
+        actions take place, which is only known between crops.
+        """
+        if self.in_crop_cycle or self.campaign == len(self.campaigns):
+            return 0
+        CROP_START_DATE = self.campaigns[self.campaign].CROP_START_DATE
+        if day >= CROP_START_DATE:
+            return 0
+        return (CROP_START_DATE - day).days - 1
+
+    def advance(self, days):
+        """Accounts for `days` days without management actions that were
+        simulated without calling the agromanagement, see `quiet_days()`."""
+        self.duration += days
+
+    def _on_CROP_FINISH(self):
+        """Moves to the next campaign when the crop is finished and sends the
+        signal to terminate the system after the last campaign."""
+
+        self.in_crop_cycle = False
+        self.campaign += 1
+        if self.campaign == len(self.campaigns):
+            self._send_signal(signal=signals.terminate)
@@ -8,17 +8,96 @@ when creating PCSE simulation units.
 """
 import types
 import logging
+import operator
+import weakref
 from datetime import date
+from copy import deepcopy
 import cPickle
 
 from .traitlets import (HasTraits, Any, Float, Int, Instance, Dict, Bool,
                         Enum, AfgenTrait)
-from .pydispatch import dispatcher
-from .util import Afgen
+from .pydispatch import robustapply
+from .util import Afgen, FastAfgen
 from . import exceptions as exc
 from .decorators import prepare_states
 from .settings import settings
 
+class SignalDispatcher(object):
+    """Delivers the signals sent within one PCSE instance.
+
+    Each VariableKiosk owns a SignalDispatcher, so the receivers of an
+    Engine are isolated from those of other Engines. The Engine clears its
+    dispatcher when it is reset or closed, see `Engine.close()`. As with PyDispatcher, receivers are referenced
+    weakly and receive only the keyword arguments they accept. The accepted
+    arguments are determined when a receiver is connected and `send()` runs
+    through a tuple of receivers per signal.
+    """
+
+    def __init__(self):
+        self._receivers = {}
+
+    def _compile(self, receiver):
+        func, code, is_method = robustapply.function(receiver)
+        names = code.co_varnames[is_method:code.co_argcount]
+        varkw = bool(code.co_flags & 8)
+        if is_method:
+            return (weakref.ref(func.im_self), func.im_func, names, varkw)
+        return (weakref.ref(func), None, names, varkw)
+
+    @staticmethod
+    def _same_receiver(entry, other):
+        return entry[0]() is other[0]() and entry[1] is other[1]
+
+    def connect(self, receiver, signal):
+        """Connects receiver to signal. A receiver that was connected to
+        the signal before is moved to the end of the receivers."""
+        if signal is None:
+            msg = "Signal cannot be None (receiver=%r)" % receiver
+            raise exc.PCSEError(msg)
+        entry = self._compile(receiver)
+        receivers = [r for r in self._receivers.get(signal, ())
+                     if r[0]() is not None and not self._same_receiver(r, entry)]
+        receivers.append(entry)
+        self._receivers[signal] = tuple(receivers)
+
+    def disconnect(self, obj):
+        """Disconnects all receivers that are methods of obj or are obj."""
+        for signal, receivers in self._receivers.items():
+            self._receivers[signal] = tuple(r for r in receivers
+                                            if r[0]() is not obj and
+                                            r[0]() is not None)
+
+    def clear(self):
+        """Disconnects all receivers."""
+        self._receivers.clear()
+
+    def send(self, signal, sender, *args, **kwargs):
+        """Sends signal to the connected receivers. The signal and sender
+        are passed as keyword arguments `signal` and `sender`, which are only
+        given to receivers that accept them like all keyword arguments."""
+        kwargs["signal"] = signal
+        kwargs["sender"] = sender
+        nargs = len(args)
+        dead = False
+        for ref, func, names, varkw in self._receivers.get(signal, ()):
+            obj = ref()
+            if obj is None:
+                dead = True
+                continue
+            if varkw:
+                named = kwargs
+            else:
+                named = dict((name, kwargs[name]) for name in names[nargs:]
+                             if name in kwargs)
+            if func is None:
+                obj(*args, **named)
+            else:
+                func(obj, *args, **named)
+        if dead:
+            self._receivers[signal] = tuple(r for r in self._receivers[signal]
+                                            if r[0]() is not None)
+
+
 class VariableKiosk(dict):
     """VariableKiosk for registering and publishing state variables in PCSE.
     
@@ -99,6 +178,7 @@ class VariableKiosk(dict):
     
     def __init__(self):
         dict.__init__(self)
+        self.dispatcher = SignalDispatcher()
         self.registered_states = {}
         self.registered_rates  = {}
         self.published_states = {}
@@ -288,8 +368,19 @@ class ParamTemplate(HasTraits):
         pcse.exceptions.ParameterError: Value for parameter C missing.
     """
 
+    def __new__(cls, parvalues, *args, **kwargs):
+        # Return the instance created before from the same CachedParameters
+        templates = getattr(parvalues, "templates", None)
+        if templates is not None and cls in templates:
+            return templates[cls]
+        return HasTraits.__new__(cls, parvalues, *args, **kwargs)
+
     def __init__(self, parvalues):
         
+        templates = getattr(parvalues, "templates", None)
+        if templates is not None and templates.get(self.__class__) is self:
+            return
+
         HasTraits.__init__(self)
         
         for parname in self.trait_names():
@@ -311,10 +402,13 @@ class ParamTemplate(HasTraits):
             #    setattr(self, parname, afgen(value))
             if isinstance(getattr(self, parname), (Afgen)):
                 # AFGEN table parameter
-                setattr(self, parname, Afgen(value))
+                setattr(self, parname, FastAfgen(value))
             else:
                 # Single value parameter
                 setattr(self, parname, value)
+
+        if templates is not None:
+            templates[self.__class__] = self
                 
     def __setattr__(self, attr, value):
         if attr.startswith("_"):
@@ -326,6 +420,57 @@ class ParamTemplate(HasTraits):
             raise AttributeError(msg)
 
 
+class CachedParameters(dict):
+    """Dictionary of parameter values that keeps the ParamTemplate instances
+    created from it.
+
+    Creating a ParamTemplate subclass from a CachedParameters returns the
+    instance that was created before by the same subclass, so the values are
+    validated and the AFGEN tables are parsed only once. This is used by
+    `Engine.reset()` for running successive seasons with the same crop
+    parameters. Any change to the dictionary discards the instances.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.templates = {}
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.templates.clear()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.templates.clear()
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.templates.clear()
+
+    def pop(self, *args):
+        self.templates.clear()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.templates.clear()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self.templates.clear()
+        return dict.setdefault(self, key, default)
+
+    def clear(self):
+        dict.clear(self)
+        self.templates.clear()
+
+    def __reduce__(self):
+        # Copies and pickles do not include the ParamTemplate instances
+        return (self.__class__, (dict(self),))
+
+    def __deepcopy__(self, memo):
+        return self.__class__(deepcopy(dict(self), memo))
+
+
 #-------------------------------------------------------------------------------
 def check_publish(publish):
     """ Convert the list of published variables to a set with unique elements.
@@ -348,6 +493,15 @@ class StatesRatesCommon(HasTraits):
     _valid_vars = Instance(set)
     _locked = Bool(False)
 
+    def __new__(cls, *args, **kwargs):
+        # With settings.FAST_STATES_RATES an instance of the fast class for
+        # cls and the published variables is returned, see _get_slots_class()
+        if settings.FAST_STATES_RATES and \
+           not issubclass(cls, _SlotsStatesRatesCommon):
+            publish = kwargs.get("publish", args[1] if len(args) > 1 else None)
+            return object.__new__(_get_slots_class(cls, publish))
+        return HasTraits.__new__(cls, *args, **kwargs)
+
     def __init__(self, kiosk=None, publish=None):
         """Set up the common stuff for the states and rates template
         including variables that have to be published in the kiosk
@@ -614,6 +768,171 @@ class RatesTemplate(StatesRatesCommon):
         """
         self._trait_values.update(self._rate_vars_zero)
 
+#-------------------------------------------------------------------------------
+class _SlotsStatesRatesCommon(object):
+    """Common part of the fast states and rates classes.
+
+    With settings.FAST_STATES_RATES, instantiating a subclass of
+    StatesTemplate or RatesTemplate returns an instance of a class generated
+    by `_get_slots_class()` from its trait declarations. Variables are stored
+    in `__slots__` and are validated only once at initialization. Published
+    variables are properties that write their value directly into the
+    kiosk, the access to the variable is checked when it is registered.
+    Assignments are not validated and lock() and unlock() do nothing, so
+    this is meant for production runs of model code that was tested with
+    the default classes.
+    """
+    __slots__ = ()
+    __setattr__ = object.__setattr__
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def _init_common(self, kiosk, publish):
+        if not isinstance(kiosk, VariableKiosk):
+            msg = ("Variable Kiosk must be provided when instantiating rate " +
+                   "or state variables.")
+            raise RuntimeError(msg)
+        self._kiosk = kiosk
+        self._locked = False
+        self._valid_vars = set(self._slots_traits)
+
+        publish = check_publish(publish)
+        for attr in self._valid_vars:
+            kiosk.register_variable(id(self), attr, type=self._vartype,
+                                    publish=(attr in publish))
+        if len(publish - self._valid_vars) > 0:
+            msg = ("Unknown variable(s) specified with the publish " +
+                   "keyword: %s") % (publish - self._valid_vars)
+            raise exc.PCSEError(msg)
+
+    def unlock(self):
+        pass
+
+    def lock(self):
+        pass
+
+
+class _SlotsStatesTemplate(_SlotsStatesRatesCommon):
+    """Fast version of the StatesTemplate, see _SlotsStatesRatesCommon."""
+    __slots__ = ()
+
+    def __init__(self, kiosk=None, publish=None, **kwargs):
+
+        self._init_common(kiosk, publish)
+
+        # set and validate initial state value
+        for attr, trait in self._slots_traits.items():
+            if attr in kwargs:
+                setattr(self, attr, trait._validate(self, kwargs.pop(attr)))
+            else:
+                msg = "Initial value for state %s missing." % attr
+                raise exc.PCSEError(msg)
+
+        # Check if kwargs is empty, otherwise issue a warning
+        if len(kwargs) > 0:
+            msg = ("Initial value given for unknown state variable(s): "+
+                   "%s") % kwargs.keys()
+            logging.warn(msg)
+
+    def touch(self):
+        """Updates the value of the published state variables in the
+        variablekiosk."""
+        for name in self._slots_published:
+            dict.__setitem__(self._kiosk, name, getattr(self, name))
+
+
+class _SlotsRatesTemplate(_SlotsStatesRatesCommon):
+    """Fast version of the RatesTemplate, see _SlotsStatesRatesCommon."""
+    __slots__ = ()
+
+    def __init__(self, kiosk=None, publish=None):
+
+        self._init_common(kiosk, publish)
+        self._rate_vars_zero = dict((name, value) for name, _, value
+                                    in self._slots_zero)
+
+        # Set the default values without publishing them, like zerofy()
+        for slot, value in self._slots_defaults:
+            object.__setattr__(self, slot, value)
+        self.zerofy()
+
+    def zerofy(self):
+        """Sets the values of all rate values to zero (Int, Float)
+        or False (Boolean).
+        """
+        for _, slot, value in self._slots_zero:
+            object.__setattr__(self, slot, value)
+
+
+def _published_property(name, slot):
+    """Returns a property for published variable `name` stored in `slot`
+    that also sets the value in the kiosk."""
+
+    def fset(self, value, _setitem=dict.__setitem__):
+        object.__setattr__(self, slot, value)
+        _setitem(self._kiosk, name, value)
+
+    return property(operator.attrgetter(slot), fset)
+
+
+# Fast classes by states/rates class and set of published variables
+_slots_classes = {}
+
+def _get_slots_class(cls, publish):
+    """Returns the fast class for StatesTemplate/RatesTemplate subclass `cls`
+    with the variables in `publish` published.
+
+    The class is generated on first use from the traits declared on `cls` and
+    is a subclass of `cls`, so `isinstance` checks and methods defined on
+    `cls` keep working.
+    """
+    publish = frozenset(check_publish(publish))
+    try:
+        return _slots_classes[(cls, publish)]
+    except KeyError:
+        pass
+
+    valid = lambda s : not (s.startswith("_") or s.startswith("trait"))
+    traits = dict((name, trait) for name, trait in cls.class_traits().items()
+                  if valid(name))
+    classdict = {"_slots_traits": traits,
+                 "_slots_published": tuple(sorted(publish & set(traits)))}
+    slots = ["_kiosk", "_locked", "_valid_vars", "_rate_vars_zero"]
+    for name in sorted(traits):
+        if name in publish:
+            slot = "_value_" + name
+            classdict[name] = _published_property(name, slot)
+        else:
+            slot = name
+        slots.append(slot)
+    classdict["__slots__"] = tuple(slots)
+
+    if issubclass(cls, RatesTemplate):
+        # Default and zero values of rate variables stored by slot
+        zero_value = {Bool:False, Int:0, Float:0.}
+        defaults = []
+        zeros = []
+        for name, trait in sorted(traits.items()):
+            slot = "_value_" + name if name in publish else name
+            defaults.append((slot, trait._validate(None, trait.get_default_value())))
+            if trait.__class__ in zero_value:
+                zeros.append((name, slot, zero_value[trait.__class__]))
+            else:
+                msg = ("Rate variable '%s' not of type Float, Bool or Int. "+
+                       "Its zero value cannot be determined and it will "+
+                       "not be treated by zerofy().") % name
+                logging.warn(msg)
+        classdict["_slots_defaults"] = tuple(defaults)
+        classdict["_slots_zero"] = tuple(zeros)
+        bases = (_SlotsRatesTemplate, cls)
+    else:
+        bases = (_SlotsStatesTemplate, cls)
+
+    slots_class = type(cls.__name__, bases, classdict)
+    _slots_classes[(cls, publish)] = slots_class
+    return slots_class
+
 #-------------------------------------------------------------------------------
 class DispatcherObject(object):
     """Class only defines the _send_signal() and _connect_signal() methods.
@@ -622,26 +941,27 @@ class DispatcherObject(object):
     """
 
     def _send_signal(self, signal, *args, **kwargs):
-        """Send <signal> using the dispatcher module.
+        """Send <signal> using the SignalDispatcher of the VariableKiosk.
         
         The VariableKiosk of this SimulationObject is used as the sender of
         the signal. Additional arguments to the _send_signal() method are 
-        passed to dispatcher.send()
+        passed to the handlers as far as they accept them.
         """
         
-        self.logger.debug("Sent signal: %s" % signal)
-        dispatcher.send(signal=signal, sender=self.kiosk, *args, **kwargs)
+        self.logger.debug("Sent signal: %s", signal)
+        self.kiosk.dispatcher.send(signal, self.kiosk, *args, **kwargs)
     
     def _connect_signal(self, handler, signal):
-        """Connect the handler to the signal using the dispatcher module.
+        """Connect the handler to the signal using the SignalDispatcher of
+        the VariableKiosk.
         
-        The handler will only react on signals that have the SimulationObjects
-        VariableKiosk as sender. This ensure that different ensemble members in
-        a PyWOFOST ensemble will not react to eachother signals.
+        The handler will only react on signals sent by SimulationObjects that
+        share its VariableKiosk. This ensure that different ensemble members
+        in a PyWOFOST ensemble will not react to eachother signals.
         """
         
-        dispatcher.connect(handler, signal, sender=self.kiosk)
-        self.logger.debug("Connected handler '%s' to signal '%s'." % (handler, signal))
+        self.kiosk.dispatcher.connect(handler, signal)
+        self.logger.debug("Connected handler '%s' to signal '%s'.", handler, signal)
 
 #-------------------------------------------------------------------------------
 class SimulationObject(HasTraits, DispatcherObject):
@@ -819,6 +1139,7 @@ class SimulationObject(HasTraits, DispatcherObject):
             while len(self.subSimObjects) > 0:
                 obj = self.subSimObjects.pop()
                 obj._delete()
+        self.kiosk.dispatcher.disconnect(self)
             
     #---------------------------------------------------------------------------
     def _find_SubSimObjects(self):
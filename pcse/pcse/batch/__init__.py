@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Vectorized implementation of WOFOST for simulating many cells at once.
+
+The `BatchEngine` advances a batch of cells (or years for one cell) in
+lockstep. States and rates are held in NumPy arrays with one element per cell
+instead of in a tree of SimulationObjects. Each cell has its own start date,
+crop calendar and parameters, masks keep track of which cells have a crop,
+which crops have emerged and which cells have terminated.
+
+Only the configuration used for GGCMI is implemented: the `Wofost` crop with
+`DVS_Phenology`, the `WaterbalanceFD` or `WaterbalancePP` soil and the
+`AgroManagementSingleCrop` agromanagement, e.g. `GGCMI_WLP.conf` and
+`GGCMI_PP.conf`. Results are identical to `pcse.engine.Engine` apart from
+round-off differences.
+"""
+from .engine import BatchEngine
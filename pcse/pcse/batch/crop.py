@@ -0,0 +1,657 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Array version of the WOFOST crop for the BatchEngine.
+
+`BatchWofost` combines the components of `pcse.crop.wofost.Wofost`
+(partitioning, assimilation, respiration, evapotranspiration and the
+dynamics of leaves, stems, roots and storage organs) in a single object with
+one array element per cell, the phenology is simulated by `BatchPhenology`.
+The methods
+`initialize`, `calc_rates`, `integrate` and `finalize` operate on the cells
+given by the index array `idx`; these are cells that have a crop.
+
+The leaf classes of each cell are stored in a row of a 2D array, in order of
+the day the leaf class was formed. Leaf classes between `_lv_lo` and `_lv_hi`
+are alive, dying leaves are removed from the oldest end.
+"""
+import datetime
+
+import numpy as np
+
+from .. import exceptions as exc
+from ..crop.assimilation import totass
+from ..util import limit_array as limit, BatchAfgen
+from .util import get_parameters, astro
+from .phenology import (BatchPhenology, EMERGING, VEGETATIVE, REPRODUCTIVE,
+                        MATURE)
+
+STAGES = {0:None, EMERGING:"emerging", VEGETATIVE:"vegetative",
+          REPRODUCTIVE:"reproductive", MATURE:"mature"}
+
+#-------------------------------------------------------------------------------
+def sweaf(ET0, DEPNR):
+    """Array version of `pcse.crop.evapotranspiration.SWEAF`."""
+    A = 0.76
+    B = 1.5
+    sweaf = 1./(A+B*ET0) - (5.-DEPNR)*0.10
+    low = DEPNR < 3.
+    sweaf = np.where(low, sweaf + (ET0-0.6)/np.where(low, DEPNR*(DEPNR+3.), 1.),
+                     sweaf)
+    return limit(0.10, 0.95, sweaf)
+
+#-------------------------------------------------------------------------------
+class BatchWofost(object):
+    """Array version of the `Wofost` crop simulation with `DVS_Phenology`.
+
+    See the components of `pcse.crop.wofost.Wofost` for the description of
+    parameters, states and rates.
+
+    :param cropdata: list of dictionaries with crop parameters, one per cell.
+    :param soildata: list of dictionaries with soil parameters, one per cell.
+    :param start_type: list of crop start types: "sowing"|"emergence"
+    :param stop_type: list of crop stop types: "maturity"|"harvest"|"earliest"
+    :param ndays: maximum number of days of crop growth per cell, used to
+        size the arrays for the leaf classes.
+    """
+
+    scalar_parameters = [
+        # conversion factors
+        "CVL", "CVO", "CVR", "CVS",
+        # maintenance respiration
+        "Q10", "RMR", "RML", "RMS", "RMO",
+        # evapotranspiration
+        "CFET", "DEPNR", "IAIRDU", "IOX",
+        # roots, stems, storage organs and leaves
+        "RDI", "RRI", "RDMCR", "TDWI", "SPA", "RGRLAI", "SPAN", "TBASE",
+        "PERDL"]
+    soil_parameters = ["CRAIRC", "SM0", "SMW", "SMFCF", "RDMSOL"]
+    table_parameters = ["FRTB", "FLTB", "FSTB", "FOTB", "AMAXTB",
+                        "EFFTB", "KDIFTB", "TMPFTB", "TMNFTB", "RFSETB",
+                        "RDRRTB", "RDRSTB", "SSATB", "SLATB"]
+    date_variables = BatchPhenology.date_variables + ("DOH", "DOF")
+    variables = BatchPhenology.variables + (
+        # partitioning
+        "FR", "FL", "FS", "FO",
+        # evapotranspiration
+        "EVWMX", "EVSMX", "TRAMX", "TRA", "IDOS", "IDWS", "IDOST", "IDWST",
+        # roots
+        "RD", "RDM", "WRT", "DWRT", "TWRT", "RR", "GRRT", "DRRT", "GWRT",
+        # stems
+        "WST", "DWST", "TWST", "SAI", "GRST", "DRST", "GWST",
+        # storage organs
+        "WSO", "DWSO", "TWSO", "PAI", "GRSO", "DRSO", "GWSO",
+        # leaves
+        "LAIEM", "LASUM", "LAIEXP", "LAIMAX", "LAI", "WLV", "DWLV", "TWLV",
+        "GRLV", "DSLV1", "DSLV2", "DSLV3", "DSLV", "DALV", "DRLV", "SLAT",
+        "FYSAGE", "GLAIEX", "GLASOL",
+        # agrometeorological indicators
+        "GSRAINSUM", "GSTEMPSUM", "GSRADIATIONSUM",
+        # crop level
+        "TAGP", "GASST", "MREST", "CTRAT", "CEVST", "HI", "FINISH_TYPE",
+        "GASS", "PGASS", "MRES", "PMRES", "ASRC", "DMI", "ADMI", "DOH",
+        "DOF")
+
+    def __init__(self, cropdata, soildata, start_type, stop_type, ndays):
+        n = len(cropdata)
+        parvalues = []
+        for crop, soil in zip(cropdata, soildata):
+            d = dict(crop)
+            d.update(soil)
+            parvalues.append(d)
+        p = get_parameters(parvalues, self.scalar_parameters +
+                           self.soil_parameters)
+        for name in self.table_parameters:
+            try:
+                p[name] = BatchAfgen([d[name] for d in parvalues])
+            except KeyError:
+                msg = "Value for parameter %s missing." % name
+                raise exc.ParameterError(msg)
+        self.params = p
+
+        # The phenology arrays are shared with the phenology object
+        self.phenology = BatchPhenology(parvalues, start_type)
+        for name in BatchPhenology.variables:
+            setattr(self, name, getattr(self.phenology, name))
+        self.stop_at_maturity = np.array([t in ("maturity", "earliest")
+                                          for t in stop_type])
+
+        for name in self.variables:
+            if name in BatchPhenology.variables:
+                continue
+            elif name in self.date_variables:
+                setattr(self, name, np.zeros(n, dtype=np.int64))
+            elif name in ("IDOS", "IDWS"):
+                setattr(self, name, np.zeros(n, dtype=bool))
+            elif name in ("IDOST", "IDWST"):
+                setattr(self, name, np.zeros(n, dtype=np.int64))
+            elif name == "FINISH_TYPE":
+                setattr(self, name, np.empty(n, dtype=object))
+            else:
+                setattr(self, name, np.zeros(n))
+        self._DSOS = np.zeros(n, dtype=np.int64)
+        self._IDWST = np.zeros(n, dtype=np.int64)
+        self._IDOST = np.zeros(n, dtype=np.int64)
+        self._for_finalize = {"DOF":np.zeros(n, dtype=np.int64),
+                              "DOH":np.zeros(n, dtype=np.int64),
+                              "FINISH_TYPE":np.empty(n, dtype=object)}
+
+        # Leaf classes
+        self._LV = np.zeros((n, ndays + 1))
+        self._SLA = np.zeros((n, ndays + 1))
+        self._LVAGE = np.zeros((n, ndays + 1))
+        self._lv_lo = np.zeros(n, dtype=np.int64)
+        self._lv_hi = np.zeros(n, dtype=np.int64)
+
+        # Days used for the agrometeorological indicators
+        self._gs_days = np.zeros((ndays, n), dtype=bool)
+
+    #---------------------------------------------------------------------------
+    def get_variable(self, varname, cell):
+        """Returns the value of varname for a single cell, or None when the
+        variable does not exist for the cell."""
+        if varname in BatchPhenology.vernalisation_variables and \
+           self.phenology.params["IDSL"][cell] < 2:
+            return None
+        value = getattr(self, varname)[cell]
+        if varname in self.date_variables:
+            return datetime.date.fromordinal(value) if value > 0 else None
+        if varname == "STAGE":
+            return STAGES[value]
+        if varname == "FINISH_TYPE":
+            return value
+        return value.item()
+
+    #---------------------------------------------------------------------------
+    def initialize(self, idx, days):
+        """Starts the crop on the cells in idx.
+
+        :param days: array with the date ordinal of the crop start per cell.
+        """
+        p = self.params
+
+        # Phenology
+        self.phenology.initialize(idx, days)
+        DVS = self.DVS[idx]
+        self.DOH[idx] = 0
+        self.DOF[idx] = 0
+
+        # Partitioning
+        FR, FL, FS, FO = self._partitioning(idx, DVS)
+
+        # Evapotranspiration
+        for name in ["EVWMX", "EVSMX", "TRAMX", "TRA"]:
+            getattr(self, name)[idx] = 0.
+        self.IDOS[idx] = False
+        self.IDWS[idx] = False
+        self.IDOST[idx] = -999
+        self.IDWST[idx] = -999
+        self._DSOS[idx] = 0
+        self._IDWST[idx] = 0
+        self._IDOST[idx] = 0
+
+        # Roots
+        TDWI = p["TDWI"][idx]
+        RDI = p["RDI"][idx]
+        self.RDM[idx] = np.maximum(RDI, np.minimum(p["RDMCR"][idx],
+                                                   p["RDMSOL"][idx]))
+        self.RD[idx] = RDI
+        WRT = TDWI * FR
+        self.WRT[idx] = WRT
+        self.DWRT[idx] = 0.
+        self.TWRT[idx] = WRT
+
+        # Stems
+        WST = (TDWI * (1-FR)) * FS
+        self.WST[idx] = WST
+        self.DWST[idx] = 0.
+        self.TWST[idx] = WST
+        SAI = WST * p["SSATB"](DVS, idx)
+        self.SAI[idx] = SAI
+
+        # Storage organs
+        WSO = (TDWI * (1-FR)) * FO
+        self.WSO[idx] = WSO
+        self.DWSO[idx] = 0.
+        self.TWSO[idx] = WSO
+        PAI = WSO * p["SPA"][idx]
+        self.PAI[idx] = PAI
+
+        # Leaves, the first leaf class
+        WLV = (TDWI * (1-FR)) * FL
+        SLA = p["SLATB"](DVS, idx)
+        self._LV[idx, 0] = WLV
+        self._SLA[idx, 0] = SLA
+        self._LVAGE[idx, 0] = 0.
+        self._lv_lo[idx] = 0
+        self._lv_hi[idx] = 1
+        LAIEM = WLV * SLA
+        self.LAIEM[idx] = LAIEM
+        self.LASUM[idx] = LAIEM
+        self.LAIEXP[idx] = LAIEM
+        self.LAIMAX[idx] = LAIEM
+        self.LAI[idx] = LAIEM + SAI + PAI
+        self.WLV[idx] = WLV
+        self.DWLV[idx] = 0.
+        self.TWLV[idx] = WLV
+        for name in ["GRLV", "DSLV1", "DSLV2", "DSLV3", "DSLV", "DALV", "DRLV",
+                     "SLAT", "FYSAGE", "GLAIEX", "GLASOL", "RR", "GRRT",
+                     "DRRT", "GWRT", "GRST", "DRST", "GWST", "GRSO", "DRSO",
+                     "GWSO"]:
+            getattr(self, name)[idx] = 0.
+
+        # Agrometeorological indicators
+        self._gs_days[:, idx] = False
+        for name in ["GSRAINSUM", "GSTEMPSUM", "GSRADIATIONSUM"]:
+            getattr(self, name)[idx] = 0.
+
+        # Crop level states and rates
+        TAGP = self.TWLV[idx] + self.TWST[idx] + self.TWSO[idx]
+        self.TAGP[idx] = TAGP
+        for name in ["GASST", "MREST", "CTRAT", "CEVST", "HI", "GASS", "PGASS",
+                     "MRES", "PMRES", "ASRC", "DMI", "ADMI"]:
+            getattr(self, name)[idx] = 0.
+        self.FINISH_TYPE[idx] = None
+        self._for_finalize["DOF"][idx] = 0
+        self._for_finalize["DOH"][idx] = 0
+        self._for_finalize["FINISH_TYPE"][idx] = None
+
+        # Check partitioning of TDWI over plant organs
+        checksum = TDWI - TAGP - self.TWRT[idx]
+        if (np.abs(checksum) > 0.0001).any():
+            msg = "Error in partitioning of initial biomass (TDWI)!"
+            raise exc.PartitioningError(msg)
+
+    #---------------------------------------------------------------------------
+    def _partitioning(self, idx, DVS):
+        """Sets the partitioning factors for the cells in idx and checks
+        their sum."""
+        p = self.params
+        FR = p["FRTB"](DVS, idx)
+        FL = p["FLTB"](DVS, idx)
+        FS = p["FSTB"](DVS, idx)
+        FO = p["FOTB"](DVS, idx)
+        self.FR[idx] = FR
+        self.FL[idx] = FL
+        self.FS[idx] = FS
+        self.FO[idx] = FO
+        checksum = FR+(FL+FS+FO)*(1.-FR) - 1.
+        bad = np.abs(checksum) >= 0.0001
+        if bad.any():
+            i = bad.nonzero()[0][0]
+            msg = ("Error in partitioning!\n")
+            msg += ("Checksum: %f, FR: %5.3f, FL: %5.3f, FS: %5.3f, FO: %5.3f\n" \
+                    % (checksum[i], FR[i], FL[i], FS[i], FO[i]))
+            raise exc.PartitioningError(msg)
+        return FR, FL, FS, FO
+
+    #---------------------------------------------------------------------------
+    def calc_rates(self, idx, drv, SM):
+        """Calculates the crop rates for the cells in idx.
+
+        :param SM: soil moisture of the cells in idx
+
+        Returns the indices of the cells for which the crop has emerged and
+        all rates have been calculated.
+        """
+        p = self.params
+        TEMP = drv.TEMP[idx]
+        DVS = self.DVS[idx]
+
+        # Phenology, the other rates are only calculated after emergence
+        full = self.phenology.calc_rates(idx, TEMP, drv.DOY[idx], drv.LAT[idx])
+        idx = idx[full]
+        if len(idx) == 0:
+            return idx
+        TEMP = TEMP[full]
+        DVS = DVS[full]
+
+        # Potential assimilation
+        LAI = self.LAI[idx]
+        IRRAD = drv.IRRAD[idx]
+        DTEMP = drv.DTEMP[idx]
+        DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT = \
+            astro(drv.DOY[idx], drv.LAT[idx], IRRAD)
+        AMAX = p["AMAXTB"](DVS, idx)
+        AMAX *= p["TMPFTB"](DTEMP, idx)
+        KDIF = p["KDIFTB"](DVS, idx)
+        EFF  = p["EFFTB"](DTEMP, idx)
+        DTGA = totass(DAYL, AMAX, EFF, LAI, KDIF, IRRAD, DIFPP, DSINBE, SINLD,
+                      COSLD)
+        DTGA *= p["TMNFTB"](drv.TMINRA[idx], idx)
+        PGASS = DTGA * 30./44.
+        self.PGASS[idx] = PGASS
+
+        # (evapo)transpiration rates
+        TRA, TRAMX = self._evapotranspiration(idx, drv, SM[full], DVS, LAI,
+                                              KDIF)
+
+        # water stress reduction
+        GASS = PGASS * TRA/TRAMX
+        self.GASS[idx] = GASS
+
+        # Respiration
+        RMRES = (p["RMR"][idx] * self.WRT[idx] + \
+                 p["RML"][idx] * self.WLV[idx] + \
+                 p["RMS"][idx] * self.WST[idx] + \
+                 p["RMO"][idx] * self.WSO[idx])
+        RMRES *= p["RFSETB"](DVS, idx)
+        TEFF = p["Q10"][idx]**((TEMP-25.)/10.)
+        PMRES = RMRES*TEFF
+        MRES = np.minimum(GASS, PMRES)
+        self.PMRES[idx] = PMRES
+        self.MRES[idx] = MRES
+
+        # Net available assimilates
+        ASRC = GASS - MRES
+        self.ASRC[idx] = ASRC
+
+        # DM partitioning factors, conversion factor (CVF),
+        # dry matter increase (DMI) and check on carbon balance
+        FR = self.FR[idx]
+        FL = self.FL[idx]
+        FS = self.FS[idx]
+        FO = self.FO[idx]
+        CVF = 1./((FL/p["CVL"][idx] + FS/p["CVS"][idx] + FO/p["CVO"][idx]) *
+                  (1.-FR) + FR/p["CVR"][idx])
+        DMI = CVF * ASRC
+        self.DMI[idx] = DMI
+        checksum = (GASS - MRES - (FR+(FL+FS+FO)*(1.-FR)) * DMI/CVF) * \
+                    1./(np.maximum(0.0001, GASS))
+        bad = np.abs(checksum) >= 0.0001
+        if bad.any():
+            i = bad.nonzero()[0][0]
+            day = datetime.date.fromordinal(drv.DAY[idx[i]])
+            msg = "Carbon flows not balanced on day %s\n" % day
+            msg += "Checksum: %f, GASS: %f, MRES: %f\n" % \
+                   (checksum[i], GASS[i], MRES[i])
+            msg += "FR,L,S,O: %5.3f,%5.3f,%5.3f,%5.3f, DMI: %f, CVF: %f\n" % \
+                   (FR[i], FL[i], FS[i], FO[i], DMI[i], CVF[i])
+            raise exc.CarbonBalanceError(msg)
+
+        # Below-ground dry matter increase and root dynamics
+        GRRT = FR * DMI
+        DRRT = self.WRT[idx] * p["RDRRTB"](DVS, idx)
+        self.GRRT[idx] = GRRT
+        self.DRRT[idx] = DRRT
+        self.GWRT[idx] = GRRT - DRRT
+        RR = np.minimum((self.RDM[idx] - self.RD[idx]), p["RRI"][idx])
+        self.RR[idx] = np.where(FR == 0., 0., RR)
+
+        # Aboveground dry matter increase and distribution over stems,
+        # leaves, organs
+        ADMI = (1. - FR) * DMI
+        self.ADMI[idx] = ADMI
+        GRST = ADMI * FS
+        DRST = p["RDRSTB"](DVS, idx) * self.WST[idx]
+        self.GRST[idx] = GRST
+        self.DRST[idx] = DRST
+        self.GWST[idx] = GRST - DRST
+        GRSO = ADMI * FO
+        self.GRSO[idx] = GRSO
+        self.DRSO[idx] = 0.0
+        self.GWSO[idx] = GRSO - 0.0
+        self._leaf_rates(idx, TEMP, DVS, ADMI * FL, TRA, TRAMX, KDIF)
+
+        # Days used for the agrometeorological indicators
+        self._gs_days[drv.t, idx] = True
+
+        return idx
+
+    #---------------------------------------------------------------------------
+    def _evapotranspiration(self, idx, drv, SM, DVS, LAI, KDIF):
+        """Calculates the crop transpiration and maximum evaporation rates
+        for an unlayered soil and returns (TRA, TRAMX)."""
+        p = self.params
+        KGLOB = 0.75*KDIF
+        # crop specific correction on potential transpiration rate
+        ET0 = p["CFET"][idx] * drv.ET0[idx]
+        # maximum evaporation and transpiration rates
+        EKL = np.exp(-KGLOB * LAI)
+        self.EVWMX[idx] = drv.E0[idx] * EKL
+        self.EVSMX[idx] = np.maximum(0., drv.ES0[idx] * EKL)
+        TRAMX = np.maximum(0.000001, ET0 * (1.-EKL))
+        self.TRAMX[idx] = TRAMX
+
+        # Critical soil moisture and reduction factor for water stress
+        SWDEP = sweaf(ET0, p["DEPNR"][idx])
+        SMW = p["SMW"][idx]
+        SMCR = (1.-SWDEP)*(p["SMFCF"][idx]-SMW) + SMW
+        RFWS = limit(0., 1., (SM-SMW)/(SMCR-SMW))
+
+        # reduction in transpiration in case of waterlogging (SM > SMAIR)
+        RFOS = np.ones(len(idx))
+        ox = (p["IAIRDU"][idx] == 0) & (p["IOX"][idx] == 1)
+        if ox.any():
+            io = idx[ox]
+            SM0 = p["SM0"][io]
+            SMAIR = SM0 - p["CRAIRC"][io]
+            SMox = SM[ox]
+            DSOS = np.where(SMox >= SMAIR, np.minimum(self._DSOS[io]+1, 4), 0)
+            self._DSOS[io] = DSOS
+            RFOSMX = limit(0., 1., (SM0-SMox)/(SM0-SMAIR))
+            RFOS[ox] = RFOSMX + (1. - DSOS/4.)*(1.-RFOSMX)
+        TRA = TRAMX * RFOS * RFWS
+        self.TRA[idx] = TRA
+
+        # Counting stress days
+        IDWS = RFWS < 1.
+        IDOS = RFOS < 1.
+        self.IDWS[idx] = self.IDWS[idx] | IDWS
+        self.IDOS[idx] = self.IDOS[idx] | IDOS
+        self._IDWST[idx] += IDWS
+        self._IDOST[idx] += IDOS
+        return TRA, TRAMX
+
+    #---------------------------------------------------------------------------
+    def _leaf_window(self, idx):
+        """Returns the columns spanning the leaf classes of the cells in idx
+        and a mask of the living leaf classes in these columns."""
+        lo = self._lv_lo[idx]
+        hi = self._lv_hi[idx]
+        cols = np.arange(lo.min(), hi.max())
+        alive = (cols >= lo[:, np.newaxis]) & (cols < hi[:, np.newaxis])
+        return cols, alive
+
+    def _leaf_rates(self, idx, TEMP, DVS, GRLV, TRA, TRAMX, KDIF):
+        """Calculates the leaf dynamics rates for the cells in idx."""
+        p = self.params
+        WLV = self.WLV[idx]
+        LAI = self.LAI[idx]
+        self.GRLV[idx] = GRLV
+
+        # death due to water stress and self-shading
+        DSLV1 = WLV * (1.-TRA/TRAMX) * p["PERDL"][idx]
+        LAICR = 3.2/KDIF
+        DSLV2 = WLV * limit(0., 0.03, 0.03*(LAI-LAICR)/LAICR)
+        DSLV3 = np.zeros(len(idx))
+        DSLV = np.maximum(np.maximum(DSLV1, DSLV2), DSLV3)
+        self.DSLV1[idx] = DSLV1
+        self.DSLV2[idx] = DSLV2
+        self.DSLV3[idx] = DSLV3
+        self.DSLV[idx] = DSLV
+
+        # leaf death equals maximum of water stress, shading and frost, or
+        # the weight of the leaf classes that exceed their life span
+        cols, alive = self._leaf_window(idx)
+        rows = idx[:, np.newaxis]
+        old = alive & (self._LVAGE[rows, cols] > p["SPAN"][idx][:, np.newaxis])
+        DALV = np.where(old, self._LV[rows, cols], 0.).sum(axis=1)
+        self.DALV[idx] = DALV
+        self.DRLV[idx] = np.maximum(DSLV, DALV)
+
+        # physiologic ageing of leaves per time step
+        TBASE = p["TBASE"][idx]
+        self.FYSAGE[idx] = np.maximum(0., (TEMP - TBASE)/(35. - TBASE))
+
+        # specific leaf area of leaves per time step
+        SLAT = p["SLATB"](DVS, idx)
+
+        # leaf area not to exceed exponential growth curve
+        LAIEXP = self.LAIEXP[idx]
+        exp_growth = LAIEXP < 6.
+        if exp_growth.any():
+            ie = idx[exp_growth]
+            DTEFF = np.maximum(0., TEMP[exp_growth] - TBASE[exp_growth])
+            GLAIEX = LAIEXP[exp_growth] * p["RGRLAI"][ie] * DTEFF
+            grlv = GRLV[exp_growth]
+            slat = SLAT[exp_growth]
+            # source-limited increase in leaf area
+            GLASOL = grlv * slat
+            # sink-limited increase in leaf area
+            GLA = np.minimum(GLAIEX, GLASOL)
+            # adjustment of specific leaf area of youngest leaf class
+            SLAT[exp_growth] = np.where(grlv > 0.,
+                                        GLA/np.where(grlv > 0., grlv, 1.), slat)
+            self.GLAIEX[ie] = GLAIEX
+            self.GLASOL[ie] = GLASOL
+        self.SLAT[idx] = SLAT
+
+    #---------------------------------------------------------------------------
+    def integrate(self, idx, days, EVS):
+        """Integrates the crop states for the cells in idx.
+
+        :param days: array with the date ordinal of the current day per cell
+        :param EVS: soil evaporation rate of the cells in idx
+
+        Returns the indices of the cells where the crop reached maturity and
+        should be finished.
+        """
+        p = self.params
+
+        # Phenology, the other states are only integrated after emergence
+        growing, maturity = self.phenology.integrate(idx, days)
+        finished = idx[maturity & self.stop_at_maturity[idx]]
+        idx = idx[growing]
+        if len(idx) == 0:
+            return finished
+        DVS = self.DVS[idx]
+
+        # Partitioning
+        self._partitioning(idx, DVS)
+
+        # Roots
+        self.WRT[idx] += self.GWRT[idx]
+        self.DWRT[idx] += self.DRRT[idx]
+        self.TWRT[idx] = self.WRT[idx] + self.DWRT[idx]
+        self.RD[idx] += self.RR[idx]
+
+        # Storage organs
+        WSO = self.WSO[idx] + self.GWSO[idx]
+        self.WSO[idx] = WSO
+        self.DWSO[idx] += self.DRSO[idx]
+        self.TWSO[idx] = WSO + self.DWSO[idx]
+        self.PAI[idx] = WSO * p["SPA"][idx]
+
+        # Stems
+        WST = self.WST[idx] + self.GWST[idx]
+        self.WST[idx] = WST
+        self.DWST[idx] += self.DRST[idx]
+        self.TWST[idx] = WST + self.DWST[idx]
+        self.SAI[idx] = WST * p["SSATB"](DVS, idx)
+
+        # Leaves
+        self._leaf_integrate(idx)
+
+        # Integrate total (living+dead) above-ground biomass of the crop
+        self.TAGP[idx] = self.TWLV[idx] + self.TWST[idx] + self.TWSO[idx]
+
+        # total gross assimilation and maintenance respiration
+        self.GASST[idx] += self.GASS[idx]
+        self.MREST[idx] += self.MRES[idx]
+
+        # total crop transpiration and soil evaporation during crop cycle
+        self.CTRAT[idx] += self.TRA[idx]
+        self.CEVST[idx] += EVS[growing]
+
+        return finished
+
+    #---------------------------------------------------------------------------
+    def _leaf_integrate(self, idx):
+        """Integrates the leaf dynamics for the cells in idx."""
+        cols, alive = self._leaf_window(idx)
+        rows = idx[:, np.newaxis]
+        LV = np.where(alive, self._LV[rows, cols], 0.)
+        DRLV = self.DRLV[idx]
+
+        # Remove weight of dead leaves from the oldest leaf classes, a leaf
+        # class is removed completely as long as the remaining death rate
+        # exceeds its weight.
+        LVSUM = np.cumsum(LV, axis=1)
+        D = DRLV[:, np.newaxis]
+        dead = alive & ((LVSUM - LV) < D) & (LVSUM <= D)
+        lo = self._lv_lo[idx] + dead.sum(axis=1)
+        hi = self._lv_hi[idx]
+        rest = DRLV - np.where(dead, LV, 0.).sum(axis=1)
+        partial = (rest > 0.) & (lo < hi)
+        r = np.arange(len(idx))[partial]
+        LV[r, lo[partial] - cols[0]] -= rest[partial]
+        alive &= ~dead
+
+        # Ageing of the remaining leaf classes
+        LVAGE = self._LVAGE[rows, cols]
+        LVAGE = np.where(alive, LVAGE + self.FYSAGE[idx][:, np.newaxis], LVAGE)
+        self._LV[rows, cols] = LV
+        self._LVAGE[rows, cols] = LVAGE
+
+        # New leaf class
+        GRLV = self.GRLV[idx]
+        SLAT = self.SLAT[idx]
+        self._LV[idx, hi] = GRLV
+        self._SLA[idx, hi] = SLAT
+        self._LVAGE[idx, hi] = 0.
+        self._lv_lo[idx] = lo
+        self._lv_hi[idx] = hi + 1
+
+        # Calculate new leaf area
+        SLA = self._SLA[rows, cols]
+        LASUM = np.where(alive, LV*SLA, 0.).sum(axis=1) + GRLV*SLAT
+        LAI = LASUM + self.SAI[idx] + self.PAI[idx]
+        self.LASUM[idx] = LASUM
+        self.LAI[idx] = LAI
+        self.LAIMAX[idx] = np.maximum(LAI, self.LAIMAX[idx])
+
+        # exponential growth curve
+        self.LAIEXP[idx] += self.GLAIEX[idx]
+
+        # Update leaf biomass states
+        WLV = np.where(alive, LV, 0.).sum(axis=1) + GRLV
+        DWLV = self.DWLV[idx] + DRLV
+        self.WLV[idx] = WLV
+        self.DWLV[idx] = DWLV
+        self.TWLV[idx] = WLV + DWLV
+
+    #---------------------------------------------------------------------------
+    def on_crop_finish(self, idx, days, finish_type):
+        """Registers the day of finish (DOF), the reason for finishing the
+        crop and the day of harvest (DOH) to be set by `finalize`."""
+        self._for_finalize["DOF"][idx] = days
+        self._for_finalize["FINISH_TYPE"][idx] = finish_type
+        if finish_type == "harvest":
+            self._for_finalize["DOH"][idx] = days
+
+    #---------------------------------------------------------------------------
+    def finalize(self, idx, weather):
+        """Finalizes the crop simulation for the cells in idx.
+
+        :param weather: dictionary with the 2D weather arrays (day, cell) of
+            the BatchEngine, used for the agrometeorological indicators.
+        """
+        # Harvest Index
+        TAGP = self.TAGP[idx]
+        self.HI[idx] = np.where(TAGP > 0, self.TWSO[idx] /
+                                np.where(TAGP > 0, TAGP, 1.), -1.)
+
+        for name in ["DOF", "FINISH_TYPE"]:
+            getattr(self, name)[idx] = self._for_finalize[name][idx]
+        doh = idx[self._for_finalize["DOH"][idx] > 0]
+        self.DOH[doh] = self._for_finalize["DOH"][doh]
+
+        self.IDWST[idx] = self._IDWST[idx]
+        self.IDOST[idx] = self._IDOST[idx]
+
+        for c in idx:
+            days = self._gs_days[:, c]
+            self.GSRAINSUM[c] = np.sum(weather["RAIN"][days, c])
+            self.GSRADIATIONSUM[c] = np.sum(weather["IRRAD"][days, c])
+            self.GSTEMPSUM[c] = np.sum(weather["TEMP"][days, c])
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+import datetime
+import logging
+
+import numpy as np
+
+from .. import exceptions as exc
+from ..util import ConfigurationLoader, is_a_dekad, is_a_month
+from ..soil.classic_waterbalance import WaterbalanceFD, WaterbalancePP
+from ..crop.wofost import Wofost
+from ..agromanagement import AgroManagementSingleCrop
+from .crop import BatchWofost
+from .soil import BatchWaterbalanceFD, BatchWaterbalancePP
+
+# Scalar components that have an array version in the BatchEngine
+SOIL_COMPONENTS = {WaterbalanceFD: BatchWaterbalanceFD,
+                   WaterbalancePP: BatchWaterbalancePP}
+
+# Weather variables retrieved from the weatherdataprovider
+WEATHER_VARIABLES = ["IRRAD", "TMIN", "TMAX", "RAIN", "E0", "ES0", "ET0", "LAT"]
+
+#-------------------------------------------------------------------------------
+class _DrivingVariables(object):
+    """Driving variables of all cells for a single time step.
+
+    Attributes have the same names as in the WeatherDataContainer and are
+    arrays with one element per cell. `t` is the time step and `DAY` the
+    date ordinal of each cell.
+    """
+    def __init__(self, t, days, weather):
+        self.t = t
+        self.DAY = days
+        for name, values in weather.items():
+            setattr(self, name, values[t])
+
+#-------------------------------------------------------------------------------
+class BatchEngine(object):
+    """Simulation engine for running WOFOST on a batch of cells at once.
+
+    The BatchEngine gives the same results as running `pcse.engine.Engine`
+    for each cell, but the cells are simulated in lockstep on NumPy arrays.
+    Time step `t` corresponds to day `START_DATE + t` for each cell, so cells
+    may have different start dates and crop calendars.
+
+    :param sitedata: list of dictionaries with site parameters, one for each
+        cell.
+    :param timerdata: list of dictionaries with timer parameters, see
+        `pcse.engine.Engine`.
+    :param soildata: list of dictionaries with soil parameters.
+    :param cropdata: list of dictionaries with crop parameters.
+    :param weatherdataprovider: list of WeatherDataProviders.
+    :param config: A string describing the model configuration file to use,
+        see `pcse.engine.Engine`. Only the configurations that combine
+        `Wofost`, `WaterbalanceFD` or `WaterbalancePP` and
+        `AgroManagementSingleCrop` are supported.
+
+    Instead of a list, a single dictionary or weatherdataprovider can be given
+    which is then used for all cells. Output is returned as a list with for
+    each cell the output that `Engine` would return::
+
+        >>> engine = BatchEngine(sitedata, timerdata, soildata, cropdata, wdps,
+        ...                      config="GGCMI_WLP.conf")
+        >>> engine.run_till_terminate()
+        >>> output = engine.get_output()
+        >>> summary = engine.get_summary_output()
+    """
+
+    def __init__(self, sitedata, timerdata, soildata, cropdata,
+                 weatherdataprovider, config=None):
+        loggername = "%s.%s" % (self.__class__.__module__,
+                                self.__class__.__name__)
+        self.logger = logging.getLogger(loggername)
+
+        inputs = [sitedata, timerdata, soildata, cropdata, weatherdataprovider]
+        n = max([len(x) if isinstance(x, list) else 1 for x in inputs])
+        for x in inputs:
+            if isinstance(x, list) and len(x) != n:
+                msg = "Inputs for the BatchEngine should have equal length."
+                raise exc.PCSEError(msg)
+        (sitedata, timerdata, soildata, cropdata, weatherdataprovider) = \
+            [x if isinstance(x, list) else [x]*n for x in inputs]
+        self.ncells = n
+
+        # Load the model configuration and check if it is supported
+        self.mconf = ConfigurationLoader(config)
+        if self.mconf.CROP is not Wofost or \
+           self.mconf.AGROMANAGEMENT is not AgroManagementSingleCrop or \
+           self.mconf.SOIL not in SOIL_COMPONENTS:
+            msg = ("Configuration '%s' is not supported by the BatchEngine." %
+                   config)
+            raise exc.PCSEError(msg)
+
+        # Timer and agromanagement
+        self.start = np.array([t["START_DATE"].toordinal() for t in timerdata])
+        self.end = np.array([t["END_DATE"].toordinal() for t in timerdata])
+        self.crop_start = np.array([t["CROP_START_DATE"].toordinal()
+                                    for t in timerdata])
+        self.crop_end = np.array([t["CROP_END_DATE"].toordinal()
+                                  if t["CROP_END_DATE"] is not None else 0
+                                  for t in timerdata])
+        self.harvest = np.array([t["CROP_END_TYPE"] in ("harvest", "earliest")
+                                 for t in timerdata])
+        self.max_duration = np.array([t["MAX_DURATION"] for t in timerdata])
+        if (self.start > self.crop_start).any():
+            msg = ("CROP_START_DATE before simulation start day: " +
+                   "crop simulation will never start.")
+            raise exc.PCSEError(msg)
+        if (self.harvest & (self.crop_end <= self.crop_start)).any():
+            msg = ("CROP_END_DATE <= CROP_START_DATE: " +
+                   "crop simulation will never finish!")
+            raise exc.PCSEError(msg)
+        self.ndays = int((self.end - self.start).max()) + 1
+
+        self._get_weather(weatherdataprovider)
+
+        # Components for soil and crop simulation
+        self.soil = SOIL_COMPONENTS[self.mconf.SOIL](cropdata, soildata,
+                                                     sitedata)
+        self.crop = BatchWofost(cropdata, soildata,
+                                [t["CROP_START_TYPE"] for t in timerdata],
+                                [t["CROP_END_TYPE"] for t in timerdata],
+                                self.ndays)
+        for var in self.mconf.OUTPUT_VARS + self.mconf.SUMMARY_OUTPUT_VARS:
+            if var not in self.crop.variables and \
+               var not in self.soil.variables:
+                msg = "Variable '%s' is not available in the BatchEngine." % var
+                raise exc.PCSEError(msg)
+
+        # Flags and counters for each cell
+        self.t = 0
+        self.crop_present = np.zeros(n, dtype=bool)
+        self.in_crop_cycle = np.zeros(n, dtype=bool)
+        self.duration = np.zeros(n, dtype=np.int64)
+        self.flag_output = np.zeros(n, dtype=bool)
+        self.flag_crop_finish = np.zeros(n, dtype=bool)
+        self.flag_terminate = np.zeros(n, dtype=bool)
+
+        # Placeholder for variables to be saved during a model run
+        self._saved_output = [list() for i in range(n)]
+        self._saved_summary_output = [list() for i in range(n)]
+
+        # Initial time step
+        idx = np.arange(n)
+        self._timer(idx)
+        self._agromanagement(idx)
+        self.calc_rates(idx)
+
+    #---------------------------------------------------------------------------
+    def _get_weather(self, weatherdataprovider):
+        """Retrieves the weather for all time steps and cells in arrays of
+        shape (ndays, ncells) and derives TEMP, DTEMP and TMINRA as
+        `Engine._get_driving_variables` does.
+        """
+        shape = (self.ndays, self.ncells)
+        w = dict([(name, np.zeros(shape)) for name in
+                  WEATHER_VARIABLES + ["TEMP", "DTEMP", "TMINRA"]])
+        self._weather_missing = np.zeros(shape, dtype=bool)
+        for c, wdp in enumerate(weatherdataprovider):
+            ndays = self.end[c] - self.start[c] + 1
+            TMNSAV = []
+            for t in range(ndays):
+                day = datetime.date.fromordinal(self.start[c] + t)
+                try:
+                    drv = wdp(day)
+                except exc.WeatherDataProviderError:
+                    self._weather_missing[t:, c] = True
+                    break
+                for name in WEATHER_VARIABLES:
+                    w[name][t, c] = getattr(drv, name)
+                TEMP = drv.TEMP if hasattr(drv, "TEMP") \
+                       else (drv.TMIN + drv.TMAX)/2.
+                w["TEMP"][t, c] = TEMP
+                w["DTEMP"][t, c] = drv.DTEMP if hasattr(drv, "DTEMP") \
+                                   else (TEMP + drv.TMAX)/2.
+                # 7 day running average of minimum temperature
+                TMNSAV.insert(0, drv.TMIN)
+                TMNSAV = TMNSAV[:7]
+                w["TMINRA"][t, c] = drv.TMINRA if hasattr(drv, "TMINRA") \
+                                    else sum(TMNSAV)/len(TMNSAV)
+        w["DOY"] = np.zeros(shape)
+        for t in range(self.ndays):
+            w["DOY"][t] = [datetime.date.fromordinal(s + t).timetuple().tm_yday
+                           for s in self.start]
+        self.weather = w
+
+    def _get_driving_variables(self, idx):
+        missing = self._weather_missing[self.t, idx]
+        if missing.any():
+            c = idx[missing][0]
+            day = datetime.date.fromordinal(self.start[c] + self.t)
+            msg = "No weather data for cell %i on day %s" % (c, day)
+            raise exc.WeatherDataProviderError(msg)
+        return _DrivingVariables(self.t, self.start + self.t, self.weather)
+
+    #---------------------------------------------------------------------------
+    def _timer(self, idx):
+        """Sets the output and terminate flags for the cells in idx."""
+        days = self.start[idx] + self.t
+        mconf = self.mconf
+        interval = mconf.OUTPUT_INTERVAL.lower()
+        if not mconf.OUTPUT_VARS:
+            output = np.zeros(len(idx), dtype=bool)
+        elif interval == "daily":
+            output = np.repeat(self.t % mconf.OUTPUT_INTERVAL_DAYS == 0,
+                               len(idx))
+        elif interval == "weekly":
+            output = (days + 6) % 7 == mconf.OUTPUT_WEEKDAY
+        elif interval == "dekadal":
+            output = np.array([is_a_dekad(datetime.date.fromordinal(d))
+                               for d in days], dtype=bool)
+        else:
+            output = np.array([is_a_month(datetime.date.fromordinal(d))
+                               for d in days], dtype=bool)
+        if mconf.OUTPUT_ONLY_IN_CROP_CYCLE:
+            output &= self.in_crop_cycle[idx]
+        self.flag_output[idx] = output
+        self.flag_terminate[idx[days >= self.end[idx]]] = True
+
+    #---------------------------------------------------------------------------
+    def _agromanagement(self, idx):
+        """Starts and finishes the crop for the cells in idx as
+        `AgroManagementSingleCrop` does."""
+        days = self.start[idx] + self.t
+        self.duration[idx] += 1
+
+        start = idx[days == self.crop_start[idx]]
+        if len(start) > 0:
+            if self.in_crop_cycle[start].any():
+                msg = ("Crop sowing/emergence date reached while existing " +
+                       "crop still active!")
+                raise exc.PCSEError(msg)
+            self.crop.initialize(start, self.crop_start[start])
+            self.crop_present[start] = True
+            self.duration[start] = 0
+            self.in_crop_cycle[start] = True
+
+        harvest = self.harvest[idx] & (days >= self.crop_end[idx])
+        max_duration = self.in_crop_cycle[idx] & \
+                       (self.duration[idx] >= self.max_duration[idx])
+        self._finish_crop(idx[harvest], days[harvest], "harvest")
+        self._finish_crop(idx[max_duration], days[max_duration],
+                          "max_duration")
+
+    def _finish_crop(self, idx, days, finish_type):
+        """Handles the finish of the crop cycle for the cells in idx, a
+        finished crop cycle terminates the simulation of the cell."""
+        if len(idx) == 0:
+            return
+        self.crop.on_crop_finish(idx, days, finish_type)
+        self.in_crop_cycle[idx] = False
+        self.flag_crop_finish[idx] = True
+        self.flag_terminate[idx] = True
+
+    #---------------------------------------------------------------------------
+    def calc_rates(self, idx):
+        drv = self._get_driving_variables(idx)
+
+        # Rates of the crop, TRA, EVWMX and EVSMX only exist for cells where
+        # the crop has emerged.
+        TRA = np.zeros(len(idx)) + np.nan
+        EVWMX = TRA.copy()
+        EVSMX = TRA.copy()
+        cropped = idx[self.crop_present[idx]]
+        if len(cropped) > 0:
+            full = self.crop.calc_rates(cropped, drv, self.soil.SM[cropped])
+            i = np.searchsorted(idx, full)
+            TRA[i] = self.crop.TRA[full]
+            EVWMX[i] = self.crop.EVWMX[full]
+            EVSMX[i] = self.crop.EVSMX[full]
+
+        self.soil.calc_rates(idx, drv, self.in_crop_cycle[idx],
+                             self._get_rooting_depth(idx), TRA, EVWMX, EVSMX)
+
+        # Save state variables of the model
+        output = idx[self.flag_output[idx]]
+        for c in output:
+            self._save_output(c)
+        self.flag_output[output] = False
+
+        # Finish the crop simulation
+        finish = idx[self.flag_crop_finish[idx]]
+        if len(finish) > 0:
+            self.flag_crop_finish[finish] = False
+            self.crop.finalize(finish, self.weather)
+            for c in finish:
+                self._save_summary_output(c)
+
+    #---------------------------------------------------------------------------
+    def integrate(self, idx):
+        days = self.start[idx] + self.t
+
+        cropped = self.crop_present[idx]
+        if cropped.any():
+            finished = self.crop.integrate(idx[cropped], days[cropped],
+                                           self.soil.EVS[idx[cropped]])
+            i = np.searchsorted(idx, finished)
+            self._finish_crop(finished, days[i], "maturity")
+
+        self.soil.integrate(idx, self.in_crop_cycle[idx],
+                            self._get_rooting_depth(idx))
+
+    def _get_rooting_depth(self, idx):
+        return np.where(self.crop_present[idx], self.crop.RD[idx], np.nan)
+
+    #---------------------------------------------------------------------------
+    def _step(self):
+        """Advances all cells that have not terminated with one day."""
+        idx = (~self.flag_terminate).nonzero()[0]
+        self.t += 1
+        self._timer(idx)
+        self.integrate(idx)
+        self._agromanagement(idx)
+        self.calc_rates(idx)
+
+        terminated = idx[self.flag_terminate[idx]]
+        if len(terminated) > 0:
+            self.soil.finalize(terminated, self.start[terminated] + self.t)
+
+    def run(self, days=1):
+        """Advances the system state with given number of days"""
+        days_done = 0
+        while (days_done < days) and not self.flag_terminate.all():
+            days_done += 1
+            self._step()
+
+    def run_till_terminate(self):
+        """Runs the system until all cells have terminated."""
+        while not self.flag_terminate.all():
+            self._step()
+
+    #---------------------------------------------------------------------------
+    def get_variable(self, varname, cell):
+        """Returns the value of the specified variable for a cell or None
+        if the variable does not exist (yet).
+        """
+        if varname in self.soil.variables:
+            return getattr(self.soil, varname)[cell].item()
+        if varname in self.crop.variables and self.crop_present[cell]:
+            return self.crop.get_variable(varname, cell)
+        return None
+
+    def _save_output(self, cell):
+        day = datetime.date.fromordinal(self.start[cell] + self.t)
+        states = {"day":day}
+        for var in self.mconf.OUTPUT_VARS:
+            states[var] = self.get_variable(var, cell)
+        self._saved_output[cell].append(states)
+
+    def _save_summary_output(self, cell):
+        states = {}
+        for var in self.mconf.SUMMARY_OUTPUT_VARS:
+            states[var] = self.get_variable(var, cell)
+        self._saved_summary_output[cell].append(states)
+
+    def get_output(self):
+        """Returns a list with the output of each cell."""
+        return self._saved_output
+
+    def get_summary_output(self):
+        """Returns a list with the summary output of each cell."""
+        return self._saved_summary_output
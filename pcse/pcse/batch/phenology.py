@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Array version of `DVS_Phenology` for a batch of cells.
+
+`BatchPhenology` simulates the phenology including vernalisation for the
+BatchEngine (see `BatchWofost`) and for calculating temperature sums.
+`calc_tsums` gives the same results as running the `Engine` with
+`Wofost71_PhenoOnly.conf` for every series (a cell and a year), but all
+series are simulated at once on arrays with the daily temperatures.
+"""
+import datetime
+
+import numpy as np
+
+from .. import exceptions as exc
+from ..util import limit_array as limit, BatchAfgen
+from .util import get_parameters, daylength
+
+# Phenological stages
+EMERGING = 1
+VEGETATIVE = 2
+REPRODUCTIVE = 3
+MATURE = 4
+
+#-------------------------------------------------------------------------------
+class BatchPhenology(object):
+    """Array version of `DVS_Phenology` including `Vernalisation`.
+
+    See `pcse.crop.phenology` for the description of parameters, states and
+    rates.
+
+    :param parvalues: list of dictionaries with crop parameters, one per cell.
+    :param start_type: list of crop start types: "sowing"|"emergence"
+
+    The states and rates are arrays over all cells which are updated in
+    place, the methods act on the cells given by the index array `idx`. The
+    dates of the phenological events are stored as day numbers larger than
+    0 given by the caller, 0 denotes that an event did not occur.
+    """
+
+    parameters = ["TSUMEM", "TBASEM", "TEFFMX", "TSUM1", "TSUM2", "IDSL", "DLO",
+                  "DLC", "DVSI", "DVSEND"]
+    vernalisation_parameters = ["VERNSAT", "VERNBASE", "VERNDVS"]
+
+    vernalisation_variables = ("VERN", "DOV", "ISVERNALISED", "VERNR",
+                               "VERNFAC")
+    date_variables = ("DOS", "DOE", "DOA", "DOM", "DOV")
+    variables = ("DVS", "TSUM", "TSUME", "STAGE", "DTSUME", "DTSUM", "DVR",
+                 "VERN", "ISVERNALISED", "VERNR", "VERNFAC") + date_variables
+
+    def __init__(self, parvalues, start_type):
+        n = len(parvalues)
+        p = get_parameters(parvalues, self.parameters)
+        try:
+            p["DTSMTB"] = BatchAfgen([d["DTSMTB"] for d in parvalues])
+        except KeyError:
+            raise exc.ParameterError("Value for parameter DTSMTB missing.")
+
+        # Vernalisation is only simulated for IDSL >= 2, other cells get
+        # dummy values
+        vern = p["IDSL"] >= 2
+        dummy = {"VERNSAT":0., "VERNBASE":0., "VERNDVS":0.,
+                 "VERNRTB":[0., 0., 1., 0.]}
+        vernvalues = [d if v else dummy for d, v in zip(parvalues, vern)]
+        p.update(get_parameters(vernvalues, self.vernalisation_parameters))
+        try:
+            p["VERNRTB"] = BatchAfgen([d["VERNRTB"] for d in vernvalues])
+        except KeyError:
+            raise exc.ParameterError("Value for parameter VERNRTB missing.")
+        self.params = p
+
+        for t in start_type:
+            if t not in ("sowing", "emergence"):
+                msg = "Unknown start type: %s" % t
+                raise exc.PCSEError(msg)
+        self.sowing = np.array([t == "sowing" for t in start_type])
+
+        for name in self.variables:
+            if name in self.date_variables or name == "STAGE":
+                setattr(self, name, np.zeros(n, dtype=np.int64))
+            elif name == "ISVERNALISED":
+                setattr(self, name, np.zeros(n, dtype=bool))
+            else:
+                setattr(self, name, np.zeros(n))
+        self._force_vernalisation = np.zeros(n, dtype=bool)
+
+    #---------------------------------------------------------------------------
+    def initialize(self, idx, days):
+        """Starts the phenology on the cells in idx.
+
+        :param days: array with the day number of the crop start per cell.
+        """
+        self.DVS[idx] = self.params["DVSI"][idx]
+        sowing = self.sowing[idx]
+        self.STAGE[idx] = np.where(sowing, EMERGING, VEGETATIVE)
+        self.DOS[idx] = np.where(sowing, days, 0)
+        self.DOE[idx] = np.where(sowing, 0, days)
+        for name in ["DOA", "DOM", "DOV"]:
+            getattr(self, name)[idx] = 0
+        for name in ["TSUM", "TSUME", "VERN", "DTSUME", "DTSUM", "DVR", "VERNR",
+                     "VERNFAC"]:
+            getattr(self, name)[idx] = 0.
+        self.ISVERNALISED[idx] = False
+        self._force_vernalisation[idx] = False
+
+    #---------------------------------------------------------------------------
+    def calc_rates(self, idx, TEMP, DOY=None, LAT=None):
+        """Calculates the phenology rates for the cells in idx.
+
+        :param TEMP: daily mean temperature of the cells in idx
+        :param DOY: day of year of the cells in idx, only needed for day
+            length sensitive crops (IDSL >= 1).
+        :param LAT: latitude of the cells in idx, only needed for day length
+            sensitive crops.
+
+        Returns a boolean array over idx which is True for the cells where
+        the crop has emerged, the development rate is calculated for these.
+        """
+        p = self.params
+        DVS = self.DVS[idx]
+
+        # Day length sensitivity and vernalisation
+        IDSL = p["IDSL"][idx]
+        DVRED = np.ones(len(idx))
+        dl = IDSL >= 1
+        if dl.any():
+            DAYLP = daylength(DOY[dl], LAT[dl])
+            DLC = p["DLC"][idx][dl]
+            DVRED[dl] = limit(0., 1., (DAYLP - DLC)/(p["DLO"][idx][dl] - DLC))
+        VERNFAC = np.ones(len(idx))
+        vn = IDSL >= 2
+        if vn.any():
+            VERNFAC[vn] = self._vernalisation_rates(idx[vn], TEMP[vn], DVS[vn])
+
+        STAGE = self.STAGE[idx]
+        emerging = STAGE == EMERGING
+        if emerging.any():
+            TBASEM = p["TBASEM"][idx][emerging]
+            self.DTSUME[idx[emerging]] = limit(0.,
+                (p["TEFFMX"][idx][emerging] - TBASEM),
+                (TEMP[emerging] - TBASEM))
+        full = ~emerging
+        idx = idx[full]
+        if len(idx) == 0:
+            return full
+        DTSUM = p["DTSMTB"](TEMP[full], idx)
+        vegetative = STAGE[full] == VEGETATIVE
+        DTSUM = np.where(vegetative, DTSUM * VERNFAC[full] * DVRED[full], DTSUM)
+        self.DTSUM[idx] = DTSUM
+        self.DVR[idx] = DTSUM/np.where(vegetative, p["TSUM1"][idx],
+                                       p["TSUM2"][idx])
+        return full
+
+    #---------------------------------------------------------------------------
+    def _vernalisation_rates(self, idx, TEMP, DVS):
+        """Calculates the vernalisation rates and returns the reduction
+        factor on development (VERNFAC)."""
+        p = self.params
+        VERNR = np.zeros(len(idx))
+        VERNFAC = np.ones(len(idx))
+        active = ~self.ISVERNALISED[idx] & (DVS < p["VERNDVS"][idx])
+        if active.any():
+            ia = idx[active]
+            VERNR[active] = p["VERNRTB"](TEMP[active], ia)
+            VERNBASE = p["VERNBASE"][ia]
+            r = (self.VERN[ia] - VERNBASE)/(p["VERNSAT"][ia] - VERNBASE)
+            VERNFAC[active] = limit(0., 1., r)
+        force = ~self.ISVERNALISED[idx] & ~active
+        self._force_vernalisation[idx[force]] = True
+        self.VERNR[idx] = VERNR
+        self.VERNFAC[idx] = VERNFAC
+        return VERNFAC
+
+    #---------------------------------------------------------------------------
+    def integrate(self, idx, days):
+        """Integrates the phenology states for the cells in idx.
+
+        :param days: array with the day number of the current day per cell
+
+        Returns two boolean arrays over idx: the cells where the crop had
+        emerged before this day, for which the development stage was
+        integrated, and the cells where the crop reached maturity.
+        """
+        p = self.params
+        STAGE = self.STAGE[idx]
+
+        # Vernalisation
+        vn = p["IDSL"][idx] >= 2
+        if vn.any():
+            self._vernalisation_integrate(idx[vn], days[vn])
+
+        # Emergence
+        emerging = STAGE == EMERGING
+        if emerging.any():
+            ie = idx[emerging]
+            TSUME = self.TSUME[ie] + self.DTSUME[ie]
+            self.TSUME[ie] = TSUME
+            emerged = TSUME >= p["TSUMEM"][ie]
+            self.STAGE[ie[emerged]] = VEGETATIVE
+            self.DOE[ie[emerged]] = days[emerging][emerged]
+        growing = ~emerging
+        maturity = np.zeros(len(idx), dtype=bool)
+        idx = idx[growing]
+        if len(idx) == 0:
+            return growing, maturity
+
+        # Development stage
+        days = days[growing]
+        STAGE = STAGE[growing]
+        DVS = self.DVS[idx] + self.DVR[idx]
+        self.TSUM[idx] += self.DTSUM[idx]
+        anthesis = (STAGE == VEGETATIVE) & (DVS >= 1.0)
+        DVS[anthesis] = 1.0
+        self.STAGE[idx[anthesis]] = REPRODUCTIVE
+        self.DOA[idx[anthesis]] = days[anthesis]
+        mature = (STAGE == REPRODUCTIVE) & (DVS >= p["DVSEND"][idx])
+        self.STAGE[idx[mature]] = MATURE
+        self.DOM[idx[mature]] = days[mature]
+        self.DVS[idx] = DVS
+        maturity[growing] = mature
+        return growing, maturity
+
+    #---------------------------------------------------------------------------
+    def _vernalisation_integrate(self, idx, days):
+        p = self.params
+        VERN = self.VERN[idx] + self.VERNR[idx]
+        self.VERN[idx] = VERN
+        reached = VERN >= p["VERNSAT"][idx]
+        first = reached & (self.DOV[idx] == 0)
+        self.DOV[idx[first]] = days[first]
+        self.ISVERNALISED[idx] = reached | self._force_vernalisation[idx]
+
+#-------------------------------------------------------------------------------
+def calc_tsums(cropdata, TEMP, crop_start, crop_end=None, start_type="sowing",
+               end_type="earliest", max_duration=365, end=None, LAT=None,
+               DOY=None):
+    """Simulates the phenological development for a batch of series.
+
+    :param cropdata: dictionary with crop parameters, or a list with one
+        dictionary for each series.
+    :param TEMP: array (days, series) with the daily mean temperature. Row 0
+        is the START_DATE of each series, the number of rows sets the
+        number of days that is simulated.
+    :param crop_start: array with the row of CROP_START_DATE of each series.
+    :param crop_end: array with the row of CROP_END_DATE of each series, only
+        used when end_type is "harvest" or "earliest".
+    :param start_type: crop start type: "sowing"|"emergence"
+    :param end_type: crop end type: "maturity"|"harvest"|"earliest"
+    :param max_duration: maximum duration of the crop cycle in days
+    :param end: array with the row of END_DATE of each series, a series is
+        not simulated beyond this row. Defaults to the last row of TEMP.
+    :param LAT: array with the latitude of each series, only needed for day
+        length sensitive crops (IDSL >= 1).
+    :param DOY: array (days, series) with the day of year, only needed
+        when IDSL >= 1.
+
+    Returns a dictionary with arrays for the states of the phenology at the
+    end of the crop cycle: DVS, TSUM, TSUME, VERN and the rows of emergence
+    (DOE), anthesis (DOA), maturity (DOM) and of the finish of the crop
+    cycle (DOF); -1 denotes that an event did not occur. FINISHED is False
+    for series that did not reach the end of the crop cycle within the
+    simulated days, `Engine` would not return summary output for these.
+    """
+    TEMP = np.asarray(TEMP, dtype=np.float64)
+    ndays, n = TEMP.shape
+    if isinstance(cropdata, (list, tuple)):
+        parvalues = list(cropdata)
+    else:
+        parvalues = [cropdata] * n
+    pheno = BatchPhenology(parvalues, [start_type] * n)
+
+    crop_start = np.asarray(crop_start, dtype=np.int64)
+    harvest = end_type in ("harvest", "earliest")
+    if harvest:
+        crop_end = np.asarray(crop_end, dtype=np.int64)
+        if (crop_end <= crop_start).any():
+            msg = ("CROP_END_DATE <= CROP_START_DATE: " +
+                   "crop simulation will never finish!")
+            raise exc.PCSEError(msg)
+    stop_at_maturity = end_type in ("maturity", "earliest")
+    if end is None:
+        end = np.zeros(n, dtype=np.int64) + ndays - 1
+    else:
+        end = np.minimum(np.asarray(end, dtype=np.int64), ndays - 1)
+    daylength_input = LAT is not None and DOY is not None
+    if daylength_input:
+        LAT = np.asarray(LAT, dtype=np.float64)
+        DOY = np.asarray(DOY)
+    elif (pheno.params["IDSL"] >= 1).any():
+        msg = "LAT and DOY are needed for day length sensitive crops."
+        raise exc.PCSEError(msg)
+
+    # The phenological events are registered with day number t+1 by
+    # BatchPhenology, so that day number 0 denotes no event.
+    DOF = np.zeros(n, dtype=np.int64) - 1
+    finished = np.zeros(n, dtype=bool)
+    in_crop_cycle = np.zeros(n, dtype=bool)
+
+    for t in range(ndays):
+        # Integration of the states of crops that started on a previous day
+        finish = np.zeros(n, dtype=bool)
+        idx = (in_crop_cycle & (crop_start < t)).nonzero()[0]
+        if len(idx) > 0:
+            _, maturity = pheno.integrate(idx, np.repeat(t + 1, len(idx)))
+            if stop_at_maturity:
+                finish[idx[maturity]] = True
+
+        # Start of the crop cycle
+        start = (crop_start == t) & (t <= end)
+        if start.any():
+            in_crop_cycle[start] = True
+            idx = start.nonzero()[0]
+            pheno.initialize(idx, np.repeat(t + 1, len(idx)))
+
+        # End of the crop cycle because of harvest or maximum duration
+        if harvest:
+            finish |= in_crop_cycle & (t >= crop_end)
+        finish |= in_crop_cycle & (t - crop_start >= max_duration)
+        DOF[finish] = t
+        finished |= finish
+        in_crop_cycle &= ~finish
+        # Reaching END_DATE terminates the simulation of a series
+        in_crop_cycle &= t < end
+
+        # Rates of crops in the crop cycle
+        idx = in_crop_cycle.nonzero()[0]
+        if len(idx) == 0:
+            if ((crop_start > t) & (crop_start <= end)).any():
+                continue
+            break
+        if daylength_input:
+            pheno.calc_rates(idx, TEMP[t, idx], DOY[t, idx], LAT[idx])
+        else:
+            pheno.calc_rates(idx, TEMP[t, idx])
+
+    result = {"DVS":pheno.DVS, "TSUM":pheno.TSUM, "TSUME":pheno.TSUME,
+              "VERN":pheno.VERN, "DOF":DOF, "FINISHED":finished}
+    for name in ["DOE", "DOA", "DOM"]:
+        result[name] = getattr(pheno, name) - 1
+    return result
+
+#-------------------------------------------------------------------------------
+def get_temperatures(weatherdataprovider, start_dates, ndays):
+    """Returns an array (days, series) with the daily mean temperature and
+    an array with the day of year for series starting at start_dates.
+
+    :param ndays: number of days to retrieve, either a single number or one
+        for each series. Rows beyond the number of days of a series are 0.
+
+    The mean temperature is derived as in `Engine._get_driving_variables`.
+    A WeatherDataProviderError is raised when a day is missing.
+    """
+    if not isinstance(ndays, (list, tuple, np.ndarray)):
+        ndays = [ndays] * len(start_dates)
+    TEMP = np.zeros((max(ndays), len(start_dates)))
+    DOY = np.ones((max(ndays), len(start_dates)), dtype=np.int64)
+    for j, start in enumerate(start_dates):
+        for t in range(ndays[j]):
+            day = start + datetime.timedelta(days=t)
+            drv = weatherdataprovider(day)
+            if hasattr(drv, "TEMP"):
+                TEMP[t, j] = drv.TEMP
+            else:
+                TEMP[t, j] = (drv.TMIN + drv.TMAX)/2.
+            DOY[t, j] = day.timetuple().tm_yday
+    return TEMP, DOY
+
+#-------------------------------------------------------------------------------
+def simulate_tsums(cropdata, weatherdataprovider, timerdata, days=366):
+    """Returns the temperature sum (TSUM) at the end of the crop cycle for
+    each dictionary with timer data in `timerdata`.
+
+    The result for each item equals the TSUM in the summary output of
+    running the `Engine` with `Wofost71_PhenoOnly.conf` for the given number
+    of days. None is returned for items where the crop cycle did not finish
+    and the `Engine` would not give summary output. All items should have
+    the same crop start type, crop end type and maximum duration.
+    """
+    if len(timerdata) == 0:
+        return []
+    for key in ["CROP_START_TYPE", "CROP_END_TYPE", "MAX_DURATION"]:
+        if len(set([t[key] for t in timerdata])) > 1:
+            msg = "All timer data should have the same %s." % key
+            raise exc.PCSEError(msg)
+    start_type = timerdata[0]["CROP_START_TYPE"]
+    end_type = timerdata[0]["CROP_END_TYPE"]
+
+    def rows(key):
+        return np.array([(t[key] - t["START_DATE"]).days for t in timerdata])
+    crop_start = rows("CROP_START_DATE")
+    if (crop_start < 0).any():
+        msg = ("CROP_START_DATE before simulation start day: " +
+               "crop simulation will never start.")
+        raise exc.PCSEError(msg)
+    crop_end = None
+    if end_type in ("harvest", "earliest"):
+        crop_end = rows("CROP_END_DATE")
+    end = np.minimum(rows("END_DATE"), days)
+
+    start_dates = [t["START_DATE"] for t in timerdata]
+    TEMP, DOY = get_temperatures(weatherdataprovider, start_dates, end + 1)
+    LAT = [weatherdataprovider(day).LAT for day in start_dates]
+    r = calc_tsums(cropdata, TEMP, crop_start, crop_end, start_type, end_type,
+                   timerdata[0]["MAX_DURATION"], end=end, LAT=LAT, DOY=DOY)
+    return [float(tsum) if finished else None
+            for tsum, finished in zip(r["TSUM"], r["FINISHED"])]
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Array versions of the classic WOFOST water balances for the BatchEngine.
+
+The components follow the structure of a SimulationObject, but `calc_rates`,
+`integrate` and `finalize` operate on the cells given by the index array
+`idx`. Values that the scalar water balances retrieve from the kiosk are
+passed as arguments, NaN means that a variable is not available in the kiosk
+for that cell.
+"""
+import numpy as np
+
+from ..util import limit as scalar_limit
+from ..util import limit_array as limit, BatchAfgen
+from .. import exceptions as exc
+from .util import get_parameters
+
+#-------------------------------------------------------------------------------
+class BatchWaterbalancePP(object):
+    """Array version of `pcse.soil.classic_waterbalance.WaterbalancePP`.
+
+    Soil moisture is kept at field capacity, soil evaporation equals the
+    maximum soil evaporation.
+    """
+    variables = ("SM", "EVS")
+
+    def __init__(self, cropdata, soildata, sitedata):
+        n = len(soildata)
+        p = get_parameters(soildata, ["SMFCF"])
+        self.SMFCF = p["SMFCF"]
+        self.SM = self.SMFCF.copy()
+        self.EVS = np.zeros(n)
+
+    def calc_rates(self, idx, drv, in_crop_cycle, RD, TRA, EVWMX, EVSMX):
+        ES0 = drv.ES0[idx]
+        self.EVS[idx] = np.where(np.isnan(EVSMX), ES0, EVSMX)
+
+    def integrate(self, idx, in_crop_cycle, RD):
+        self.SM[idx] = self.SMFCF[idx]
+
+    def finalize(self, idx, days):
+        pass
+
+#-------------------------------------------------------------------------------
+class BatchWaterbalanceFD(object):
+    """Array version of `pcse.soil.classic_waterbalance.WaterbalanceFD`.
+
+    Waterbalance for freely draining soils under water-limited production for
+    a batch of cells, see `WaterbalanceFD` for the description of parameters,
+    states and rates.
+    """
+    variables = ("SM", "SS", "W", "WI", "WLOW", "WLOWI", "WWLOW", "WTRAT",
+                 "EVST", "EVWT", "TSR", "RAINT", "WDRT", "TOTINF", "TOTIRR",
+                 "PERCT", "LOSST", "WBALRT", "WBALTT", "EVS", "EVW", "WTRA",
+                 "RAIN", "RIN", "RIRR", "PERC", "LOSS", "DW", "DWLOW")
+
+    parameters = ["SMFCF", "SM0", "SMW", "CRAIRC", "SOPE", "KSUB", "K0",
+                  "RDMSOL", "IFUNRN", "SSMAX", "SSI", "WAV", "NOTINF", "SMLIM",
+                  "IAIRDU", "RDMCR", "RDI"]
+
+    def __init__(self, cropdata, soildata, sitedata):
+        parvalues = []
+        for crop, soil, site in zip(cropdata, soildata, sitedata):
+            # Check validity of maximum soil moisture amount in topsoil
+            if crop["IAIRDU"] == 1: # applicable only for flooded rice crops
+                SMLIM = soil["SM0"]
+            else:
+                SMLIM = scalar_limit(soil["SMW"], soil["SM0"], site["SMLIM"])
+            d = dict(crop)
+            d.update(soil)
+            d.update(site)
+            d["SMLIM"] = SMLIM
+            parvalues.append(d)
+        p = get_parameters(parvalues, self.parameters)
+        for name, value in p.items():
+            setattr(self, name, value)
+        n = len(parvalues)
+
+        # Initial rooting depth and maximum rootable depth
+        RD = self.RDI.copy()
+        self.RDM = np.maximum(self.RDI, np.minimum(self.RDMSOL, self.RDMCR))
+        self.RDold = RD.copy()
+
+        # Initial surface storage and soil moisture in the rooted and lower
+        # zone
+        self.SS = self.SSI.copy()
+        self.SM = limit(self.SMW, self.SMLIM, (self.SMW + self.WAV/RD))
+        self.W = self.SM * RD
+        self.WI = self.W.copy()
+        self.WLOW = limit(0., self.SM0*(self.RDM - RD),
+                          (self.WAV + self.RDM*self.SMW - self.W))
+        self.WLOWI = self.WLOW.copy()
+        self.WWLOW = self.W + self.WLOW
+
+        # Days since last rain
+        self.DSLR = np.where(self.SM >= (self.SMW + 0.5*(self.SMFCF-self.SMW)),
+                             1., 5.)
+        self.RINold = np.zeros(n)
+        self.NINFTB = BatchAfgen([[0.0,0.0, 0.5,0.0, 1.5,1.0]])
+        self.rooted_layer_needs_reset = np.zeros(n, dtype=bool)
+
+        for name in ["WTRAT", "EVST", "EVWT", "TSR", "RAINT", "WDRT", "TOTINF",
+                     "TOTIRR", "PERCT", "LOSST"]:
+            setattr(self, name, np.zeros(n))
+        self.WBALRT = np.zeros(n) - 999.
+        self.WBALTT = np.zeros(n) - 999.
+        for name in ["EVS", "EVW", "WTRA", "RAIN", "RIN", "RIRR", "PERC",
+                     "LOSS", "DW", "DWLOW"]:
+            setattr(self, name, np.zeros(n))
+
+    def calc_rates(self, idx, drv, in_crop_cycle, RD, TRA, EVWMX, EVSMX):
+        """Calculates the rates of the cells in idx.
+
+        :param in_crop_cycle: bool array, True when a crop cycle is going on
+        :param RD: rooting depth of the crop, NaN when there is no crop
+        :param TRA, EVWMX, EVSMX: transpiration and maximum evaporation rates
+            of the crop, NaN when these were not calculated today.
+        """
+        RAIN = drv.RAIN[idx]
+        RIRR = np.zeros(len(idx))
+        self.RIRR[idx] = RIRR
+        self.RAIN[idx] = RAIN
+
+        # Transpiration and maximum soil and surfacewater evaporation rates
+        # are calculated by the crop Evapotranspiration module.
+        # However, if the crop is not yet emerged then set TRA=0 and use
+        # the potential soil/water evaporation rates directly because there is
+        # no shading by the canopy.
+        no_tra = np.isnan(TRA)
+        WTRA = np.where(no_tra, 0., TRA)
+        EVWMX = np.where(no_tra, drv.E0[idx], EVWMX)
+        EVSMX = np.where(no_tra, drv.ES0[idx], EVSMX)
+        self.WTRA[idx] = WTRA
+
+        # Actual evaporation rates
+        EVW = np.zeros(len(idx))
+        self.EVW[idx] = EVW
+        SS = self.SS[idx]
+        RINold = self.RINold[idx]
+        DSLR = self.DSLR[idx]
+        # If surface storage > 1 cm or the infiltration of the previous day
+        # was at least 1 cm, evaporation is at the maximum rate, else the
+        # evaporation rate decreases with the days since last rain.
+        wet = (SS <= 1.) & (RINold >= 1)
+        dry = (SS <= 1.) & (RINold < 1)
+        DSLR = np.where(wet, 1., np.where(dry, DSLR + 1, DSLR))
+        EVSMXT = EVSMX*(np.sqrt(DSLR) - np.sqrt(np.maximum(DSLR-1, 0.)))
+        EVS = np.where(dry, np.minimum(EVSMX, EVSMXT + RINold), EVSMX)
+        self.DSLR[idx] = DSLR
+        self.EVS[idx] = EVS
+
+        # Preliminary infiltration rate
+        NOTINF = self.NOTINF[idx]
+        RINPRE_low = np.where(self.IFUNRN[idx] == 0,
+                              (1. - NOTINF)*RAIN + RIRR + SS,
+                              (1. - NOTINF*self.NINFTB(RAIN))*RAIN + RIRR + SS)
+        AVAIL = SS + (RAIN * (1.-NOTINF)) + RIRR - EVW
+        RINPRE = np.where(SS < 0.1, RINPRE_low,
+                          np.minimum(self.SOPE[idx], AVAIL))
+
+        # maximum flow at Top Boundary of Lower Zone
+        RD = self._determine_rooting_depth(idx, in_crop_cycle, RD)
+        SMFCF = self.SMFCF[idx]
+        RDM = self.RDM[idx]
+        SM0 = self.SM0[idx]
+        WLOW = self.WLOW[idx]
+        WE = SMFCF * RD
+        PERC1 = limit(0., self.SOPE[idx], (self.W[idx] - WE) - WTRA - EVS)
+
+        # maximum flow at Top Boundary of Lower Zone
+        WELOW = SMFCF * (RDM - RD)
+        LOSS = limit(0., self.KSUB[idx], (WLOW - WELOW + PERC1))
+        # for rice water losses are limited to K0/20
+        LOSS = np.where(self.IAIRDU[idx] == 1,
+                        np.minimum(LOSS, self.K0[idx]/20.), LOSS)
+        self.LOSS[idx] = LOSS
+
+        # percolation from rootzone to lower zone
+        PERC2 = ((RDM - RD) * SM0 - WLOW) + LOSS
+        PERC = np.minimum(PERC1, PERC2)
+        self.PERC[idx] = PERC
+
+        # adjustment of infiltration rate
+        RIN = np.minimum(RINPRE, (SM0 - self.SM[idx])*RD + WTRA + EVS + PERC)
+        self.RIN[idx] = RIN
+        self.RINold[idx] = RIN
+
+        # rates of change in amounts of moisture W and WLOW
+        self.DW[idx] = RIN - WTRA - EVS - PERC
+        self.DWLOW[idx] = PERC - LOSS
+
+    def integrate(self, idx, in_crop_cycle, RD):
+        """Integrates the states of the cells in idx.
+
+        :param in_crop_cycle: bool array, True when a crop cycle is going on
+        :param RD: rooting depth of the crop, NaN when there is no crop
+        """
+        # total transpiration, evaporation from surface water and soil
+        self.WTRAT[idx] += self.WTRA[idx]
+        self.EVWT[idx] += self.EVW[idx]
+        self.EVST[idx] += self.EVS[idx]
+
+        # totals for rainfall, irrigation and infiltration
+        RAIN = self.RAIN[idx]
+        RIRR = self.RIRR[idx]
+        RIN = self.RIN[idx]
+        self.RAINT[idx] += RAIN
+        self.TOTINF[idx] += RIN
+        self.TOTIRR[idx] += RIRR
+
+        # Update surface storage
+        SS = self.SS[idx]
+        SSPRE = SS + (RAIN + RIRR - self.EVW[idx] - RIN)
+        SS = np.minimum(SSPRE, self.SSMAX[idx])
+        self.SS[idx] = SS
+        self.TSR[idx] += (SSPRE - SS)
+
+        # amount of water in rooted zone
+        W_NEW = self.W[idx] + self.DW[idx]
+        negative = W_NEW < 0.0
+        self.EVST[idx] += np.where(negative, W_NEW, 0.)
+        W = np.where(negative, 0.0, W_NEW)
+
+        # total percolation and loss of water by deep leaching
+        self.PERCT[idx] += self.PERC[idx]
+        self.LOSST[idx] += self.LOSS[idx]
+
+        # amount of water in unrooted, lower part of rootable zone
+        WLOW = self.WLOW[idx] + self.DWLOW[idx]
+        self.WWLOW[idx] = W + WLOW
+
+        # Reset the rooted zone to the initial rooting depth after the crop
+        # cycle has ended.
+        WDRT = self.WDRT[idx]
+        RDold = self.RDold[idx]
+        reset = self.rooted_layer_needs_reset[idx]
+        self.rooted_layer_needs_reset[idx] = False
+        WDR = np.where(reset, W * (RDold - self.RDI[idx])/RDold, 0.)
+        WLOW += WDR
+        WDRT -= WDR
+        W -= WDR
+
+        # Change of rootzone subsystem boundary
+        # calculation of amount of soil moisture in new rootzone
+        RD = self._determine_rooting_depth(idx, in_crop_cycle, RD)
+        grow = (RD - RDold) > 0.001
+        RDM = self.RDM[idx]
+        WDR = np.where(grow, WLOW * (RD - RDold)/np.where(grow, RDM - RDold, 1.),
+                       0.)
+        WLOW -= WDR
+        WDRT += WDR
+        W += WDR
+
+        self.W[idx] = W
+        self.WLOW[idx] = WLOW
+        self.WDRT[idx] = WDRT
+        self.SM[idx] = W/RD
+        self.RDold[idx] = RD
+
+    def finalize(self, idx, days):
+        """Checks the water balance of the cells in idx."""
+        self.WBALRT[idx] = (self.TOTINF[idx] + self.WI[idx] + self.WDRT[idx] -
+                            self.EVST[idx] - self.WTRAT[idx] - self.PERCT[idx] -
+                            self.W[idx])
+        self.WBALTT[idx] = (self.SSI[idx] + self.RAINT[idx] + self.TOTIRR[idx] +
+                            self.WI[idx] - self.W[idx] + self.WLOWI[idx] -
+                            self.WLOW[idx] - self.WTRAT[idx] - self.EVWT[idx] -
+                            self.EVST[idx] - self.TSR[idx] - self.LOSST[idx] -
+                            self.SS[idx])
+        bad = np.abs(self.WBALRT[idx]) > 0.0001
+        if bad.any():
+            msg = "Water balance for root zone does not close for cell %i."
+            raise exc.WaterBalanceError(msg % idx[bad][0])
+        bad = np.abs(self.WBALTT[idx]) > 0.0001
+        if bad.any():
+            msg = ("Water balance for complete soil profile does not close "
+                   "for cell %i." % idx[bad][0])
+            raise exc.WaterBalanceError(msg)
+
+    def _determine_rooting_depth(self, idx, in_crop_cycle, RD):
+        """Determines the appropriate use of the rooting depth (RD)
+
+        Cells with a crop use the rooting depth of the crop, other cells use
+        the initial rooting depth. When the crop cycle has ended, but the crop
+        still exists, the rooted zone will be reset.
+        """
+        has_crop = ~np.isnan(RD)
+        self.rooted_layer_needs_reset[idx] |= has_crop & ~in_crop_cycle
+        return np.where(has_crop, RD, self.RDI[idx])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Array versions of the helper functions in `pcse.util` used by the
+BatchEngine.
+"""
+import numpy as np
+
+from ..util import astro_array
+from ..util import daylength_array as daylength
+from .. import exceptions as exc
+
+#-------------------------------------------------------------------------------
+def get_parameters(parvalues, names):
+    """Returns a dict with an array of values over all cells for each
+    parameter in names.
+
+    :param parvalues: list of dictionaries with parameter values, one for
+        each cell.
+    :param names: names of the parameters to retrieve.
+    """
+    params = {}
+    for name in names:
+        try:
+            params[name] = np.array([float(p[name]) for p in parvalues])
+        except KeyError:
+            msg = "Value for parameter %s missing." % name
+            raise exc.ParameterError(msg)
+    return params
+
+#-------------------------------------------------------------------------------
+def astro(iday, latitude, radiation):
+    """Array version of `pcse.util.astro`.
+
+    :param iday: array with day-of-year values
+    :param latitude: array with latitudes
+    :param radiation: array with daily global incoming radiation (J/m2/day)
+
+    Returns a tuple of arrays (DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR,
+    DSINBE, ANGOT), see `pcse.util.astro` for their definition. The
+    variables that do not depend on radiation are taken from
+    `pcse.util.astro_array`.
+    """
+    t = astro_array(iday, latitude)
+    AVRAD = radiation
+
+    # atmospheric transmission
+    # Check for DAYL=0 as in that case the angot radiation is 0 as well
+    has_day = t.DAYL > 0.0
+    ATMTR = np.where(has_day, AVRAD/np.where(has_day, t.ANGOT, 1.), 0.)
+
+    # estimate fraction diffuse irradiation
+    FRDIF = np.where(ATMTR > 0.75, 0.23,
+            np.where(ATMTR > 0.35, 1.33-1.46*ATMTR,
+            np.where(ATMTR > 0.07, 1.-2.3*(ATMTR-0.07)**2, 1.)))
+    DIFPP = FRDIF*ATMTR*0.5*t.SC
+
+    return (t.DAYL, t.DAYLP, t.SINLD, t.COSLD, DIFPP, ATMTR, t.DSINBE, t.ANGOT)
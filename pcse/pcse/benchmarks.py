@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Benchmarks for the PCSE engine on the demo database.
+
+example::
+
+    >>> from pcse.benchmarks import benchmark_states_rates
+    >>> benchmark_states_rates()
+    GGCMI_WLP.conf, FAST_STATES_RATES=False:  3920 days,  2.108 ms/day,  17.56 ms/engine construction
+    GGCMI_WLP.conf, FAST_STATES_RATES=True:  3920 days,  0.681 ms/day,  11.54 ms/engine construction
+    ...
+"""
+import os
+import time
+import datetime
+
+from sqlalchemy import create_engine, MetaData
+
+from . import db
+from .engine import Engine
+from .settings import settings
+
+def get_inputs(grid=31031, year=2000, crops=(1, 2, 3, 7, 10, 11), dsn=None,
+               days_before_start=0):
+    """Returns a list of (sitedata, timerdata, soildata, cropdata, weather)
+    for the crops in the demo database. The simulation starts
+    `days_before_start` days before the crop start date."""
+    if dsn is None:
+        dsn = "sqlite:///" + os.path.join(settings.PCSE_USER_HOME, "pcse.db")
+    metadata = MetaData(create_engine(dsn))
+    inputs = []
+    for crop in crops:
+        timerdata = db.pcse.fetch_timerdata(metadata, grid, year, crop)
+        timerdata["START_DATE"] -= datetime.timedelta(days=days_before_start)
+        wdp = db.pcse.GridWeatherDataProvider(metadata, grid_no=grid,
+                startdate=timerdata["START_DATE"], enddate=timerdata["END_DATE"])
+        inputs.append((db.pcse.fetch_sitedata(metadata, grid, year), timerdata,
+                       db.pcse.fetch_soildata(metadata, grid),
+                       db.pcse.fetch_cropdata(metadata, grid, year, crop), wdp))
+    return inputs
+
+def time_engine(inputs, config, repeat=5):
+    """Runs the Engine for all inputs `repeat` times and returns the number of
+    simulated days and the time spent on constructing the engines and on
+    running them (seconds)."""
+    ndays = 0
+    t_init = 0.
+    t_run = 0.
+    for _ in range(repeat):
+        for sitedata, timerdata, soildata, cropdata, wdp in inputs:
+            t1 = time.time()
+            engine = Engine(dict(sitedata), dict(timerdata), dict(soildata),
+                            dict(cropdata), wdp, config=config)
+            t2 = time.time()
+            engine.run_till_terminate()
+            t_run += time.time() - t2
+            t_init += t2 - t1
+            ndays += (engine.day - timerdata["START_DATE"]).days
+            engine.close()
+    return ndays, t_init, t_run
+
+def benchmark_states_rates(configs=("GGCMI_WLP.conf", "GGCMI_PP.conf"),
+                           repeat=5):
+    """Prints the cost per simulated day with the default states/rates
+    classes and with settings.FAST_STATES_RATES."""
+    inputs = get_inputs()
+    fast = settings.FAST_STATES_RATES
+    try:
+        for config in configs:
+            for setting in (False, True):
+                settings.FAST_STATES_RATES = setting
+                ndays, t_init, t_run = time_engine(inputs, config, repeat)
+                msg = "%s, FAST_STATES_RATES=%s: %5i days, %6.3f ms/day, " \
+                      "%6.2f ms/engine construction"
+                print msg % (config, setting, ndays, 1000.*t_run/ndays,
+                             1000.*t_init/(repeat*len(inputs)))
+    finally:
+        settings.FAST_STATES_RATES = fast
+
+if __name__ == "__main__":
+    benchmark_states_rates()
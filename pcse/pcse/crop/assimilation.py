@@ -6,10 +6,15 @@
 Available SimulationObjects:
 
 * WOFOST_Assimilation
+
+The function `totass` is the NumPy version of the daily gross assimilation for
+arrays of crops and days, as used by the BatchEngine.
 """
 
 from math import sqrt, exp, cos, pi
 
+import numpy as np
+
 from ..traitlets import Instance, Float, AfgenTrait
 
 from ..util import limit, astro, doy
@@ -24,6 +29,86 @@ except ImportError as exc:
     print "failed import fortran objects: %s" % exc
     ftotass = fastro = None
 
+# Gauss points and weights for the integration over time and canopy depth
+XGAUSS = (0.1127017, 0.5000000, 0.8872983)
+WGAUSS = (0.2777778, 0.4444444, 0.2777778)
+GAUSS = tuple(zip(XGAUSS, WGAUSS))
+
+# Scattering coefficient of leaves for visible radiation, the reflection
+# coefficient of a canopy with horizontal leaves follows from it
+SCV = 0.2
+SQV = sqrt(1.-SCV)
+REFH = (1.-SQV)/(1.+SQV)
+
+#-------------------------------------------------------------------------------
+def totass(DAYL, AMAX, EFF, LAI, KDIF, AVRAD, DIFPP, DSINBE, SINLD, COSLD):
+    """NumPy version of `WOFOST_Assimilation._totass` and `_assim`.
+
+    Calculates the daily total gross CO2 assimilation (kg CO2/ha/d) for
+    arrays of crops and/or days. The arguments are scalars or arrays of the
+    same shape and are described in `WOFOST_Assimilation._totass`, the
+    result is an array of that shape. The arguments are flattened to n
+    elements, the three hours of the Gaussian integration over time and the
+    three depths of the integration over the canopy are evaluated at once as
+    arrays of shape (3, n) and (3, 3, n).
+
+    Results are identical to `WOFOST_Assimilation._totass`. Because of the
+    overhead of NumPy, this pays off only for many elements at once.
+    """
+    args = np.broadcast_arrays(*[np.atleast_1d(np.asarray(a, dtype=np.float64))
+                                 for a in (DAYL, AMAX, EFF, LAI, KDIF, AVRAD,
+                                           DIFPP, DSINBE, SINLD, COSLD)])
+    shape = args[0].shape
+    args = [a.ravel() for a in args]
+    DTGA = np.zeros(args[0].shape)
+
+    # calculation of assimilation is done only when it will not be zero
+    # (AMAX >0, LAI >0, DAYL >0)
+    ok = (args[1] > 0.) & (args[3] > 0.) & (args[0] > 0.)
+    if not ok.any():
+        return DTGA.reshape(shape)
+    if not ok.all():
+        args = [a[ok] for a in args]
+    DAYL, AMAX, EFF, LAI, KDIF, AVRAD, DIFPP, DSINBE, SINLD, COSLD = args
+
+    # Irradiance at the Gauss points of the day, axis 0 is time
+    XG = np.array(XGAUSS)
+    WG = np.array(WGAUSS)
+    HOUR   = 12.0+0.5*DAYL*XG[:, None]
+    SINB   = np.maximum(0., SINLD+COSLD*np.cos(2.*pi*(HOUR+12.)/24.))
+    PAR    = 0.5*AVRAD*SINB*(1.+0.4*SINB)/DSINBE
+    PARDIF = np.minimum(PAR, SINB*DIFPP)
+    PARDIR = PAR-PARDIF
+
+    # extinction coefficients KDIF,KDIRBL,KDIRT
+    REFS   = REFH*2./(1.+1.6*SINB)
+    KDIRBL = (0.5/SINB)*KDIF/(0.8*SQV)
+    KDIRT  = KDIRBL*SQV
+    AMAX2  = np.maximum(2.0, AMAX)
+    VISPP  = (1.-SCV)*PARDIR/SINB
+    no_vispp = VISPP <= 0.
+
+    # Assimilation at the Gauss points in the canopy, axis 0 is canopy depth
+    # and axis 1 is time
+    LAIC   = LAI*XG[:, None, None]
+    VISDF  = (1.-REFS)*PARDIF*KDIF  *np.exp(-KDIF  *LAIC)
+    VIST   = (1.-REFS)*PARDIR*KDIRT *np.exp(-KDIRT *LAIC)
+    VISD   = (1.-SCV) *PARDIR*KDIRBL*np.exp(-KDIRBL*LAIC)
+    VISSHD = VISDF+VIST-VISD
+    FGRSH  = AMAX*(1.-np.exp(-VISSHD*EFF/AMAX2))
+    FGRSUN = AMAX*(1.-(AMAX-FGRSH)*(1.-np.exp(-VISPP*EFF/AMAX2))/
+                   np.where(no_vispp, 1., EFF*VISPP))
+    FGRSUN = np.where(no_vispp, FGRSH, FGRSUN)
+    FSLLA  = np.exp(-KDIRBL*LAIC)
+    FGL    = FSLLA*FGRSUN+(1.-FSLLA)*FGRSH
+
+    # integration over depth and time
+    FGROS  = (FGL*WG[:, None, None]).sum(axis=0)*LAI
+    DTGA[ok] = (FGROS*WG[:, None]).sum(axis=0)*DAYL
+
+    return DTGA.reshape(shape)
+
+#-------------------------------------------------------------------------------
 class WOFOST_Assimilation(SimulationObject):
     """Class implementing a WOFOST/SUCROS style assimilation routine.
     
@@ -193,22 +278,18 @@ class WOFOST_Assimilation(SimulationObject):
         Date   : September 2011
         """
 
-        # Gauss points and weights
-        XGAUSS = [0.1127017, 0.5000000, 0.8872983]
-        WGAUSS = [0.2777778, 0.4444444, 0.2777778]
-    
         # calculation of assimilation is done only when it will not be zero
         # (AMAX >0, LAI >0, DAYL >0)
         DTGA = 0.
         if (AMAX > 0. and LAI > 0. and DAYL > 0.):
-            for i in range(3):
-                HOUR   = 12.0+0.5*DAYL*XGAUSS[i]
+            for XG, WG in GAUSS:
+                HOUR   = 12.0+0.5*DAYL*XG
                 SINB   = max(0.,SINLD+COSLD*cos(2.*pi*(HOUR+12.)/24.))
                 PAR    = 0.5*AVRAD*SINB*(1.+0.4*SINB)/DSINBE
                 PARDIF = min(PAR,SINB*DIFPP)
                 PARDIR = PAR-PARDIF
                 FGROS = self._assim(AMAX,EFF,LAI,KDIF,SINB,PARDIR,PARDIF)
-                DTGA += FGROS*WGAUSS[i]
+                DTGA += FGROS*WG
         DTGA *= DAYL
         
         return DTGA
@@ -232,22 +313,23 @@ class WOFOST_Assimilation(SimulationObject):
         Python version:
         Allard de Wit, 2011
         """
-        # Gauss points and weights
-        XGAUSS = [0.1127017, 0.5000000, 0.8872983]
-        WGAUSS = [0.2777778, 0.4444444, 0.2777778]
-        
-        SCV = 0.2
-    
         # 13.2 extinction coefficients KDIF,KDIRBL,KDIRT
-        REFH   = (1.-sqrt(1.-SCV))/(1.+sqrt(1.-SCV))
         REFS   = REFH*2./(1.+1.6*SINB)
-        KDIRBL = (0.5/SINB)*KDIF/(0.8*sqrt(1.-SCV))
-        KDIRT  = KDIRBL*sqrt(1.-SCV)
+        KDIRBL = (0.5/SINB)*KDIF/(0.8*SQV)
+        KDIRT  = KDIRBL*SQV
+
+        # direct light absorbed by leaves perpendicular on direct
+        # beam, does not depend on depth in the canopy
+        AMAX2  = max(2.0, AMAX)
+        VISPP  = (1.-SCV)*PARDIR/SINB
+        if VISPP > 0.:
+            FSUN  = 1.-exp(-VISPP*EFF/AMAX2)
+            EFFPP = EFF*VISPP
     
         #13.3 three-point Gaussian integration over LAI
         FGROS  = 0.
-        for i in range(3):
-            LAIC   = LAI*XGAUSS[i]
+        for XG, WG in GAUSS:
+            LAIC   = LAI*XG
             # absorbed diffuse radiation (VISDF),light from direct
             # origine (VIST) and direct light (VISD)
             VISDF  = (1.-REFS)*PARDIF*KDIF  *exp(-KDIF  *LAIC)
@@ -256,16 +338,13 @@ class WOFOST_Assimilation(SimulationObject):
             
             # absorbed flux in W/m2 for shaded leaves and assimilation
             VISSHD = VISDF+VIST-VISD
-            FGRSH  = AMAX*(1.-exp(-VISSHD*EFF/max(2.0,AMAX)))
+            FGRSH  = AMAX*(1.-exp(-VISSHD*EFF/AMAX2))
             
-            # direct light absorbed by leaves perpendicular on direct
-            # beam and assimilation of sunlit leaf area
-            VISPP  = (1.-SCV)*PARDIR/SINB
+            # assimilation of sunlit leaf area
             if (VISPP <= 0.):
                 FGRSUN = FGRSH
             else:
-                FGRSUN = AMAX*(1.-(AMAX-FGRSH) \
-                         *(1.-exp(-VISPP*EFF/max(2.0,AMAX)))/ (EFF*VISPP))
+                FGRSUN = AMAX*(1.-(AMAX-FGRSH)*FSUN/EFFPP)
     
             # fraction of sunlit leaf area (FSLLA) and local
             # assimilation rate (FGL)
@@ -273,7 +352,7 @@ class WOFOST_Assimilation(SimulationObject):
             FGL    = FSLLA*FGRSUN+(1.-FSLLA)*FGRSH
             
             # integration
-            FGROS += FGL*WGAUSS[i]
+            FGROS += FGL*WG
     
         FGROS  = FGROS*LAI
         return FGROS
@@ -2,8 +2,8 @@
 # Copyright (c) 2004-2014 Alterra, Wageningen-UR
 # Allard de Wit (allard.dewit@wur.nl), April 2014
 from math import exp
-from collections import deque
-from array import array
+
+import numpy as np
 
 from ..traitlets import Float, Int, Instance, AfgenTrait
 from ..decorators import prepare_rates, prepare_states
@@ -26,6 +26,14 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
     
     Senescense of the leaves can occur as a result of physiological age,
     drought stress or self-shading.
+
+    The leaf classes are stored in a buffer of fixed capacity, ordered from
+    the youngest to the oldest class. New classes are added in front of the
+    youngest class and dying classes are removed from the end, the buffer is
+    only reallocated when it is full. The buffer is changed in place, so the
+    states `LV`, `SLA` and `LVAGE` are copies of the living leaf classes that
+    are taken after each change. Values of these states that were retrieved
+    earlier, e.g. for the model output, do not change.
        
     *Simulation parameters* (provide in cropdata dictionary)
     
@@ -116,9 +124,9 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         KDIFTB = AfgenTrait()
 
     class StateVariables(StatesTemplate):
-        LV     = Instance(deque)
-        SLA    = Instance(deque)
-        LVAGE  = Instance(deque)
+        LV     = Instance(np.ndarray)
+        SLA    = Instance(np.ndarray)
+        LVAGE  = Instance(np.ndarray)
         LAIEM  = Float(-99.)
         LASUM  = Float(-99.)
         LAIEXP = Float(-99.)
@@ -141,6 +149,18 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         GLAIEX = Float(-99.)
         GLASOL = Float(-99.)
 
+    def get_variable(self, varname):
+        """Returns the value of the specified state or rate variable.
+
+        The leaf class states LV, SLA and LVAGE are returned as copies because
+        the state variables themselves are views that are only valid for the
+        current day.
+        """
+        value = SimulationObject.get_variable(self, varname)
+        if varname in ("LV", "SLA", "LVAGE") and value is not None:
+            value = value.copy()
+        return value
+
     def initialize(self, day, kiosk, cropdata):
         """
         :param day: start date of the simulation
@@ -164,9 +184,8 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         TWLV = WLV + DWLV
 
         # First leaf class (SLA, age and weight)
-        SLA   = deque([params.SLATB(DVS)])
-        LVAGE = deque([0.])
-        LV    = deque([WLV])
+        self._init_leaf_classes(WLV, params.SLATB(DVS))
+        LV, SLA, LVAGE = self._view_leaf_classes()
 
         # Initial values for leaf area
         LAIEM  = LV[0] * SLA[0]
@@ -181,6 +200,62 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
                                           LASUM=LASUM, LAIEXP=LAIEXP, LAIMAX=LAIMAX,
                                           LAI=LAI, WLV=WLV, DWLV=DWLV, TWLV=TWLV)
 
+    def _init_leaf_classes(self, LV, SLA, capacity=64):
+        # Rows of the buffer are LV, SLA and LVAGE. The living leaf classes
+        # are the columns _lo up to _hi, youngest first.
+        self._leaf = np.zeros((3, capacity))
+        self._scratch = np.zeros(capacity)
+        self._lo = capacity - 1
+        self._hi = capacity
+        self._leaf[:, self._lo] = (LV, SLA, 0.)
+
+    def _get_leaf_classes(self):
+        """Returns views on LV, SLA and LVAGE of the living leaf classes."""
+        LV, SLA, LVAGE = self._leaf[:, self._lo:self._hi]
+        return LV, SLA, LVAGE
+
+    def _view_leaf_classes(self):
+        """Returns read-only views on LV, SLA and LVAGE of the living leaf
+        classes for the state variables.
+
+        The views are only valid for the current day as the leaf class buffer
+        is updated in place, `get_variable()` returns copies.
+        """
+        leaf = self._leaf[:, self._lo:self._hi]
+        leaf.flags.writeable = False
+        LV, SLA, LVAGE = leaf
+        return LV, SLA, LVAGE
+
+    def _add_leaf_class(self, LV, SLA):
+        # Make room in front of the youngest leaf class by moving the leaf
+        # classes to the end of the buffer or doubling the buffer.
+        if self._lo == 0:
+            n = self._hi
+            capacity = self._leaf.shape[1]
+            if 2*n > capacity:
+                capacity *= 2
+                leaf = np.zeros((3, capacity))
+                self._scratch = np.zeros(capacity)
+            else:
+                leaf = self._leaf
+            leaf[:, capacity-n:] = self._leaf[:, :n]
+            self._leaf = leaf
+            self._lo = capacity - n
+            self._hi = capacity
+        self._lo -= 1
+        self._leaf[:, self._lo] = (LV, SLA, 0.)
+
+    def _sum(self, a, b=None):
+        """Returns the sum of a (or of a*b) over the leaf classes, summed
+        from the youngest to the oldest class as the builtin sum() does."""
+        out = self._scratch[:len(a)]
+        if b is None:
+            out[:] = a
+        else:
+            np.multiply(a, b, out=out)
+        np.add.accumulate(out, out=out)
+        return float(out[-1])
+
     def _calc_LAI(self):
         # Total leaf area Index as sum of leaf, pod and stem area
         SAI = self.kiosk["SAI"]
@@ -224,10 +299,10 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         # in DALV.
         # Note that the actual leaf death is imposed on the array LV during the
         # state integration step.
-        DALV = 0.0
-        for lv, lvage in zip(states.LV, states.LVAGE):
-            if lvage > params.SPAN:
-                DALV += lv
+        # Leaf age increases from the youngest to the oldest leaf class.
+        LV, SLA, LVAGE = self._get_leaf_classes()
+        i = LVAGE.searchsorted(params.SPAN, side="right")
+        DALV = self._sum(LV[i:]) if i < len(LV) else 0.0
         rates.DALV = DALV
 
         # Total death rate leaves
@@ -258,39 +333,30 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         states = self.states
 
         # --------- leave death ---------
-        tLV = array('d', states.LV)
-        tSLA = array('d', states.SLA)
-        tLVAGE = array('d', states.LVAGE)
         tDRLV = rates.DRLV
 
         # leaf death is imposed on leaves by removing leave classes from the
-        # right side of the deque. 
-        for LVweigth in reversed(states.LV):
-            if tDRLV > 0.:
-                if tDRLV >= LVweigth: # remove complete leaf class from deque
-                    tDRLV -= LVweigth
-                    tLV.pop()
-                    tLVAGE.pop()
-                    tSLA.pop()
-                else: # Decrease value of oldest (rightmost) leave class
-                    tLV[-1] -= tDRLV
-                    tDRLV = 0.
-            else:
-                break
+        # oldest end of the buffer.
+        leaf = self._leaf
+        while tDRLV > 0. and self._hi > self._lo:
+            LVweigth = leaf[0, self._hi-1]
+            if tDRLV >= LVweigth: # remove complete leaf class
+                tDRLV -= LVweigth
+                self._hi -= 1
+            else: # Decrease value of oldest leave class
+                leaf[0, self._hi-1] -= tDRLV
+                tDRLV = 0.
 
         # Integration of physiological age
-        tLVAGE = deque([age + rates.FYSAGE for age in tLVAGE])
-        tLV = deque(tLV)
-        tSLA = deque(tSLA)
+        leaf[2, self._lo:self._hi] += rates.FYSAGE
 
         # --------- leave growth ---------
         # new leaves in class 1
-        tLV.appendleft(rates.GRLV)
-        tSLA.appendleft(rates.SLAT)
-        tLVAGE.appendleft(0.)
+        self._add_leaf_class(rates.GRLV, rates.SLAT)
+        tLV, tSLA, tLVAGE = self._get_leaf_classes()
 
         # calculation of new leaf area
-        states.LASUM = sum([lv*sla for lv, sla in zip(tLV, tSLA)])
+        states.LASUM = self._sum(tLV, tSLA)
         states.LAI = self._calc_LAI()
         states.LAIMAX = max(states.LAI, states.LAIMAX)
 
@@ -298,14 +364,12 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         states.LAIEXP += rates.GLAIEX
 
         # Update leaf biomass states
-        states.WLV  = sum(tLV)
+        states.WLV  = self._sum(tLV)
         states.DWLV += rates.DRLV
         states.TWLV = states.WLV + states.DWLV
 
-        # Store final leaf biomass deques
-        self.states.LV = tLV
-        self.states.SLA = tSLA
-        self.states.LVAGE = tLVAGE
+        # Publish views on the final leaf classes
+        states.LV, states.SLA, states.LVAGE = self._view_leaf_classes()
 
     @prepare_states
     def _set_variable_LAI(self, nLAI):
@@ -332,18 +396,19 @@ class WOFOST_Leaf_Dynamics(SimulationObject):
         adj_oLAI = max(oLAI - SAI - PAI, 0.)
 
         # LAI Adjustment factor for leaf biomass LV (rLAI)
+        LV, SLA, LVAGE = self._get_leaf_classes()
         if adj_oLAI > 0:
             rLAI = adj_nLAI/adj_oLAI
-            LV = [lv*rLAI for lv in states.LV]
+            LV *= rLAI
         # If adj_oLAI == 0 then add the leave biomass directly to the
         # youngest leave age class (LV[0])
         else:
-            LV[0] = nLAI/states.SLA[0]
+            LV[0] = nLAI/SLA[0]
 
-        states.LASUM = sum([lv*sla for lv, sla in zip(LV, states.SLA)])
-        states.LV = deque(LV)
+        states.LASUM = self._sum(LV, SLA)
+        states.LV, states.SLA, states.LVAGE = self._view_leaf_classes()
         states.LAI = self._calc_LAI()
-        states.WLV = sum(states.LV)
+        states.WLV = self._sum(LV)
         states.TWLV = states.WLV + states.DWLV
 
         increments = {"LAI": states.LAI - oLAI,
@@ -5,11 +5,13 @@ import os, sys
 from collections import deque
 import logging
 import datetime
+import operator
+from functools import partial
 
-from .traitlets import Instance, Bool
+from .traitlets import Instance, Bool, Int
 from .base_classes import (VariableKiosk, WeatherDataProvider,
                            AncillaryObject, WeatherDataContainer,
-                           SimulationObject, BaseEngine)
+                           SimulationObject, BaseEngine, CachedParameters)
 from .util import ConfigurationLoader
 from .timer import Timer
 from . import signals
@@ -78,12 +80,23 @@ class Engine(BaseEngine):
     flag_output = Bool(False)
     flag_summary_output = Bool(False)
     
-    # placeholders for variables saved during model execution
+    # placeholders for variables saved during model execution, see
+    # _save_output()
+    _output_columns = Instance(dict)
+    _output_size = Int(0)
+    _n_output = Int(0)
+    _output_slots = Instance(list)
     _saved_output = Instance(list)
     _saved_summary_output = Instance(list)
 
     # Helper variables
     TMNSAV = Instance(deque)
+
+    # Optional CropFreeTrajectory from which the soil state is restored on
+    # the crop-free days before the crop start, see _run_crop_free(). It is
+    # kept when the engine is reset.
+    soil_trajectory = Instance(object)
+    _crop_started = Bool(False)
     
     def __init__(self, sitedata, timerdata, soildata, cropdata,
                  weatherdataprovider, config=None):
@@ -116,14 +129,94 @@ class Engine(BaseEngine):
         # Variable kiosk for registering and publishing variables
         self.kiosk = VariableKiosk()
 
-        # register handlers for starting/finishing the crop simulation, for
-        # handling output and terminating the system
+        self._connect_handlers()
+
+        # Inputs that are kept for the following seasons, see reset(). The
+        # crop parameters are parsed only once for all seasons.
+        self.weatherdataprovider = weatherdataprovider
+        self._sitedata = sitedata
+        self._soildata = soildata
+        self._cropdata = CachedParameters(cropdata)
+
+        self._start_season(timerdata)
+
+    #---------------------------------------------------------------------------
+    def _connect_handlers(self):
+        """Registers the handlers for starting/finishing the crop simulation,
+        for handling output and terminating the system."""
         self._connect_signal(self._on_CROP_START, signal=signals.crop_start)
         self._connect_signal(self._on_CROP_FINISH, signal=signals.crop_finish)
         self._connect_signal(self._on_OUTPUT, signal=signals.output)
         self._connect_signal(self._on_SUMMARY_OUTPUT, signal=signals.summary_output)
         self._connect_signal(self._on_TERMINATE, signal=signals.terminate)
 
+    #---------------------------------------------------------------------------
+    def _remove_components(self):
+        """Removes the crop and soil components from the kiosk and
+        disconnects all receivers from the signal dispatcher of the kiosk."""
+        if self.crop is not None:
+            self.crop._delete()
+            self.crop = None
+        if self.soil is not None:
+            self.soil._delete()
+            self.soil = None
+        self.kiosk.dispatcher.clear()
+        self.kiosk.flush_states()
+        self.kiosk.flush_rates()
+
+    #---------------------------------------------------------------------------
+    def close(self):
+        """Tears down the engine when it is no longer needed.
+
+        The crop and soil components are removed from the kiosk and all
+        receivers are disconnected from the signal dispatcher, so that the
+        engine and its components are released without a garbage collector
+        pass. The model output remains available, the engine cannot be run
+        or reset afterwards.
+        """
+        self._remove_components()
+        self.timer = None
+        self.agromanagement = None
+
+    #---------------------------------------------------------------------------
+    def reset(self, timerdata, sitedata=None):
+        """Resets the engine for simulating a new season given by timerdata.
+
+        The configuration, the variable kiosk, the weather data provider and
+        the parsed crop parameters of the current engine are kept, while the
+        timer, the soil and agromanagement components and the model output
+        are initialized again. The results are identical to those of a new
+        Engine created with the same inputs.
+
+        :param timerdata: A dictionary(-like) object with the timer data of
+            the new season, see `Engine`.
+        :param sitedata: A dictionary(-like) object with the site data of the
+            new season, defaults to the site data of the current season.
+        """
+        if sitedata is not None:
+            self._sitedata = sitedata
+
+        # Remove the components of the current season from the kiosk and
+        # connect the handlers of the engine again.
+        self._remove_components()
+        self._connect_handlers()
+
+        self.flag_terminate = False
+        self.flag_crop_finish = False
+        self.flag_crop_start = False
+        self.flag_crop_delete = False
+        self.flag_output = False
+        self.flag_summary_output = False
+        self._crop_started = False
+        self.TMNSAV = None
+
+        self._start_season(timerdata)
+
+    #---------------------------------------------------------------------------
+    def _start_season(self, timerdata):
+        """Initializes the timer, soil and agromanagement components for the
+        season given by timerdata and calculates the initial rates."""
+
         # Timer: starting day, final day and model output
         start_date = timerdata["START_DATE"]
         end_date = timerdata["END_DATE"]
@@ -131,19 +224,26 @@ class Engine(BaseEngine):
         self.day = self.timer()
 
         # Driving variables
-        self.weatherdataprovider = weatherdataprovider
         self.drv = self._get_driving_variables(self.day)
 
         # Component for simulation of soil processes
-        self.soil = self.mconf.SOIL(self.day, self.kiosk, cropdata, soildata, sitedata)
+        self.soil = self.mconf.SOIL(self.day, self.kiosk, self._cropdata,
+                                    self._soildata, self._sitedata)
 
         # Component for agromanagement
         self.agromanagement = self.mconf.AGROMANAGEMENT(self.day, self.kiosk, self.mconf,
-                                                        timerdata, soildata, sitedata, cropdata)
+                                                        timerdata, self._soildata,
+                                                        self._sitedata, self._cropdata)
         # Call AgroManagement module for management actions at initialization
         self.agromanagement(self.day, self.drv)
 
-        # Placeholder for variables to be saved during a model run
+        # Columns for the variables to be saved during a model run, sized for
+        # daily output during the whole season
+        self._output_size = (end_date - start_date).days + 1
+        self._output_columns = dict((var, [None]*self._output_size) for var
+                                    in ("day",) + tuple(self.mconf.OUTPUT_VARS))
+        self._n_output = 0
+        self._output_slots = None
         self._saved_output = list()
         self._saved_summary_output = list()
 
@@ -191,6 +291,12 @@ class Engine(BaseEngine):
 
         days_done = 0
         while (days_done < days) and (self.flag_terminate is False):
+            # Days on which only the soil is simulated
+            if settings.FAST_CROP_FREE_DAYS:
+                days_done += self._run_crop_free(days - days_done)
+                if days_done == days:
+                    break
+
             days_done += 1
 
             # Update timer
@@ -216,6 +322,10 @@ class Engine(BaseEngine):
         """Runs the system until a terminate signal is sent."""
 
         while self.flag_terminate is False:
+            # Days on which only the soil is simulated
+            if settings.FAST_CROP_FREE_DAYS:
+                self._run_crop_free(sys.maxint)
+
             # Update timer
             self.day = self.timer()
 
@@ -234,6 +344,55 @@ class Engine(BaseEngine):
         if self.flag_terminate is True:
             self.soil.finalize(self.day)
 
+    #---------------------------------------------------------------------------
+    def _run_crop_free(self, days):
+        """Simulates up to `days` days on which no crop is present, on which
+        the timer sends no signals and on which no management actions take
+        place. Returns the number of simulated days.
+
+        On these days only the soil component changes, so the timer and the
+        agromanagement are advanced at once and the soil is simulated in a
+        loop over the days, using its `run_crop_free(days, drvs)` method when
+        available. The results are identical to those of the full loop in
+        `run()`.
+
+        When `soil_trajectory` is set, the state of the soil on the days
+        before the first crop of the season is restored from the trajectory
+        instead of being simulated.
+        """
+        if self.crop is not None:
+            return 0
+        quiet_days = getattr(self.agromanagement, "quiet_days", None)
+        if quiet_days is None:
+            return 0
+        days = min(days, self.timer.quiet_days(days), quiet_days(self.day))
+        if days < 1:
+            return 0
+
+        dates = []
+        drvs = []
+        day = self.day
+        for _ in range(days):
+            day += self.timer.time_step
+            dates.append(day)
+            drvs.append(self._get_driving_variables(day))
+
+        run_crop_free = getattr(self.soil, "run_crop_free", None)
+        if self.soil_trajectory is not None and not self._crop_started:
+            self.soil_trajectory.restore(self.soil, dates[-1],
+                                         self.weatherdataprovider)
+        elif run_crop_free is not None:
+            run_crop_free(dates, drvs)
+        else:
+            for day, drv in zip(dates, drvs):
+                self.integrate(day)
+                self.soil.calc_rates(day, drv)
+
+        self.day = self.timer.advance(days)
+        self.agromanagement.advance(days)
+        self.drv = drvs[-1]
+        return days
+
     #---------------------------------------------------------------------------
     def _on_CROP_FINISH(self, day, crop_delete=False):
         """Sets the variable 'flag_crop_finish' to True when the signal
@@ -244,13 +403,16 @@ class Engine(BaseEngine):
         _finish_cropsimulation().
         
         If crop_delete=True the CropSimulation object will be deleted from the
-        hierarchy in _finish_cropsimulation().
+        hierarchy in _finish_cropsimulation(). This is always the case when
+        the agromanagement runs a crop rotation (its attribute
+        `crop_rotation` is True) as a new crop will be started later.
 
         Finally, summary output will be generated depending on
         conf.SUMMARY_OUTPUT_VARS
         """
         self.flag_crop_finish = True
-        self.flag_crop_delete = crop_delete
+        self.flag_crop_delete = crop_delete or \
+                                getattr(self.agromanagement, "crop_rotation", False)
         self.flag_summary_output = True
         
     #---------------------------------------------------------------------------
@@ -269,6 +431,8 @@ class Engine(BaseEngine):
                    "crop_delete=True")
             raise exc.PCSEError(msg)
         self.crop = cropsimulation
+        self._crop_started = True
+        self._output_slots = None
     
     #---------------------------------------------------------------------------
     def _on_TERMINATE(self):
@@ -312,6 +476,7 @@ class Engine(BaseEngine):
             self.flag_crop_delete = False
             self.crop._delete()
             self.crop = None
+            self._output_slots = None
 
     #---------------------------------------------------------------------------
     def _get_driving_variables(self, day):
@@ -344,18 +509,63 @@ class Engine(BaseEngine):
 
         return sum(self.TMNSAV)/len(self.TMNSAV)
     
+    #---------------------------------------------------------------------------
+    def _get_variable_getter(self, varname):
+        """Returns a function that returns the value of varname as
+        `get_variable()` does, without searching for the variable.
+
+        The function is valid as long as the crop and soil components do not
+        change. For components that override `get_variable()` the function
+        calls the component's `get_variable()`.
+        """
+        if self.kiosk.variable_exists(varname):
+            v = varname
+        elif self.kiosk.variable_exists(varname.upper()):
+            v = varname.upper()
+        else:
+            return lambda: None
+
+        # Search for the states/rates object owning the variable in the same
+        # order as SimulationObject.get_variable()
+        simobjs = list(reversed(self.subSimObjects))
+        while simobjs:
+            simobj = simobjs.pop()
+            for attr in ("states", "rates"):
+                if hasattr(getattr(simobj, attr), v):
+                    get_variable = type(simobj).get_variable.__func__
+                    if get_variable is not SimulationObject.get_variable.__func__:
+                        return partial(simobj.get_variable, v)
+                    return partial(operator.attrgetter("%s.%s" % (attr, v)),
+                                   simobj)
+            simobjs.extend(reversed(simobj.subSimObjects))
+        return partial(self.get_variable, v)
+
     #---------------------------------------------------------------------------
     def _save_output(self, day):
-        """Appends selected model variables to self._saved_output for this day.
+        """Stores the values of selected model variables for this day in
+        self._output_columns.
         """
         # Switch off the flag for generating output
         self.flag_output = False
 
-        # find current value of variables to are to be saved
-        states = {"day":day}
-        for var in self.mconf.OUTPUT_VARS:
-            states[var] = self.get_variable(var)
-        self._saved_output.append(states)
+        # Resolve the variables after the crop or soil components changed
+        if self._output_slots is None:
+            self._output_slots = [(self._output_columns[var],
+                                   self._get_variable_getter(var))
+                                  for var in self.mconf.OUTPUT_VARS]
+
+        # Extend the columns when the season is longer than expected
+        i = self._n_output
+        if i == self._output_size:
+            for column in self._output_columns.values():
+                column.extend([None]*self._output_size)
+            self._output_size *= 2
+
+        # store current value of variables to are to be saved
+        self._output_columns["day"][i] = day
+        for column, getter in self._output_slots:
+            column[i] = getter()
+        self._n_output = i + 1
 
     #---------------------------------------------------------------------------
     def _save_summary_output(self):
@@ -367,7 +577,7 @@ class Engine(BaseEngine):
         # find current value of variables to are to be saved
         states = {}
         for var in self.mconf.SUMMARY_OUTPUT_VARS:
-            states[var] = self.get_variable(var)
+            states[var] = self._get_variable_getter(var)()
         self._saved_summary_output.append(states)
 
     #---------------------------------------------------------------------------
@@ -405,7 +615,19 @@ class Engine(BaseEngine):
         return increments
 
     def get_output(self):
+        """Returns the output as a list with a dictionary of the output
+        variables for each output day."""
+        names = self._output_columns.keys()
+        columns = self._output_columns.values()
+        for i in range(len(self._saved_output), self._n_output):
+            self._saved_output.append(dict(zip(names, [c[i] for c in columns])))
         return self._saved_output
 
+    def get_output_columns(self):
+        """Returns the output as a dictionary with a list of values for
+        "day" and each output variable."""
+        return dict((var, column[:self._n_output]) for var, column
+                    in self._output_columns.items())
+
     def get_summary_output(self):
         return self._saved_summary_output
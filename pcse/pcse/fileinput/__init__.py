@@ -15,4 +15,4 @@ For reading the new PCSE format use:
 from .cabo_reader import CABOFileReader
 from .cabo_weather import CABOWeatherDataProvider
 from .pcsefilereader import PCSEFileReader
-from hdf5reader import Hdf5WeatherDataProvider
\ No newline at end of file
+from hdf5reader import Hdf5WeatherDataProvider, Hdf5RowReader
\ No newline at end of file
@@ -3,35 +3,20 @@
 # Steven Hoek (steven.hoek@wur.nl), August 2014
 import os
 import time
+from collections import OrderedDict
 
+import numpy as np
 import tables;
-from datetime import datetime;
-from ..exceptions import PCSEError
+from datetime import date, datetime;
+from ..exceptions import PCSEError, WeatherDataProviderError
 from ..geo.gridenvelope2d import GridEnvelope2D;
 from ..base_classes import WeatherDataContainer, WeatherDataProvider;
 
 
-class Hdf5WeatherDataProvider(WeatherDataProvider, GridEnvelope2D):
-    """WeatherDataProvider for using HDF5 files with PCSE
-
-    :param h5fname: filename of HDF5 file containing weather data
-    :param latitude: latitude to request weather data for
-    :param longitude: longitude to request weather data for
-
-    Weather data can efficiently be delivered in the form of files in the HDF5
-    format. In general such data pertain to gridded weather, meaning that they are
-    interpolated for a grid with regular intervals in space and time.
-
-    We assume that the grid conforms to one of the WGS standards with longitude
-    representing the west to east direction and latitudes the north to south
-    direction.
-
-    This class can be uses with different datasets, e.g. having different start year,
-    end year and sometimes different variables for representing the weather.
-
+class _Hdf5GridFile(GridEnvelope2D):
+    """Common functionality for opening a gridded HDF5 weather file and
+    reading its georeference and variable definitions.
     """
-    supports_ensembles = False;
-
     # Some attributes
     hdf5_file = None;
     nrows = 1;
@@ -43,36 +28,6 @@ class Hdf5WeatherDataProvider(WeatherDataProvider, GridEnvelope2D):
     tbl_templ = "";
     variables = [];
 
-    # This WeatherDataProvider reads from HDF5 file. Pickling of data is not necessary!
-    def __init__(self, fname, latitude, longitude, fpath=None):
-        WeatherDataProvider.__init__(self);
-
-        #pdb.set_trace()
-        # Check input and process it
-        if latitude < -90 or latitude > 90:
-            msg = "Latitude should be between -90 and 90 degrees."
-            raise ValueError(msg)
-        if longitude < -180 or longitude > 180:
-            msg = "Longitude should be between -180 and 180 degrees."
-            raise ValueError(msg)
-        self.latitude = float(latitude)
-        self.longitude = float(longitude)
-        msg = "Retrieving weather data from file '" + fname + "' for lat/lon: (%f, %f)."
-        self.logger.debug(msg % (self.latitude, self.longitude))
-
-        # Construct search path and open the file
-        self.hdf5_file = self._get_hdf5_file(fname, fpath);
-
-        # Read attributes, assign them to the envelope and calculate the nearest point
-        self.read_attributes();
-        GridEnvelope2D.__init__(self, self.ncols, self.nrows, self.xll, self.yll, self.cellsize, self.cellsize);
-        self.longitude, self.latitude = self.getNearestCenterPoint(longitude, latitude);
-
-        # Retrieve the records for this location and store them
-        self._get_and_process_hdf5();
-
-        self.close()
-
     def _get_hdf5_file(self, fname, search_path):
         """Find the HDF5 file on given path with given name
         """
@@ -128,6 +83,84 @@ class Hdf5WeatherDataProvider(WeatherDataProvider, GridEnvelope2D):
         else:
             raise PCSEError("HDF5 file not open!");
 
+    def close(self):
+        # Finally close the file
+        if self.hdf5_file:
+            self.hdf5_file.close();
+            self.hdf5_file = None;
+
+
+class Hdf5WeatherDataProvider(WeatherDataProvider, _Hdf5GridFile):
+    """WeatherDataProvider for using HDF5 files with PCSE
+
+    :param h5fname: filename of HDF5 file containing weather data
+    :param latitude: latitude to request weather data for
+    :param longitude: longitude to request weather data for
+    :param rowreader: optional Hdf5RowReader on the same file; if given, the
+        records are taken from the grid rows held by the reader instead of
+        opening the file for this location only.
+
+    Weather data can efficiently be delivered in the form of files in the HDF5
+    format. In general such data pertain to gridded weather, meaning that they are
+    interpolated for a grid with regular intervals in space and time.
+
+    We assume that the grid conforms to one of the WGS standards with longitude
+    representing the west to east direction and latitudes the north to south
+    direction.
+
+    This class can be uses with different datasets, e.g. having different start year,
+    end year and sometimes different variables for representing the weather.
+
+    The records are not converted into a WeatherDataContainer for every day.
+    Instead, they are kept in a structured array indexed by the offset of the
+    day ordinal from the first day. A WeatherDataContainer for a day is only
+    built when it is requested for the first time and it is reused afterwards,
+    so derived variables added by the engine persist as before.
+    """
+    supports_ensembles = False;
+
+    # Structured array with the weather records, a mask of days present in
+    # the file and the WeatherDataContainers that have been handed out.
+    _data = None;
+    _present = None;
+    _containers = None;
+    _first_ordinal = None;
+
+    # This WeatherDataProvider reads from HDF5 file. Pickling of data is not necessary!
+    def __init__(self, fname, latitude, longitude, fpath=None, rowreader=None):
+        WeatherDataProvider.__init__(self);
+
+        #pdb.set_trace()
+        # Check input and process it
+        if latitude < -90 or latitude > 90:
+            msg = "Latitude should be between -90 and 90 degrees."
+            raise ValueError(msg)
+        if longitude < -180 or longitude > 180:
+            msg = "Longitude should be between -180 and 180 degrees."
+            raise ValueError(msg)
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        msg = "Retrieving weather data from file '" + fname + "' for lat/lon: (%f, %f)."
+        self.logger.debug(msg % (self.latitude, self.longitude))
+
+        if rowreader is not None:
+            # The row reader has the file open already and holds the records
+            self._get_and_process_rowreader(rowreader);
+            return
+
+        # Construct search path and open the file
+        self.hdf5_file = self._get_hdf5_file(fname, fpath);
+
+        # Read attributes, assign them to the envelope and calculate the nearest point
+        self.read_attributes();
+        GridEnvelope2D.__init__(self, self.ncols, self.nrows, self.xll, self.yll, self.cellsize, self.cellsize);
+        self.longitude, self.latitude = self.getNearestCenterPoint(longitude, latitude);
+
+        # Retrieve the records for this location and store them
+        self._get_and_process_hdf5();
+
+        self.close()
+
     def _get_and_process_hdf5(self):
         if self.hdf5_file:
             # Get the rows
@@ -149,20 +182,97 @@ class Hdf5WeatherDataProvider(WeatherDataProvider, GridEnvelope2D):
             self.logger.debug("Reading HDF5 took %7.4f seconds" % (t2-t1))
             self.logger.debug("Processing rows took %7.4f seconds" % (t3-t2))
 
-    def _make_WeatherDataContainers(self, recs):
-        # Prepare to loop over all the rows derived from the table
-        for row in recs:
-            row = tuple(row)
-            t = {"LAT": self.latitude, "LON": self.longitude, "ELEV": self.elevation}
-            t["DAY"] = datetime.fromordinal(row[0]).date();
-            t.update(zip(self.variables, row[1:]))
-
-            # Build weather data container from dict 't'
-            wdc = WeatherDataContainer(**t)
-
-            # add wdc to dictionary for this date
-            self._store_WeatherDataContainer(wdc, wdc.DAY)
+    def _get_and_process_rowreader(self, rowreader):
+        # Copy the attributes from the reader and calculate the nearest point
+        for attr in ("ncols", "nrows", "xll", "yll", "cellsize", "NODATA_value",
+                     "variables", "grp_templ", "tbl_templ"):
+            setattr(self, attr, getattr(rowreader, attr));
+        GridEnvelope2D.__init__(self, self.ncols, self.nrows, self.xll, self.yll, self.cellsize, self.cellsize);
+        self.longitude, self.latitude = self.getNearestCenterPoint(self.longitude, self.latitude);
+
+        # Get the records for this location from the row held by the reader
+        k, i = self.getColAndRowIndex(self.longitude, self.latitude);
+        t1 = time.time()
+        rows, self.elevation = rowreader.get_records(k, i);
+        self.description = "Meteo data from HDF5 file " + rowreader.filename;
+        t2 = time.time()
+        self._make_WeatherDataContainers(rows);
+        t3 = time.time()
+        self.logger.debug("Reading HDF5 took %7.4f seconds" % (t2-t1))
+        self.logger.debug("Processing rows took %7.4f seconds" % (t3-t2))
 
+    def _make_WeatherDataContainers(self, recs):
+        # Place the records in an array indexed by the offset of the day
+        # ordinal; days that are missing in the file remain masked.
+        fields = recs.dtype.names;
+        days = recs[fields[0]].astype(np.int64);
+        if len(days) == 0:
+            return
+        self._first_ordinal = int(days.min());
+        ndays = int(days.max()) - self._first_ordinal + 1;
+        offsets = days - self._first_ordinal;
+
+        # Only keep the variables known to the WeatherDataContainer
+        slots = set(WeatherDataContainer.__slots__);
+        columns = [(fld, var) for fld, var in zip(fields[1:], self.variables)
+                   if var in slots]
+        unknown = [var for var in self.variables if var not in slots]
+        if unknown:
+            msg = "WeatherDataContainer: unknown keywords '%s' are ignored!"
+            self.logger.warning(msg, unknown)
+
+        self._data = np.zeros(ndays, dtype=[(var, np.float64) for _, var in columns]);
+        for fld, var in columns:
+            self._data[var][offsets] = recs[fld];
+        self._present = np.zeros(ndays, dtype=bool);
+        self._present[offsets] = True;
+        self._containers = [None] * ndays;
+
+    def _get_WeatherDataContainer(self, i):
+        # Build the container directly from the array; the values have been
+        # checked when loading so the keyword checking in __init__ is skipped
+        wdc = WeatherDataContainer.__new__(WeatherDataContainer);
+        wdc.LAT = self.latitude;
+        wdc.LON = self.longitude;
+        wdc.ELEV = float(self.elevation);
+        wdc.DAY = date.fromordinal(self._first_ordinal + i);
+        for var, value in zip(self._data.dtype.names, self._data[i].tolist()):
+            setattr(wdc, var, value);
+        self._containers[i] = wdc;
+        return wdc
+
+    def __call__(self, day, member_id=0):
+        if member_id != 0:
+            msg = "Retrieving ensemble weather is not supported by %s" % self.__class__.__name__
+            raise WeatherDataProviderError(msg);
+
+        keydate = self.check_keydate(day);
+        if self._data is not None:
+            i = keydate.toordinal() - self._first_ordinal;
+            if 0 <= i < len(self._containers):
+                wdc = self._containers[i];
+                if wdc is not None:
+                    return wdc
+                if self._present[i]:
+                    return self._get_WeatherDataContainer(i)
+        msg = "No weather data for %s." % keydate
+        raise WeatherDataProviderError(msg);
+
+    @property
+    def first_date(self):
+        if self._first_ordinal is None:
+            return None
+        return date.fromordinal(self._first_ordinal)
+
+    @property
+    def last_date(self):
+        if self._first_ordinal is None:
+            return None
+        return date.fromordinal(self._first_ordinal + len(self._present) - 1)
+
+    @property
+    def missing(self):
+        return int(len(self._present) - self._present.sum())
 
     def _find_cache_file(self, longitude, latitude):
         """Try to find a cache file for given latitude/longitude.
@@ -192,10 +302,74 @@ class Hdf5WeatherDataProvider(WeatherDataProvider, GridEnvelope2D):
         """
         raise NotImplementedError("Method not applicable for " + str(self.__class__.__name__));
 
-    def close(self):
-        # Finally close the file
-        if self.hdf5_file:
-            self.hdf5_file.close();
-            self.hdf5_file = None;
 
+class Hdf5RowReader(_Hdf5GridFile):
+    """Reads the weather data of the HDF5 file per row of the grid
+
+    :param fname: filename of HDF5 file containing weather data
+    :param fpath: optional path where to search for the file
+    :param max_rows: the number of grid rows to keep in memory
+
+    The weather data for a row of the grid (one latitude) are stored as tables
+    in a single group of the HDF5 file. The row reader keeps the file open
+    and reads all tables of such a group at once when the first cell of the
+    row is requested. The most recently used rows are kept in memory so that
+    subsequent cells on the same row do not need to touch the file again.
+    Pass the reader to Hdf5WeatherDataProvider to obtain the weather for a
+    single cell::
+
+        >>> reader = Hdf5RowReader("AgMERRA.hdf5", max_rows=2)
+        >>> wdp = Hdf5WeatherDataProvider("AgMERRA.hdf5", lat, lon,
+        ...                               rowreader=reader)
+        >>> reader.close()
+    """
+
+    def __init__(self, fname, fpath=None, max_rows=2):
+        if max_rows < 1:
+            msg = "Number of rows to keep in memory should be >= 1, got %s"
+            raise PCSEError(msg % max_rows);
+        self.max_rows = max_rows;
+        self._rows = OrderedDict();
+        self.hdf5_file = self._get_hdf5_file(fname, fpath);
+        self.filename = self.hdf5_file.filename;
+        self.read_attributes();
+        GridEnvelope2D.__init__(self, self.ncols, self.nrows, self.xll, self.yll, self.cellsize, self.cellsize);
+
+    def get_records(self, k, i):
+        """Returns the records and the elevation for the cell in column k
+        of row i. Raises tables.NoSuchNodeError when the file does not hold
+        data for the given cell.
+        """
+        row = self._get_row(i);
+        name = self.tbl_templ % k;
+        if name not in row:
+            msg = "No table '%s' in group '%s'" % (name, self.grp_templ % i)
+            raise tables.NoSuchNodeError(msg);
+        return row[name];
+
+    def _get_row(self, i):
+        if i in self._rows:
+            # Move the row to the end to mark it as most recently used
+            row = self._rows.pop(i);
+            self._rows[i] = row;
+            return row
+
+        if not self.hdf5_file:
+            raise PCSEError("HDF5 file not open!");
+
+        # Read all tables in the group at once
+        f = self.hdf5_file;
+        grp = f.get_node(f.root, self.grp_templ % i);
+        row = {};
+        for tbl in f.iter_nodes(grp, classname="Table"):
+            row[tbl._v_name] = (tbl.read(), tbl._v_attrs.elevation);
 
+        # Evict the least recently used row(s)
+        while len(self._rows) >= self.max_rows:
+            self._rows.popitem(last=False);
+        self._rows[i] = row;
+        return row
+
+    def close(self):
+        self._rows.clear();
+        _Hdf5GridFile.close(self);
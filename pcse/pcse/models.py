@@ -68,8 +68,8 @@ class _Wofost71Base(Engine):
             raise exc.PCSEError(msg)
 
         # Merge records with output ad summary_output variables with the run_id
-        recs_output = [merge_dict(rec, runid) for rec in self._saved_output]
-        recs_summary_output = [merge_dict(rec, runid) for rec in self._saved_summary_output]
+        recs_output = [merge_dict(rec, runid) for rec in self.get_output()]
+        recs_summary_output = [merge_dict(rec, runid) for rec in self.get_summary_output()]
 
         table_sim_results_ts = sa.Table('sim_results_timeseries', metadata,
                                         autoload=True)
@@ -113,7 +113,7 @@ class _Wofost71Base(Engine):
         msg += sep
 
         # Find variables available in daily records
-        if len(self._saved_output) == 0:
+        if len(self.get_output()) == 0:
             print "No simulation results available yet."
             return
 
@@ -125,7 +125,7 @@ class _Wofost71Base(Engine):
         tmsg += header
         msg += tmsg
 
-        for rec in self._saved_output:
+        for rec in self.get_output():
             tmsg = "%8s" % rec["day"]
             for varname in self.mconf.OUTPUT_VARS:
                 value = rec[varname]
@@ -32,6 +32,19 @@ METEO_CACHE_DIR = _os.path.join(PCSE_USER_HOME, "meteo_cache")
 # You can disable this behaviour for increased performance.
 ZEROFY = False
 
+# State and rate variables are stored in traits which validate every assignment
+# and which notify the VariableKiosk on changes of published variables. For
+# production runs you can use classes with __slots__ instead that validate
+# only when the states/rates are initialized. Assignments to undefined or
+# locked variables will then no longer be prevented.
+FAST_STATES_RATES = False
+
+# Before the crop is started only the soil is simulated. On those days the
+# Engine skips the timer, agromanagement and output checks until the next
+# management action and runs the soil component in a loop of its own, with
+# identical results.
+FAST_CROP_FREE_DAYS = True
+
 # Configuration of logging
 # The logging system of PCSE consists of two log handlers. One that sends log messages
 # to the screen ('console') and one that sends message to a file. The location and name of
@@ -13,9 +13,10 @@ positional or keyword arguments. However, it is highly discouraged to use
 positional arguments when sending signals in order to avoid conflicts between
 positional and keyword arguments.
 
-An example can help to clarify
-how signals are used in PyWOFOST but check also the documentation of the
-PyDispatcher_ package for more information::
+Signals are delivered by the SignalDispatcher of the VariableKiosk, so only
+SimulationObjects sharing a kiosk receive each others signals. The handling
+of arguments follows the PyDispatcher_ package. An example can help to clarify
+how signals are used in PyWOFOST::
 
     import sys, os
     import math
@@ -4,14 +4,20 @@
 """Python implementations of the WOFOST waterbalance modules for simulation
 of potential production (`WaterbalancePP`) and water-limited production
 (`WaterbalanceFD`)under freely draining conditions.
+
+`CropFreeTrajectory` holds the daily states of `WaterbalanceFD` without a
+crop, to be shared by the crop simulations for the same site.
 """
+import datetime
 from math import sqrt
 
+import numpy as np
+
 from ..traitlets import Float, Int, Instance, Enum, Unicode, Bool
 from ..decorators import prepare_rates, prepare_states
 from ..util import limit, Afgen, merge_dict
 from ..base_classes import ParamTemplate, StatesTemplate, RatesTemplate, \
-     SimulationObject
+     SimulationObject, VariableKiosk
 from .. import signals
 from .. import exceptions as exc
 from .snowmaus import SnowMAUS
@@ -61,6 +67,15 @@ class WaterbalancePP(SimulationObject):
     @prepare_states
     def integrate(self, day):
         self.states.SM = self.params.SMFCF
+
+    def run_crop_free(self, days, drvs):
+        """Simulates the given days without a crop, equivalent to flushing
+        the kiosk and calling `integrate()` and `calc_rates()` for each day.
+        """
+        self.kiosk.flush_states()
+        self.integrate(days[-1])
+        self.kiosk.flush_rates()
+        self.calc_rates(days[-1], drvs[-1])
         
 
 class WaterbalanceFD(SimulationObject):
@@ -506,6 +521,161 @@ class WaterbalanceFD(SimulationObject):
         # save rooting depth
         self.RDold = RD
 
+    # Order of the values of get_crop_free_state()
+    _crop_free_states = ("SM", "SS", "W", "WI", "WLOW", "WLOWI", "WWLOW",
+                         "WTRAT", "EVST", "EVWT", "TSR", "RAINT", "WDRT",
+                         "TOTINF", "TOTIRR", "PERCT", "LOSST", "WBALRT",
+                         "WBALTT")
+    _crop_free_rates = ("EVS", "EVW", "WTRA", "RAIN", "RIN", "RIRR", "PERC",
+                        "LOSS", "DW", "DWLOW")
+
+    def run_crop_free(self, days, drvs):
+        """Simulates the given days without a crop, equivalent to flushing
+        the kiosk and calling `integrate()` and `calc_rates()` for each day.
+
+        The state and rate variables are kept in local variables during the
+        loop and are assigned once at the end, see `iter_crop_free()`.
+        """
+        # The first day after a crop is finished the rootzone is reset
+        i = 0
+        while i < len(days) and not self.is_crop_free():
+            self.kiosk.flush_states()
+            self.integrate(days[i])
+            self.kiosk.flush_rates()
+            self.calc_rates(days[i], drvs[i])
+            i += 1
+        if i == len(days):
+            return
+
+        for state in self.iter_crop_free(drvs[i:]):
+            pass
+        self.set_crop_free_state(state)
+
+    def is_crop_free(self):
+        """Returns True if the rootzone is at its initial depth without a
+        crop, which is required by `iter_crop_free()`."""
+        return not (self.in_crop_cycle or self.rooted_layer_needs_reset or
+                    self.RDold != self.params.RDI or "RD" in self.kiosk or
+                    "TRA" in self.kiosk)
+
+    def iter_crop_free(self, drvs):
+        """Simulates the days of the driving variables drvs without a crop and
+        yields the values of get_crop_free_state() at the end of each day.
+
+        The calculations are the same as in `integrate()` and `calc_rates()`
+        with the rooting depth fixed at its initial value and no
+        transpiration, see `is_crop_free()`. The state of this object is not
+        changed, use `set_crop_free_state()` for that.
+        """
+        s = self.states
+        r = self.rates
+        p = self.params
+        SM, SS, W, WLOW = s.SM, s.SS, s.W, s.WLOW
+        WTRAT, EVST, EVWT, TSR = s.WTRAT, s.EVST, s.EVWT, s.TSR
+        RAINT, TOTINF, TOTIRR = s.RAINT, s.TOTINF, s.TOTIRR
+        PERCT, LOSST = s.PERCT, s.LOSST
+        WI, WLOWI, WDRT, WBALRT, WBALTT = s.WI, s.WLOWI, s.WDRT, s.WBALRT, s.WBALTT
+        EVS, EVW, WTRA, RAIN, RIN = r.EVS, r.EVW, r.WTRA, r.RAIN, r.RIN
+        RIRR, PERC, LOSS, DW, DWLOW = r.RIRR, r.PERC, r.LOSS, r.DW, r.DWLOW
+        DSLR = self.DSLR
+        RINold = self.RINold
+        RD = p.RDI
+        RDM = self.RDM
+        SMFCF, SM0, SOPE, KSUB, K0 = p.SMFCF, p.SM0, p.SOPE, p.KSUB, p.K0
+        SSMAX, IFUNRN, NOTINF = p.SSMAX, p.IFUNRN, p.NOTINF
+        for drv in drvs:
+            # State integration, see integrate()
+            WTRAT += WTRA
+            EVWT += EVW
+            EVST += EVS
+            RAINT  += RAIN
+            TOTINF += RIN
+            TOTIRR += RIRR
+            SSPRE = SS + (RAIN + RIRR -EVW - RIN)
+            SS  = min(SSPRE, SSMAX)
+            TSR += (SSPRE - SS)
+            W_NEW = W + DW
+            if (W_NEW < 0.0):
+                EVST += W_NEW
+                W = 0.0
+            else:
+                W = W_NEW
+            PERCT += PERC
+            LOSST += LOSS
+            WLOW += DWLOW
+            SM = W/RD
+
+            # Rate calculation, see calc_rates()
+            RIRR = 0.
+            RAIN = drv.RAIN
+            WTRA = 0.
+            EVSMX = drv.ES0
+            EVW = 0.
+            if SS > 1.:
+                EVS = EVSMX
+            elif RINold >= 1:
+                EVS = EVSMX
+                DSLR = 1.
+            else:
+                DSLR += 1
+                EVSMXT = EVSMX*(sqrt(DSLR) - sqrt(DSLR-1))
+                EVS = min(EVSMX, EVSMXT + RINold)
+            if SS < 0.1:
+                if (IFUNRN == 0):
+                    RINPRE = (1. - NOTINF)*drv.RAIN + RIRR + SS
+                else:
+                    RINPRE = (1. - NOTINF*self.NINFTB(drv.RAIN)) * drv.RAIN + \
+                             RIRR + SS
+            else:
+                AVAIL = SS + (drv.RAIN * (1.-NOTINF)) + RIRR - EVW
+                RINPRE = min(SOPE, AVAIL)
+            WE = SMFCF * RD
+            PERC1 = limit(0., SOPE, (W - WE) - WTRA - EVS)
+            WELOW = SMFCF * (RDM - RD)
+            LOSS  = limit(0., KSUB, (WLOW - WELOW + PERC1))
+            if (p.IAIRDU == 1):
+                LOSS = min(LOSS, K0/20.)
+            PERC2 = ((RDM -RD) * SM0 - WLOW) + LOSS
+            PERC  = min(PERC1,PERC2)
+            RIN = min(RINPRE, (SM0 - SM)*RD + WTRA + EVS + PERC)
+            RINold = RIN
+            DW    = RIN - WTRA - EVS - PERC
+            DWLOW = PERC - LOSS
+
+            yield (SM, SS, W, WI, WLOW, WLOWI, W + WLOW, WTRAT, EVST, EVWT, TSR,
+                   RAINT, WDRT, TOTINF, TOTIRR, PERCT, LOSST, WBALRT, WBALTT,
+                   EVS, EVW, WTRA, RAIN, RIN, RIRR, PERC, LOSS, DW, DWLOW,
+                   DSLR, RINold, RD)
+
+    def get_crop_free_state(self):
+        """Returns the values of the state and rate variables, DSLR, RINold
+        and RDold as a tuple."""
+        s = self.states
+        r = self.rates
+        return (tuple(getattr(s, name) for name in self._crop_free_states) +
+                tuple(getattr(r, name) for name in self._crop_free_rates) +
+                (self.DSLR, self.RINold, self.RDold))
+
+    def set_crop_free_state(self, values):
+        """Assigns values as returned by `get_crop_free_state()` or
+        `iter_crop_free()`, the published variables are updated in the kiosk
+        after flushing it as after the rate calculation of a day."""
+        s = self.states
+        r = self.rates
+        nstates = len(self._crop_free_states)
+        nrates = len(self._crop_free_rates)
+        self.kiosk.flush_states()
+        s.unlock()
+        for name, value in zip(self._crop_free_states, values[:nstates]):
+            setattr(s, name, value)
+        s.lock()
+        self.kiosk.flush_rates()
+        r.unlock()
+        for name, value in zip(self._crop_free_rates, values[nstates:]):
+            setattr(r, name, value)
+        r.lock()
+        self.DSLR, self.RINold, self.RDold = values[nstates + nrates:]
+
     @prepare_states
     def finalize(self, day):
         
@@ -603,3 +773,111 @@ class WaterbalanceFDSnow(SimulationObject):
     def integrate(self, day):
         self.waterbalance.integrate(day)
         self.snowcover.integrate(day)
+
+
+class CropFreeTrajectory(object):
+    """Daily states of `WaterbalanceFD` without a crop from start_date onward.
+
+    Without a crop, the water balance depends only on the weather and on the
+    soil, site and rooting parameters, see `get_key()`, so the trajectory can
+    be simulated once and shared by all crops with the same parameters. The
+    Engine restores the state of its soil component from the trajectory on
+    the days before the crop is started instead of simulating them, see
+    `Engine.soil_trajectory`. The trajectory is simulated up to the days
+    that are requested.
+
+    The soil state at the crop start results from simulating the soil since
+    start_date, so the results equal those of simulating the season only
+    when start_date is the START_DATE of the season.
+
+    :param start_date: first day of the trajectory
+    :param cropdata: dictionary with WOFOST cropdata key/value pairs
+    :param soildata: dictionary with WOFOST soildata key/value pairs
+    :param sitedata: dictionary with WOFOST sitedata key/value pairs
+    :param weatherdataprovider: WeatherDataProvider for the site, only RAIN,
+        E0 and ES0 are used. Later days are simulated with the provider
+        passed to `get_state()` and `restore()`.
+    """
+
+    def __init__(self, start_date, cropdata, soildata, sitedata,
+                 weatherdataprovider):
+        self.start_date = start_date
+        self.key = self.get_key(cropdata, soildata, sitedata)
+        self._soil = WaterbalanceFD(start_date, VariableKiosk(), dict(cropdata),
+                                    dict(soildata), dict(sitedata))
+        self._soil.calc_rates(start_date, weatherdataprovider(start_date))
+        state = self._soil.get_crop_free_state()
+        self._values = np.zeros((366, len(state)))
+        self._values[0] = state
+        self._ndays = 1
+
+    @staticmethod
+    def get_key(cropdata, soildata, sitedata):
+        """Returns the values of the parameters of `WaterbalanceFD` in the
+        inputs as a tuple, trajectories with the same key and start_date are
+        identical for the same weather.
+
+        The maximum rooting depth of the crop RDMCR only enters the key
+        through the maximum rooting depth of the water balance, so crops
+        that differ only in RDMCR beyond the rootable depth of the soil
+        share the key.
+        """
+        key = []
+        for name in sorted(WaterbalanceFD.Parameters.class_trait_names()):
+            if name == "RDMCR":
+                value = max(cropdata["RDI"],
+                            min(soildata["RDMSOL"], cropdata["RDMCR"]))
+            elif name in sitedata:
+                value = sitedata[name]
+            elif name in soildata:
+                value = soildata[name]
+            else:
+                value = cropdata[name]
+            key.append(value)
+        return tuple(key)
+
+    @staticmethod
+    def _get_parameters(soil):
+        return [soil.RDM if name == "RDMCR" else getattr(soil.params, name)
+                for name in sorted(WaterbalanceFD.Parameters.class_trait_names())]
+
+    def _extend(self, ndays, weatherdataprovider):
+        """Simulates the trajectory up to ndays days."""
+        if ndays > len(self._values):
+            size = max(ndays, 2*len(self._values))
+            values = np.zeros((size, self._values.shape[1]))
+            values[:self._ndays] = self._values[:self._ndays]
+            self._values = values
+        wdp = weatherdataprovider
+        day = self.start_date + datetime.timedelta(days=self._ndays - 1)
+        drvs = [wdp(day + datetime.timedelta(days=i))
+                for i in range(1, ndays - self._ndays + 1)]
+        i = self._ndays
+        for state in self._soil.iter_crop_free(drvs):
+            self._values[i] = state
+            i += 1
+        self._soil.set_crop_free_state(self._values[i-1].tolist())
+        self._ndays = ndays
+
+    def get_state(self, day, weatherdataprovider):
+        """Returns the values of `WaterbalanceFD.get_crop_free_state()` at the
+        end of day, simulating the days that are missing with the weather of
+        weatherdataprovider."""
+        i = (day - self.start_date).days
+        if i < 0:
+            msg = "Day %s before start of crop-free soil trajectory (%s)."
+            raise exc.PCSEError(msg % (day, self.start_date))
+        if i >= self._ndays:
+            self._extend(i + 1, weatherdataprovider)
+        return tuple(self._values[i].tolist())
+
+    def restore(self, soil, day, weatherdataprovider):
+        """Sets the state of the WaterbalanceFD instance soil to the state of
+        the trajectory at the end of day, see `get_state()`."""
+        if not isinstance(soil, WaterbalanceFD):
+            msg = "Crop-free soil trajectory only applies to WaterbalanceFD."
+            raise exc.PCSEError(msg)
+        if self._get_parameters(soil) != self._get_parameters(self._soil):
+            msg = "Soil parameters differ from those of crop-free trajectory."
+            raise exc.PCSEError(msg)
+        soil.set_crop_free_state(self.get_state(day, weatherdataprovider))
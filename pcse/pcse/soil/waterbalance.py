@@ -11,10 +11,22 @@ from ..pydispatch import dispatcher
 from ..traitlets import Float, Int, Instance, Enum, Unicode, Bool, AfgenTrait
 from ..decorators import prepare_rates, prepare_states
 from math import log10, sqrt, exp
-from ..util import limit, Afgen, merge_dict
+from ..util import limit, Afgen, FastAfgen, BatchAfgen, merge_dict
 from ..base_classes import ParamTemplate, StatesTemplate, RatesTemplate, \
     SimulationObject
 from .. import signals
+from .. import exceptions as exc
+
+# Constants for the capillary rise from the groundwater in _SUBSOL: standard
+# pF values of the Gaussian points of the integration intervals of the matric
+# head that start at SUBSOL_START and the 3-point Gaussian points and weights
+ELOG10 = 2.302585
+LOGST4 = 2.518514
+SUBSOL_START = np.array([0., 45., 170., 330.])
+PFSTAN = np.array([0.705143, 1.352183, 1.601282, 1.771497, 2.031409,
+                   2.192880, 2.274233, 2.397940, 2.494110])
+SUBSOL_PGAU = np.array([0.1127016654, 0.5, 0.8872983346])
+SUBSOL_WGAU = np.array([0.2777778, 0.4444444, 0.2777778])
 
 
 def zeros(n):
@@ -67,6 +79,8 @@ class WaterbalanceLayered(SimulationObject):
 
     EquilTableLEN = Int(30)             # GW: WaterFromHeight, HeightFromAir
     MaxFlowIter = Int(50)
+    TinyFlow    = Float(0.001)          # accuracy of the flow iterations
+    UpwardFlowLimit = Float(0.2)        # fraction of amount for equilibrium
     
     # Fraction of non-infiltrating rainfall as function of storm size
     NINFTB = Instance(Afgen)
@@ -219,6 +233,13 @@ class WaterbalanceLayered(SimulationObject):
         
         p = self.params
         
+        # layer properties and soil type tables as arrays over the layers
+        self._init_layers()
+        TSL  = self._TSL
+        LBSL = self._LBSL
+        SM0  = self._SM0
+        SMW  = self._SMW
+
         # ------ checks ------
         RD = p.RDI
         #classic: RDM = max(p.RDI, min(p.RDMSOL, p.RDMCR))
@@ -231,36 +252,31 @@ class WaterbalanceLayered(SimulationObject):
                    (RD, RDM))
             raise exc.WaterBalanceError(msg)
 
-        RDMFND = False
-        for il in range (0, p.NSL):
-            if abs(p.SOIL_LAYERS[il]['LBSL'] - RDM) < 0.01:
-                RDMFND = True
-                # layer boundary explicitly assigned to maximum rooting depth
-                self.RDMSLB = p.SOIL_LAYERS[il]['LBSL']
-
+        # layer boundary explicitly assigned to maximum rooting depth, this
         # also guarantees that RDM is within the layered part of the soil
-        if not RDMFND:
+        RDMFND = np.flatnonzero(abs(LBSL - RDM) < 0.01)
+        if len(RDMFND) == 0:
             msg = ("Maximum rooting depth (RDM) %f does not coincide " +
-                   "with a layer boundary in soil profile" % RDM)
+                   "with a layer boundary in soil profile") % RDM
             raise exc.WaterBalanceError(msg)
+        self.RDMSLB = LBSL[RDMFND[-1]]
             
         # in case of groundwater the reference depth XDEF should be below the layered soil
         if p.GW:
-            if self.XDEF <= p.SOIL_LAYERS[p.NSL-1]['LBSL']:
+            if self.XDEF <= LBSL[-1]:
                 msg = ("Reference depth XDEF (%f cm) must be below the " +
-                       "bottom of the soil layers" % self.XDEF)
+                       "bottom of the soil layers") % self.XDEF
                 raise exc.WaterBalanceError(msg)
         # --- end of checks ---
 
         # find deepest layer with roots
-        ILR = p.NSL-1
-        ILM = p.NSL-1
-        for il in range(p.NSL-1, -1, -1):
-            if (p.SOIL_LAYERS[il]['LBSL'] >= RD ):         ILR = il
-            if (p.SOIL_LAYERS[il]['LBSL'] >= self.RDMSLB): ILM = il
+        ILR, ILM = self._find_layers(RD)
 
         # calculate layer weight for RD-rooted layer and RDM-rooted layer
         self._layer_weights(RD, self.RDMSLB, ILR, ILM)
+        Wtop = self._Wtop
+        Wpot = self._Wpot
+        Wund = self._Wund
         # --- end of soil input section ---
 
         # save old rooting depth (for testing on growth in integration)
@@ -269,50 +285,40 @@ class WaterbalanceLayered(SimulationObject):
         SS = p.SSI                  # Initial surface storage
 
         # state variables set initially by self.StateVariables     
-        W      = 0.0
-        WAVUPP = 0.0
-        WLOW   = 0.0
-        WAVLOW = 0.0
-        WBOT   = 0.0
         if p.GW:
             # calculate initial soil moisture
             ZT = limit(0.1, self.XDEF, p.ZTI)       # initial groundwater level
             if p.DD > 0.:                           # IDRAIN==1 ???
                 ZT = max(ZT, p.DD)                  # corrected for drainage depth
 
-            #for the soil layers   
-            for il in range (0, p.NSL):
-                HH = p.SOIL_LAYERS[il]['LBSL'] - p.SOIL_LAYERS[il]['TSL'] / 2.0   # depth at half-layer-height
-                if p.SOIL_LAYERS[il]['LBSL'] - ZT < 0.0:
-                    # layer is above groundwater ; get equilibrium amount from Half-Height pressure head
-                    p.SOIL_LAYERS[il]['SM'] = p.SOIL_LAYERS[il]['SOILTYPE']['SMTAB'](log10(ZT-HH))
-                elif p.SOIL_LAYERS[il]['LBSL']-p.SOIL_LAYERS[il]['TSL'] >= ZT:
-                    # layer completely in groundwater
-                    p.SOIL_LAYERS[il]['SM'] = p.SOIL_LAYERS[il]['SOILTYPE']['SM0']
-                else:
-                    # layer partly in groundwater
-                    p.SOIL_LAYERS[il]['SM'] = (p.SOIL_LAYERS[il]['LBSL']-ZT)*p.SOIL_LAYERS[il]['SOILTYPE']['SM0'] \
-                                                + p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](ZT-(p.SOIL_LAYERS[il]['LBSL']-p.SOIL_LAYERS[il]['TSL']) \
-                                                ) / p.SOIL_LAYERS[il]['TSL']
+            # for the soil layers, layers completely in groundwater are
+            # saturated
+            SM = SM0.copy()
+            # layers above groundwater ; get equilibrium amount from Half-Height pressure head
+            il = np.flatnonzero(LBSL - ZT < 0.0)
+            HH = LBSL[il] - TSL[il] / 2.0   # depth at half-layer-height
+            SM[il] = self._stack_tables("SMTAB")(np.log10(ZT-HH), il)
+            # layer partly in groundwater
+            il = np.flatnonzero((LBSL - ZT >= 0.0) & (LBSL - TSL < ZT))
+            SM[il] = (LBSL[il]-ZT)*SM0[il] \
+                     + self._WaterFromHeight(ZT-(LBSL[il]-TSL[il]), il) / TSL[il]
 
             # calculate (available) water in rooted and potentially rooted zone
             # note that amounts WBOT below RDM (RDMSLB) are not available (below potential rooting depth)
-            for il in range (0, p.NSL):
-                W      += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wtop']
-                WLOW   += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
-                WBOT   += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wund']
-                # available water
-                WAVUPP += (p.SOIL_LAYERS[il]['SM']-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) \
-                            * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wtop']
-                WAVLOW += (p.SOIL_LAYERS[il]['SM']-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) \
-                            * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
+            WC  = SM * TSL
+            WAV = (SM - SMW) * TSL
+            W      = np.dot(WC, Wtop)
+            WLOW   = np.dot(WC, Wpot)
+            WBOT   = np.dot(WC, Wund)
+            WAVUPP = np.dot(WAV, Wtop)
+            WAVLOW = np.dot(WAV, Wpot)
 
             # now various subsoil amonts
-            WSUB0 = (self.XDEF-p.SOIL_LAYERS[p.NSL-1]['LBSL']) * p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['SM0']  # saturation
-            if ZT > p.SOIL_LAYERS[p.NSL-1]['LBSL']:
+            bottom = self._soiltypes[-1]
+            WSUB0 = (self.XDEF-LBSL[-1]) * SM0[-1]  # saturation
+            if ZT > LBSL[-1]:
                 # groundwater below layered system
-                WSUB = (self.XDEF-ZT)*p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['SM0'] \
-                        + p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['WaterFromHeight'](ZT-p.SOIL_LAYERS[p.NSL-1]['LBSL'])
+                WSUB = (self.XDEF-ZT)*SM0[-1] + bottom['WaterFromHeight'](ZT-LBSL[-1])
             else:
                 # saturated subsoil
                 WSUB = WSUB0
@@ -324,41 +330,28 @@ class WaterbalanceLayered(SimulationObject):
         else: # not GW
             # AVMAX - maximum available content of layer(s)
             # to get an even distribution of water in the rooted top if WAV is small.
-            AVMAX  = np.zeros(p.NSL)
-            TOPRED = Instance(Float)
-            LOWRED = Instance(Float)
-            SML    = Instance(Float)
-            TOPLIM = 0.0
-            LOWLIM = 0.0
-            for il in range (0, ILM+1):
-                # determine maximum content for this layer
-                if il <= ILR:
-                    # in the rooted zone a separate limit applies
-                    SML = p.SMLIM
-                    SML = limit(p.SOIL_LAYERS[il]['SOILTYPE']['SMW'], p.SOIL_LAYERS[il]['SOILTYPE']['SM0'], SML)
-                    
-                    # Check whether SMLIM is within boundaries
-                    if p.IAIRDU == 1: # applicable only for flooded rice crops
-                        SML = p.SOIL_LAYERS[il]['SOILTYPE']['SM0']
-                        
-                    # notify user of changes in SMLIM
-                    if SML != p.SMLIM:
-                        msg = "SMLIM not in valid range, changed from %f to %f."
-                        self.logger.warn(msg % (p.SMLIM, SML))
-
-                    AVMAX[il] = (SML-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) * p.SOIL_LAYERS[il]['TSL']   # available in cm  
-                    # also if partly rooted, the total layer capacity counts in TOPLIM
-                    # this means the water content of layer ILR is set as if it would be
-                    # completely rooted. This water will become available after a little
-                    # root growth and through numerical mixing each time step.
-                    TOPLIM = TOPLIM + AVMAX[il]
-                else:
-                    # below the rooted zone the maximum is saturation (see code for WLOW in one-layer model)
-                    # again the full layer capacity adds to LOWLIM. 
-                    SML = p.SOIL_LAYERS[il]['SOILTYPE']['SM0']
-
-                    AVMAX[il] = (SML-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) * p.SOIL_LAYERS[il]['TSL']   # available in cm  
-                    LOWLIM += AVMAX[il]
+            # Below the rooted zone the maximum is saturation (see code for
+            # WLOW in one-layer model), in the rooted zone a separate limit
+            # applies.
+            SML = SM0.copy()
+            if p.IAIRDU != 1: # SM0 applicable only for flooded rice crops
+                # Check whether SMLIM is within boundaries
+                SML[:ILR+1] = np.clip(p.SMLIM, SMW[:ILR+1], SM0[:ILR+1])
+
+            # notify user of changes in SMLIM
+            for il in np.flatnonzero(SML[:ILR+1] != p.SMLIM):
+                msg = "SMLIM not in valid range, changed from %f to %f."
+                self.logger.warn(msg % (p.SMLIM, SML[il]))
+
+            AVMAX = (SML-SMW) * TSL     # available in cm
+            AVMAX[ILM+1:] = 0.0
+            # also if partly rooted, the total layer capacity counts in TOPLIM
+            # this means the water content of layer ILR is set as if it would be
+            # completely rooted. This water will become available after a little
+            # root growth and through numerical mixing each time step.
+            # Again the full layer capacity adds to LOWLIM. 
+            TOPLIM = AVMAX[:ILR+1].sum()
+            LOWLIM = AVMAX[ILR+1:].sum()
 
             if p.WAV <= 0.0:
                 # no available water
@@ -379,34 +372,24 @@ class WaterbalanceLayered(SimulationObject):
                 TOPRED = 1.0
                 LOWRED = 1.0
 
-            # within rootzone
-            for il in range (0, ILR+1):
-                # Part of the water assigned to ILR may not actually be in the rooted zone, but it will
-                # be available shortly through root growth (and through numerical mixing).
-                p.SOIL_LAYERS[il]['SM'] = p.SOIL_LAYERS[il]['SOILTYPE']['SMW'] + AVMAX[il] * TOPRED /p.SOIL_LAYERS[il]['TSL']
-                
-                W      += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wtop']
-                WLOW   += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
-                # available water
-                WAVUPP += (p.SOIL_LAYERS[il]['SM']-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) \
-                            * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wtop']
-                WAVLOW += (p.SOIL_LAYERS[il]['SM']-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) \
-                            * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
-
-            # between initial and maximum rooting depth. In case RDM is not a layer boundary (it should be!!)
-            # layer ILM contains additional water in unrooted part. Only rooted part contributes to WAV.
-            for il in range (ILR+1, ILM+1):
-                p.SOIL_LAYERS[il]['SM'] = p.SOIL_LAYERS[il]['SOILTYPE']['SMW'] + \
-                                        AVMAX[il] * LOWRED / p.SOIL_LAYERS[il]['TSL']
-                
-                WLOW += p.SOIL_LAYERS[il]['SM'] * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
-                # available water
-                WAVLOW += (p.SOIL_LAYERS[il]['SM']-p.SOIL_LAYERS[il]['SOILTYPE']['SMW']) \
-                            * p.SOIL_LAYERS[il]['TSL'] * p.SOIL_LAYERS[il]['Wpot']
-
-            # below the maximum rooting depth
-            for il in range (ILM+1, p.NSL):
-                p.SOIL_LAYERS[il]['SM'] = p.SOIL_LAYERS[il]['SOILTYPE']['SMW']
+            # Within rootzone part of the water assigned to ILR may not
+            # actually be in the rooted zone, but it will be available shortly
+            # through root growth (and through numerical mixing).
+            # Between initial and maximum rooting depth. In case RDM is not a
+            # layer boundary (it should be!!) layer ILM contains additional
+            # water in unrooted part. Only rooted part contributes to WAV.
+            # Below the maximum rooting depth AVMAX is zero.
+            RED = np.empty(p.NSL)
+            RED[:ILR+1] = TOPRED
+            RED[ILR+1:] = LOWRED
+            SM = SMW + AVMAX * RED / TSL
+
+            WC  = SM * TSL
+            WAV = (SM - SMW) * TSL
+            W      = np.dot(WC, Wtop)
+            WLOW   = np.dot(WC, Wpot)
+            WAVUPP = np.dot(WAV, Wtop)
+            WAVLOW = np.dot(WAV, Wpot)
 
             # set groundwater depth far away for clarity ; this prevents also
             # the root routine to stop root growth when they reach the groundwater
@@ -426,31 +409,26 @@ class WaterbalanceLayered(SimulationObject):
                                            (p.SMLIM, self.RDMSLB, p.WAV, p.SSMAX)
             
         # water content for each layer + a few fixed points often used
+        self._SM[:] = SM
+        self._WC[:] = SM * TSL                  # state variable
+        self._WC0   = SM0 * TSL
+        self._WCW   = SMW * TSL
+        self._WCFC  = self._SMFCF * TSL
+        self._CondFC = np.power(10.0, self._CONTAB(np.repeat(self.PFFC, p.NSL)))
+        self._CondK0 = np.power(10.0, self._CONTAB(np.repeat(self.PFSAT, p.NSL)))
         for il in range (0, p.NSL):
-            p.SOIL_LAYERS[il]['WC']     = p.SOIL_LAYERS[il]['SM']    * p.SOIL_LAYERS[il]['TSL']   # state variable
-            p.SOIL_LAYERS[il]['WC0']    = p.SOIL_LAYERS[il]['SOILTYPE']['SM0']   * p.SOIL_LAYERS[il]['TSL']
-            p.SOIL_LAYERS[il]['WCW']    = p.SOIL_LAYERS[il]['SOILTYPE']['SMW']   * p.SOIL_LAYERS[il]['TSL']
-            p.SOIL_LAYERS[il]['WCFC']   = p.SOIL_LAYERS[il]['SOILTYPE']['SMFCF'] * p.SOIL_LAYERS[il]['TSL']
-            p.SOIL_LAYERS[il]['CondFC'] = 10.0**p.SOIL_LAYERS[il]['SOILTYPE']['CONTAB'](self.PFFC)
-            p.SOIL_LAYERS[il]['CondK0'] = 10.0**p.SOIL_LAYERS[il]['SOILTYPE']['CONTAB'](self.PFSAT)
-            #print "layer %i: TSL %f WC %f SM %f SMfcf %f SMsat %f" % (il, \
-            # p.SOIL_LAYERS[il]['TSL'], p.SOIL_LAYERS[il]['WC'], p.SOIL_LAYERS[il]['SM'], \
-            # p.SOIL_LAYERS[il]['SOILTYPE']['SMFCF'], p.SOIL_LAYERS[il]['SOILTYPE']['SM0'])
-            print "layer  %i  %3.1f cm: SM0=%.3f SMFC=%.3f SMW=%.3f" % (il, p.SOIL_LAYERS[il]['TSL'], \
-                p.SOIL_LAYERS[il]['SOILTYPE']['SM0'], p.SOIL_LAYERS[il]['SOILTYPE']['SMFCF'], \
-                p.SOIL_LAYERS[il]['SOILTYPE']['SMW'])
+            print "layer  %i  %3.1f cm: SM0=%.3f SMFC=%.3f SMW=%.3f" % (il, TSL[il], \
+                SM0[il], self._SMFCF[il], SMW[il])
 
         # rootzone and subsoil water
         WI    = W
         WLOWI = WLOW
         WWLOW = W + WLOW
-        SM = W / RD         # p.SOIL_LAYERS[p.NSL-1]['LBSL']
+        SM = W / RD         # LBSL[-1]
 
         # soil evaporation, days since last rain @ToDo: <= or <?
         self.DSLR = 1.0
-        if p.SOIL_LAYERS[0]['SM'] <= (p.SOIL_LAYERS[0]['SOILTYPE']['SMW'] + \
-                                      0.5*(p.SOIL_LAYERS[0]['SOILTYPE']['SMFCF'] - \
-                                           p.SOIL_LAYERS[0]['SOILTYPE']['SMW'])):
+        if self._SM[0] <= (SMW[0] + 0.5*(self._SMFCF[0] - SMW[0])):
             self.DSLR=5.0
         self.RINold = 0.    # RIN is used in calc_rates before it is set, so keep the RIN as RINold?
         self.NINFTB = Afgen([0.0,0.0, 0.5,0.0, 1.5,1.0, 0.0,0.0, 0.0,0.0, \
@@ -495,30 +473,26 @@ class WaterbalanceLayered(SimulationObject):
 
         #print "calc_rates WaterbalanceLayered NSL %i, GW %s, RD %f" % (p.NSL, p.GW, RD)
         
+        NSL  = p.NSL
+        TSL  = self._TSL
+        LBSL = self._LBSL
+        WC   = self._WC
+
         # conductivities and Matric Flux Potentials for all layers
-        PF            = np.zeros(p.NSL)
-        Conductivity  = np.zeros(p.NSL)
-        MatricFluxPot = np.zeros(p.NSL)
-        EquilWater    = np.zeros(p.NSL)
-        for il in range (0, p.NSL):
-            PF[il] = p.SOIL_LAYERS[il]['SOILTYPE']['PFTAB'](p.SOIL_LAYERS[il]['SM'])     
-            #print "layer %i: PF %f SM %f" % (il, PF[il], p.SOIL_LAYERS[il]['SM'])
-            Conductivity[il]  = 10.0**p.SOIL_LAYERS[il]['SOILTYPE']['CONTAB'](PF[il])
-            MatricFluxPot[il] = p.SOIL_LAYERS[il]['SOILTYPE']['MFPTAB'](PF[il])
-            
-            if p.GW:  # equilibrium amounts
-                if p.SOIL_LAYERS[il]['LBSL'] < s.ZT:
-                    # groundwater below layer
-                    EquilWater[il] = p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](s.ZT-p.SOIL_LAYERS[il]['LBSL']+\
-                                                                                      p.SOIL_LAYERS[il]['TSL']) \
-                                   - p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](s.ZT-p.SOIL_LAYERS[il]['LBSL'])
-                elif p.SOIL_LAYERS[il]['LBSL']-p.SOIL_LAYERS[il]['TSL'] < s.ZT:
-                    # groundwater in layer
-                    EquilWater[il] = p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](s.ZT-p.SOIL_LAYERS[il]['LBSL']+\
-                                                                                      p.SOIL_LAYERS[il]['TSL']) \
-                                   + (p.SOIL_LAYERS[il]['LBSL']-s.ZT) * p.SOIL_LAYERS[il]['SOILTYPE']['SM0']
-                else: # groundwater above layer
-                    EquilWater[il] = p.SOIL_LAYERS[il]['WC0']
+        PF            = self._PFTAB(self._SM)
+        Conductivity  = np.power(10.0, self._CONTAB(PF))
+        MatricFluxPot = self._MFPTAB(PF)
+
+        EquilWater = self._EquilWater
+        if p.GW:  # equilibrium amounts
+            WaterFromHeight = self._WaterFromHeight
+            EquilTop = WaterFromHeight(s.ZT-LBSL+TSL)
+            # groundwater below layer, in layer or above layer
+            EquilWater[:] = np.where(LBSL < s.ZT,
+                                     EquilTop - WaterFromHeight(s.ZT-LBSL),
+                                     np.where(LBSL-TSL < s.ZT,
+                                              EquilTop + (LBSL-s.ZT) * self._SM0,
+                                              self._WC0))
 
         # ------------------------------------------
         # ILaR: code taken from classic waterbalance
@@ -533,14 +507,15 @@ class WaterbalanceLayered(SimulationObject):
         # no shading by the canopy.
         if self.flag_crop_emerged is True:
             r.WTRA  = self.kiosk["TRA"]
-            r.WTRAL = self.kiosk["TRALY"]
+            r.WTRAL = np.asarray(self.kiosk["TRALY"], dtype=np.float64)
             EVWMX   = self.kiosk["EVWMX"]
             EVSMX   = self.kiosk["EVSMX"]
         else:
             r.WTRA  = 0.
-            r.WTRAL = np.zeros(20)
+            r.WTRAL = self._NOTRA
             EVWMX   = drv.E0
             EVSMX   = drv.ES0
+        WTRAL = r.WTRAL
         # ------------------------------------------
 
         # actual evaporation rates ...
@@ -561,11 +536,11 @@ class WaterbalanceLayered(SimulationObject):
         # preliminary infiltration rate
         if s.SS <= 0.1:   # without surface storage
             if p.IFUNRN==0.: RINPRE = (1.-p.NOTINF)*r.RAIN + r.RIRR + s.SS/DELT
-            if p.IFUNRN==1.: RINPRE = (1.-p.NOTINF*NINFTB(r.RAIN))*r.RAIN + r.RIRR + s.SS/DELT
+            if p.IFUNRN==1.: RINPRE = (1.-p.NOTINF*self.NINFTB(r.RAIN))*r.RAIN + r.RIRR + s.SS/DELT
         else:
             # with surface storage, infiltration limited by SOPE (topsoil)
             AVAIL  = s.SS + (r.RAIN * (1.-p.NOTINF) + r.RIRR - r.EVW) * DELT
-            RINPRE = min(p.SOIL_LAYERS[0]['SOILTYPE']['SOPE']*DELT, AVAIL) / DELT
+            RINPRE = min(self._SOPE[0]*DELT, AVAIL) / DELT
 
         # maximum flow at Top Boundary of each layer
         # ------------------------------------------
@@ -584,161 +559,124 @@ class WaterbalanceLayered(SimulationObject):
         # case of upward flow from the groundwater, this upward flow in propagated upward if the 
         # suction gradient is sufficiently large.
 
-        EVflow  = np.zeros(p.NSL+1)         # 1 more
-        FlowMX  = np.zeros(p.NSL+1)         # 1 more
-        Flow    = np.zeros(p.NSL+1)         # 1 more
-        LIMWET  = np.zeros(p.NSL)
-        LIMDRY  = np.zeros(p.NSL)
-        
-        for il in range (0, p.NSL):
-            p.SOIL_LAYERS[il]['DWC'] = 0.0  # water change
+        EVflow  = self._EVflow              # 1 more
+        FlowMX  = self._FlowMX              # 1 more
+        Flow    = self._Flow                # 1 more
+        LIMWET  = self._LIMWET
+        LIMDRY  = self._LIMDRY
+        EqualPotAmount = self._EqualPotAmount
 
         # first get flow through lower boundary of bottom layer
         if p.GW:
             # the old capillairy rise routine is used to estimate flow to/from the groundwater
             # note that this routine returns a positive value for capillairy rise and a negative
             # value for downward flow, which is the reverse from the convention in WATFDGW.
-            if s.ZT >= p.SOIL_LAYERS[p.NSL-1]['LBSL']:
+            bottom = self._soiltypes[-1]
+            if s.ZT >= LBSL[-1]:
                 # groundwater below the layered system ; call the old capillairty rise routine
                 # the layer PF is allocated at 1/3 * TSL above the lower boundary ; this leeds
                 # to a reasonable result for groundwater approaching the bottom layer 
-                SubFlow = self._SUBSOL(PF[p.NSL-1], \
-                                       s.ZT-p.SOIL_LAYERS[p.NSL-1]['LBSL']+p.SOIL_LAYERS[p.NSL-1]['TSL']/3.0, \
-                                       p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['CONTAB'])
+                SubFlow = self._SUBSOL(PF[-1], s.ZT-LBSL[-1]+TSL[-1]/3.0,
+                                       self._SUBCONTAB)
 
                 if SubFlow >= 0.0:
                     # capillairy rise is limited by the amount required to reach equilibrium:
                     # step 1. calculate equilibrium ZT for all air between ZT and top of layer
-                    EqAir   = s.WSUB0 - s.WSUB + (p.SOIL_LAYERS[p.NSL-1]['WC0'] - p.SOIL_LAYERS[p.NSL-1]['WC'])
+                    EqAir   = s.WSUB0 - s.WSUB + (self._WC0[-1] - WC[-1])
                     # step 2. the grouindwater level belonging to this amount of air in equilibrium
-                    ZTeq1   = (p.SOIL_LAYERS[p.NSL-1]['LBSL'] - p.SOIL_LAYERS[p.NSL-1]['TSL']) \
-                            + p.SOIL_LAYERS[il]['SOILTYPE']['HeightFromAir'](EqAir)
+                    ZTeq1   = (LBSL[-1] - TSL[-1]) + bottom['HeightFromAir'](EqAir)
                     # step 3. this level should normally lie below the current level
                     #         (otherwise there should not be capillairy rise)
                     #         in rare cases however, due to the use of a mid-layer height
                     #         in subroutine SUBSOL, a deviation could occur
                     ZTeq2   = max(s.ZT, ZTeq1)
                     # step 4. calculate for this ZTeq2 the equilibrium amount of water in the layer
-                    WCequil = p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](ZTeq2-p.SOIL_LAYERS[p.NSL-1]['LBSL']+\
-                                                                               p.SOIL_LAYERS[p.NSL-1]['TSL']) \
-                            - p.SOIL_LAYERS[il]['SOILTYPE']['WaterFromHeight'](ZTeq2-p.SOIL_LAYERS[p.NSL-1]['LBSL'])
+                    WCequil = bottom['WaterFromHeight'](ZTeq2-LBSL[-1]+TSL[-1]) \
+                            - bottom['WaterFromHeight'](ZTeq2-LBSL[-1])
                     # step5. use this equilibrium amount to limit the upward flow
-                    FlowMX[p.NSL] = -1.0 * min(SubFlow, max(WCequil-p.SOIL_LAYERS[p.NSL-1]['WC'], 0.0)/DELT)
+                    FlowMX[NSL] = -1.0 * min(SubFlow, max(WCequil-WC[-1], 0.0)/DELT)
                 else:
                     # downward flow ; air-filled pore space of subsoil limits downward flow
-                    AirSub = (s.ZT-p.SOIL_LAYERS[p.NSL-1]['LBSL'])*p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['SM0'] \
-                           - p.SOIL_LAYERS[p.NSL-1]['SOILTYPE']['WaterFromHeight'](s.ZT-p.SOIL_LAYERS[p.NSL-1]['LBSL'])
-                    FlowMX[p.NSL] = min(abs(SubFlow), max(AirSub, 0.0)/DELT)
+                    AirSub = (s.ZT-LBSL[-1])*self._SM0[-1] \
+                           - bottom['WaterFromHeight'](s.ZT-LBSL[-1])
+                    FlowMX[NSL] = min(abs(SubFlow), max(AirSub, 0.0)/DELT)
             else:
                 # groundwater is in the layered system ; no further downward flow
-                FlowMX[p.NSL] = 0.0
+                FlowMX[NSL] = 0.0
         else:   # not GW
             # Bottom layer conductivity limits the flow. Below field capacity there is no 
             # downward flow, so downward flow through lower boundary can be guessed as
-            FlowMX[p.NSL] = max(p.SOIL_LAYERS[p.NSL-1]['CondFC'], Conductivity[p.NSL-1])
+            FlowMX[NSL] = max(self._CondFC[-1], Conductivity[-1])
 
         # drainage
         r.DMAX = 0.0
 
-        for il in range (p.NSL-1, -1, -1):
+        # limiting DOWNWARD flow rate at the top boundary of each layer
+        # == wet conditions: the soil conductivity is larger
+        #    the soil conductivity is the flow rate for gravity only
+        #    this limit is DOWNWARD only
+        # == dry conditions: the MFP gradient
+        #    the MFP gradient is larger for dry conditions
+        #    allows SOME upward flow
+        LIMWET[0] = self._SOPE[0]
+        LIMDRY[0] = 0.0
+        # the limit under wet conditions in a unit gradient
+        TSL1 = TSL[:-1]
+        TSL2 = TSL[1:]
+        LIMWET[1:] = (TSL1 + TSL2) / (TSL1/Conductivity[:-1] + TSL2/Conductivity[1:])
+        # same soil type: flow rate estimate from gradient in Matric Flux Potential
+        LIMDRY[1:] = 2.0 * (MatricFluxPot[:-1]-MatricFluxPot[1:])/(TSL1 + TSL2)
+        # for upward flow the amount required for equal water content is
+        # required below, it should be negative like the flow
+        MeanSM = (WC[:-1]+WC[1:]) / (TSL1 + TSL2)
+        EqualPotAmount[1:] = WC[:-1] - TSL1 * MeanSM
+        # different soil types: iterative search to PF at layer boundary
+        for il in self._soiltype_changes:
+            LIMDRY[il], EqualPotAmount[il] = \
+                self._limit_dry_flow(il, PF[il-1], PF[il], MatricFluxPot[il-1],
+                                     MatricFluxPot[il])
+
+        if p.GW:  # soil does not drain below equilibrium with groundwater
+            FCequil = np.maximum(self._WCFC, EquilWater)
+        else:    # free drainage
+            FCequil = self._WCFC
+        # upward flow is limited by amount required to bring target layer at
+        # equilibrium/field capacity, for downward flow this prevents
+        # saturation of layer il
+        TargetLimit = (WTRAL + (FCequil-WC)/DELT).tolist()
+        UpwardLimit = (EqualPotAmount * self.UpwardFlowLimit).tolist()
+        Deficit     = ((self._WC0-WC)/DELT).tolist()
+        WCrate      = (WC/DELT).tolist()
+        WTRAL_      = WTRAL.tolist()
+
+        # The maximum flows depend on the flow through the lower boundary of
+        # each layer, so they are found from the bottom up with Python floats
+        LIMDRY_ = LIMDRY.tolist()
+        LIMWET_ = LIMWET.tolist()
+        FlowMX_ = FlowMX.tolist()
+        for il in range (NSL-1, -1, -1):
             # if this layers contains maximum rootig depth and if rice, downward water loss is limited
             if p.IAIRDU==1 and il==s.ILM:
-                FlowMX[il+1] = 0.05 * p.SOIL_LAYERS[il]['CondK0']
-
-            # limiting DOWNWARD flow rate 
-            # == wet conditions: the soil conductivity is larger
-            #    the soil conductivity is the flow rate for gravity only
-            #    this limit is DOWNWARD only
-            # == dry conditions: the MFP gradient
-            #    the MFP gradient is larger for dry conditions
-            #    allows SOME upward flow
-            if il==0:
-                LIMWET[il] = p.SOIL_LAYERS[0]['SOILTYPE']['SOPE']
-                LIMDRY[il] = 0.0
-            else:
-                # same soil type
-                if p.SOIL_LAYERS[il-1]['SOILTYPE']['SOIL_GROUP_NO'] == p.SOIL_LAYERS[il]['SOILTYPE']['SOIL_GROUP_NO']:
-                    # flow rate estimate from gradient in Matric Flux Potential
-                    LIMDRY[il] = 2.0 * (MatricFluxPot[il-1]-MatricFluxPot[il])/(p.SOIL_LAYERS[il-1]['TSL'] + p.SOIL_LAYERS[il]['TSL'])
-                    if LIMDRY[il] < 0.0:
-                        # upward flow rate ; amount required for equal water content is required below
-                        MeanSM = (p.SOIL_LAYERS[il-1]['WC']+p.SOIL_LAYERS[il]['WC']) / (p.SOIL_LAYERS[il-1]['TSL'] + p.SOIL_LAYERS[il]['TSL'])
-                        EqualPotAmount = p.SOIL_LAYERS[il-1]['WC'] - p.SOIL_LAYERS[il-1]['TSL'] * MeanSM  # should be negative like the flow
-                        
-                else:   # different soil types
-                    # iterative search to PF at layer boundary (by bisection)
-                    PF1  = PF[il-1]
-                    PF2  = PF[il]
-                    MFP1 = MatricFluxPot[il-1]
-                    MFP2 = MatricFluxPot[il]
-                    for i in range (0, self.MaxFlowIter):
-                        PFx = (PF1 + PF2) / 2.0
-                        Flow1 = 2.0 * (+ MFP1 - p.SOIL_LAYERS[il-1]['MFPTAB'](PFx)) / p.SOIL_LAYERS[il-1]['TSL']
-                        Flow2 = 2.0 * (- MFP2 + p.SOIL_LAYERS[ il ]['MFPTAB'](PFx)) / p.SOIL_LAYERS[il]['TSL']
-                        if abs(Flow1-Flow2) < TinyFlow: # sufficient accuracy
-                            break
-                        elif abs(Flow1) > abs(Flow2):
-                            # flow in layer 1 is larger ; PFx must shift in the direction of PF1
-                            PF2 = PFx
-                        elif abs(Flow1) < abs(Flow2):
-                            # flow in layer 2 is larger ; PFx must shift in the direction of PF2
-                            PF1 = PFx
-
-                    if i >= self.MaxFlowIter:
-                        msg = "LIMDRY flow iteration failed"
-                        raise RuntimeError(msg)
-                    
-                    LIMDRY[il] = (Flow1 + Flow2) / 2.0
-                    if LIMDRY[il] < 0.0:
-                        # upward flow rate ; amount required for equal potential is required below
-                        Eq1 = -p.SOIL_LAYERS[il]['WC']
-                        Eq2 = 0.0
-                        for i in range (0, self.MaxFlowIter):
-                            EqualPotAmount = (Eq1 + Eq2) / 2.0
-                            SM1 = (p.SOIL_LAYERS[il-1]['WC'] - EqualPotAmount) / p.SOIL_LAYERS[il-1]['TSL']
-                            SM2 = (p.SOIL_LAYERS[ il ]['WC'] + EqualPotAmount) / p.SOIL_LAYERS[il]['TSL']
-                            PF1 = p.SOIL_LAYERS[il-1]['SMTAB'](SM1)
-                            PF2 = p.SOIL_LAYERS[ il ]['SMTAB'](SM2)
-                            if abs(Eq1-Eq2) < TinyFlow:     # sufficient accuracy
-                                break
-                            elif PF1 > PF2: # suction in top layer larger; absolute amount should be larger
-                                Eq2 = EqualPotAmount
-                            else:           # suction in bottom layer larger; absolute amount should be reduced
-                                Eq1 = EqualPotAmount
-
-                        if i >= self.MaxFlowIter:
-                            msg = "Limiting amount iteration failed"
-                            raise RuntimeError(msg)
-
-                # the limit under wet conditions in a unit gradient
-                LIMWET[il] = (p.SOIL_LAYERS[il-1]['TSL'] + p.SOIL_LAYERS[il]['TSL']) \
-                            / (p.SOIL_LAYERS[il-1]['TSL']/Conductivity[il-1] + p.SOIL_LAYERS[il]['TSL']/Conductivity[il])
+                FlowMX_[il+1] = 0.05 * self._CondK0[il]
 
             FlowDown = True
-            if LIMDRY[il] < 0.0:
+            if LIMDRY_[il] < 0.0:
                 # upward flow (negative !) is limited by fraction of amount required for equilibrium
-                FlowMax = max(LIMDRY[il], EqualPotAmount * UpwardFlowLimit)
+                FlowMax = max(LIMDRY_[il], UpwardLimit[il])
                 if il > 0:
-                    # upward flow is limited by amount required to bring target layer at equilibrium/field capacity
-                    if p.GW:  # soil does not drain below equilibrium with groundwater
-                        FCequil = max(p.SOIL_LAYERS[il-1]['WCFC'], EquilWater[il-1])
-                    else:   # free drainage
-                        FCequil = p.SOIL_LAYERS[il-1]['WCFC']
-
-                    TargetLimit = r.WTRAL[il-1] + (FCequil-p.SOIL_LAYERS[il-1]['WC'])/DELT
-                    if TargetLimit > 0.0:
+                    if TargetLimit[il-1] > 0.0:
                         # target layer is "dry": below field capacity ; limit upward flow
-                        FlowMax = max(FlowMax, -1.0*TargetLimit)
-                        # there is no saturation prevention since upward flow leads to a decrease ofp.SOIL_LAYERS[il]['WC']
+                        FlowMax = max(FlowMax, -1.0*TargetLimit[il-1])
+                        # there is no saturation prevention since upward flow leads to a decrease of WC
                         # instead flow is limited in order to prevent a negative water content
-                        FlowMX[il] = max(FlowMax, FlowMX[il+1] + r.WTRAL[il] - p.SOIL_LAYERS[il]['WC']/DELT)
+                        FlowMX_[il] = max(FlowMax, FlowMX_[il+1] + WTRAL_[il] - WCrate[il])
                         FlowDown = False
                     elif p.GW:
                         # target layer is "wet": above field capacity, since gravity is
                         # neglected in the matrix potential model, upward flow tends to be
                         # overestyimated in wet conditions. With groundwater the profile
                         # can get filled with water from above and upward flow is set to zero here.
-                        FlowMX[il] = 0.0
+                        FlowMX_[il] = 0.0
                         FlowDown   = False
                     else:
                         # target layer is "wet": above field capacity, no groundwater
@@ -749,65 +687,49 @@ class WaterbalanceLayered(SimulationObject):
 
             if FlowDown:
                 # maximum downward flow rate (LIMWET is always a positive number)
-                FlowMax = max(LIMDRY[il], LIMWET[il])
+                FlowMax = max(LIMDRY_[il], LIMWET_[il])
                 # this prevents saturation of layer il
                 # maximum top boundary flow is bottom boundary flow plus saturation deficit plus sink
-                FlowMX[il] = min(FlowMax, FlowMX[il+1] + (p.SOIL_LAYERS[il]['WC0']-p.SOIL_LAYERS[il]['WC'])/DELT + r.WTRAL[il])
+                FlowMX_[il] = min(FlowMax, FlowMX_[il+1] + Deficit[il] + WTRAL_[il])
+        FlowMX[:] = FlowMX_
 
         # adjustment of infiltration rate to prevent saturation
-        r.RIN = min(RINPRE, FlowMX[0])
+        r.RIN = min(RINPRE, FlowMX_[0])
 
         # contribution of layers to soil evaporation in case of drought upward flow is allowed
-        EVSL    = np.zeros(p.NSL)
-        EVSL[0] = min(r.EVS, (p.SOIL_LAYERS[0]['WC'] - p.SOIL_LAYERS[0]['WCW'])/DELT + r.RIN - r.WTRAL[0])
-        
-        EVrest  = r.EVS - EVSL[0]
-        for il in range (1, p.NSL):
-            Available = max(0.0, (p.SOIL_LAYERS[il]['WC'] - p.SOIL_LAYERS[il]['WCW'])/DELT - r.WTRAL[il])
-            if Available >= EVrest:
-                EVSL[il] = EVrest
-                EVrest   = 0.0
-                break
-            else:
-                EVSL[il] = Available
-                EVrest   = EVrest - Available
+        EVSL    = self._EVSL
+        EVSL[0] = min(r.EVS, (WC[0] - self._WCW[0])/DELT + r.RIN - WTRAL[0])
+
+        # the deeper layers contribute their available water in turn until
+        # the rest of the soil evaporation is met
+        Available = np.maximum(0.0, (WC[1:] - self._WCW[1:])/DELT - WTRAL[1:])
+        EVrest    = self._EVrest
+        EVrest[0] = r.EVS - EVSL[0]
+        EVrest[1:] = Available
+        np.subtract.accumulate(EVrest, out=EVrest)
+        EVSL[1:] = np.minimum(Available, np.maximum(0.0, EVrest[:-1]))
 
         # reduce evaporation if entire profile becomes airdry
         # there is no evaporative flow through lower boundary of layer NSL
-        r.EVS -= EVrest
+        r.EVS -= max(0.0, EVrest[-1])
 
         #! evaporative flow (taken positive) at layer boundaries
         EVflow[0] = r.EVS
-        for il in range (1, p.NSL):
-            EVflow[il] = EVflow[il-1] - EVSL[il-1]
-        EVflow[p.NSL] = 0.0 
+        EVflow[1:NSL] = EVSL[:-1]
+        np.subtract.accumulate(EVflow[:NSL], out=EVflow[:NSL])
+        EVflow[NSL] = 0.0 
 
         # limit downward flows not to get below field capacity / equilibrium content         
-        Flow[0] = r.RIN - EVflow[0]
-        #print "Flow %i: %f = RIN %f - EVflow %f, sm: %f" % \
-        # (0, Flow[0], r.RIN, EVflow[0], p.SOIL_LAYERS[0]['SM'])
-        
-        for il in range (0, p.NSL):
-            if p.GW:  # soil does not drain below equilibrium with groundwater
-                WaterLeft = max(p.SOIL_LAYERS[il]['WCFC'], EquilWater[il])
-            else:    # free drainage
-                WaterLeft = p.SOIL_LAYERS[il]['WCFC']
-
-            MXLOSS     = (p.SOIL_LAYERS[il]['WC']-WaterLeft)/DELT   # maximum loss 
-            #print "   MXLOSS %i: %f = WC %f - WaterLeft %f, sm: %f" % \
-            # (il, MXLOSS, p.SOIL_LAYERS[il]['WC'], WaterLeft, p.SOIL_LAYERS[il]['SM'])
-            Excess     = max(0.0, MXLOSS + Flow[il] - r.WTRAL[il])  # excess of water (positive)
-            #print "   Excess %i: %f = max(0.0, MXLOSS %f + Flow %f - WTRAL %f)" % \
-            # (il, Excess, MXLOSS, Flow[il], r.WTRAL[il])
-            Flow[il+1] = min(FlowMX[il+1], Excess - EVflow[il+1])   # negative (upward) flow is not affected
-            #print "Flow   %i: %f = min(FlowMX %f, Excess %f - EVflow %f)" %
-            # (il+1, Flow[il+1], FlowMX[il+1], Excess, EVflow[il+1])
-        
-            # rate of change
-            p.SOIL_LAYERS[il]['DWC'] = Flow[il] - Flow[il+1] - r.WTRAL[il]
-            #print "layer %i: DWC %f=%f-%f-%f, sm: %f" % (il,\
-            #    p.SOIL_LAYERS[il]['DWC'], Flow[il], Flow[il+1], r.WTRAL[il], \
-            #    p.SOIL_LAYERS[il]['SM'])
+        MXLOSS = ((WC-FCequil)/DELT).tolist()   # maximum loss 
+        EVflow_ = EVflow.tolist()
+        Flow_ = [r.RIN - EVflow_[0]]
+        for il in range (0, NSL):
+            Excess = max(0.0, MXLOSS[il] + Flow_[il] - WTRAL_[il])  # excess of water (positive)
+            Flow_.append(min(FlowMX_[il+1], Excess - EVflow_[il+1]))  # negative (upward) flow is not affected
+        Flow[:] = Flow_
+
+        # rate of change
+        self._DWC[:] = Flow[:-1] - Flow[1:] - WTRAL
 
         # Percolation and Loss.
         # Equations were derived from the requirement that in the same layer, above and below 
@@ -818,13 +740,13 @@ class WaterbalanceLayered(SimulationObject):
         if s.ILR < s.ILM:
             # layer ILR is devided into rooted part (where the sink is) and a below-roots part
             # The flow in between is PERC
-            f1 = p.SOIL_LAYERS[s.ILR]['Wtop']   # 1-f1 = Wpot
-            r.PERC = (1.0-f1) * (Flow[s.ILR]-r.WTRAL[s.ILR]) + f1 * Flow[s.ILR+1]
+            f1 = self._Wtop[s.ILR]   # 1-f1 = Wpot
+            r.PERC = (1.0-f1) * (Flow_[s.ILR]-WTRAL_[s.ILR]) + f1 * Flow_[s.ILR+1]
 
             # layer ILM is divided as well ; the flow in between is LOSS
-            f2 = p.SOIL_LAYERS[s.ILM]['Wpot']
+            f2 = self._Wpot[s.ILM]
             f3 = 1.0 - f2		        # f3 = Wund
-            r.LOSS = f3 * Flow[s.ILM] + f2 * Flow[s.ILM+1]
+            r.LOSS = f3 * Flow_[s.ILM] + f2 * Flow_[s.ILM+1]
         elif s.ILR == s.ILM:
             # depths RD and RDM in the same soil layer: there are three "sublayers":
             # - the rooted sublayer with fraction f1
@@ -832,29 +754,27 @@ class WaterbalanceLayered(SimulationObject):
             # - below RDM with fraction f3
             # PERC goes from 1->2, LOSS from 2->3
             # PERC and LOSS are calculated in such a way that the three sublayers have equal SM
-            f1 = p.SOIL_LAYERS[s.ILR]['Wtop']
-            r.PERC = (1.0-f1) * (Flow[s.ILR]-r.WTRAL[s.ILR]) + f1 * Flow[s.ILR+1]
+            f1 = self._Wtop[s.ILR]
+            r.PERC = (1.0-f1) * (Flow_[s.ILR]-WTRAL_[s.ILR]) + f1 * Flow_[s.ILR+1]
             
-            f2 = p.SOIL_LAYERS[s.ILM]['Wpot']
+            f2 = self._Wpot[s.ILM]
             f3 = 1.0 - f1 - f2
-            r.LOSS = f3 * (Flow[s.ILM]-r.WTRAL[s.ILM]) + (1.0-f3) * Flow[s.ILM+1]
+            r.LOSS = f3 * (Flow_[s.ILM]-WTRAL_[s.ILM]) + (1.0-f3) * Flow_[s.ILM+1]
         else:
             msg = "Internal_1"
             raise RuntimeError(msg)
 
         # rates of change in amounts of moisture W and WLOWI
-        r.DW    = - r.WTRAL.sum() - r.EVS - r.PERC + r.RIN
+        r.DW    = - WTRAL.sum() - r.EVS - r.PERC + r.RIN
         r.DWLOW = r.PERC - r.LOSS
-        #print "DW    %f= -WTRAL %f -EVS %f -PERC %f +RIN %f" % (r.DW, r.WTRAL.sum(), r.EVS, r.PERC, r.RIN)
+        #print "DW    %f= -WTRAL %f -EVS %f -PERC %f +RIN %f" % (r.DW, WTRAL.sum(), r.EVS, r.PERC, r.RIN)
         #print "DWLOW %f= PERC %f - LOSS %f" % (r.DWLOW, r.PERC, r.LOSS)
 
         if p.GW:  # groundwater influence
-            r.DWBOT = r.LOSS - Flow[p.NSL]
-            r.DWSUB = Flow[p.NSL]
-            #print "DWBOT %f= LOSS %f - Flow %f" % (r.DWBOT, r.LOSS, Flow[p.NSL])
-            #print "DWSUB %f= Flow %f" % (r.DWSUB, Flow[p.NSL])
-        #msg = '\n'.join(['%s = %s' % (k,v) for k,v in self.kiosk.iteritems()]) 
-        #print(msg)
+            r.DWBOT = r.LOSS - Flow_[NSL]
+            r.DWSUB = Flow_[NSL]
+            #print "DWBOT %f= LOSS %f - Flow %f" % (r.DWBOT, r.LOSS, Flow_[NSL])
+            #print "DWSUB %f= Flow %f" % (r.DWSUB, Flow_[NSL])
                 
     #---------------------------------------------------------------------------
 
@@ -872,10 +792,9 @@ class WaterbalanceLayered(SimulationObject):
         #! integrals of the water balance:  summation and state variables
         #!-----------------------------------------------------------------------
         #! amount of water in soil layers ; soil moisture content
-        for il in range (0, p.NSL):
-            p.SOIL_LAYERS[il]['WC'] += p.SOIL_LAYERS[il]['DWC'] * DELT
-            p.SOIL_LAYERS[il]['SM']  = p.SOIL_LAYERS[il]['WC'] / p.SOIL_LAYERS[il]['TSL']
-            #print "layer %i: WC +%f=%f sm: %f" % (il, p.SOIL_LAYERS[il]['DWC'], p.SOIL_LAYERS[il]['WC'], p.SOIL_LAYERS[il]['SM'])
+        WC = self._WC
+        WC += self._DWC * DELT
+        np.divide(WC, self._TSL, out=self._SM)
 
         # totals
         s.WTRAT  += r.WTRAL.sum()*DELT      # transpiration
@@ -919,29 +838,17 @@ class WaterbalanceLayered(SimulationObject):
         RD = self._determine_rooting_depth()                # ???
         if (RD-self.RDold) > 0.001:
             # roots have grown find new values ; overwrite W, WLOW, WAVUPP, WAVLOW, WBOT
-            s.ILR = p.NSL-1
-            s.ILM = p.NSL-1
-            for il in range (p.NSL-1, -1, -1):
-                if (p.SOIL_LAYERS[il]['LBSL'] >= RD ):         s.ILR = il
-                if (p.SOIL_LAYERS[il]['LBSL'] >= self.RDMSLB): s.ILM = il
-
+            s.ILR, s.ILM = self._find_layers(RD)
             self._layer_weights(RD, self.RDMSLB, s.ILR, s.ILM)
 
-            WOLD = s.W
-            s.W    = 0.0
-            s.WLOW = 0.0
-            s.WBOT = 0.0
-            s.WAVUPP = 0.0
-            s.WAVLOW = 0.0
-
             # get W and WLOW and available water amounts
-            for il in range (0, p.NSL):
-                s.W    += p.SOIL_LAYERS[il]['WC'] * p.SOIL_LAYERS[il]['Wtop']
-                s.WLOW += p.SOIL_LAYERS[il]['WC'] * p.SOIL_LAYERS[il]['Wpot']
-                s.WBOT += p.SOIL_LAYERS[il]['WC'] * p.SOIL_LAYERS[il]['Wund']
-
-                s.WAVUPP += (p.SOIL_LAYERS[il]['WC']-p.SOIL_LAYERS[il]['WCW']) * p.SOIL_LAYERS[il]['Wtop']
-                s.WAVLOW += (p.SOIL_LAYERS[il]['WC']-p.SOIL_LAYERS[il]['WCW']) * p.SOIL_LAYERS[il]['Wpot']
+            WOLD = s.W
+            WAV  = WC - self._WCW
+            s.W      = np.dot(WC, self._Wtop)
+            s.WLOW   = np.dot(WC, self._Wpot)
+            s.WBOT   = np.dot(WC, self._Wund)
+            s.WAVUPP = np.dot(WAV, self._Wtop)
+            s.WAVLOW = np.dot(WAV, self._Wpot)
                 
             WDR     = s.W - WOLD    # water added to root zone by root growth, in cm
             s.WDRT += WDR           # total water addition to rootzone by root growth
@@ -958,25 +865,21 @@ class WaterbalanceLayered(SimulationObject):
             s.WSUB += r.DWSUB * DELT            # subsoil between soil layers and reference plane
             s.WZ    = s.WLOW + s.WBOT + s.WSUB  # amount of water below rooted zone
             
-            # find groundwater level
-            ZTfound = False
-            for il in range (p.NSL-1, -1, -1):
-                if il==p.NSL-1:
-                    AirSub = s.WSUB0 - s.WSUB
-                    if AirSub > 0.01:
-                        # groundwater is in subsoil which is not completely saturated
-                        s.ZT = min(p.SOIL_LAYERS[p.NSL-1]['LBSL'] + p.SOIL_LAYERS[il]['SOILTYPE']['HeightFromAir'](AirSub), self.XDEF)
-                        ZTfound = True
-                        break
-
-                if p.SOIL_LAYERS[il]['SM'] < 0.999 * p.SOIL_LAYERS[il]['SOILTYPE']['SM0']:
-                    # groundwater is in this layer
-                    s.ZT = p.SOIL_LAYERS[il]['LBSL'] - p.SOIL_LAYERS[il]['TSL'] \
-                        + min(p.SOIL_LAYERS[il]['TSL'], p.SOIL_LAYERS[il]['SOILTYPE']['HeightFromAir'](p.SOIL_LAYERS[il]['WC0']-p.SOIL_LAYERS[il]['WC']))
-                    ZTfound = True
-                    break
-
-            if not ZTfound: # entire system saturated
+            # find groundwater level, from the subsoil upwards
+            TSL  = self._TSL
+            LBSL = self._LBSL
+            AirSub = s.WSUB0 - s.WSUB
+            # deepest layer which is not saturated
+            unsaturated = np.flatnonzero(self._SM < 0.999 * self._SM0)
+            if AirSub > 0.01:
+                # groundwater is in subsoil which is not completely saturated
+                s.ZT = min(LBSL[-1] + self._soiltypes[-1]['HeightFromAir'](AirSub), self.XDEF)
+            elif len(unsaturated) > 0:
+                # groundwater is in this layer
+                il = unsaturated[-1]
+                s.ZT = LBSL[il] - TSL[il] \
+                    + min(TSL[il], self._soiltypes[il]['HeightFromAir'](self._WC0[il]-WC[il]))
+            else: # entire system saturated
                 s.ZT = 0.0
 
         # quick-and-dirty: do once some printing on leaves died
@@ -1070,6 +973,135 @@ class WaterbalanceLayered(SimulationObject):
         
         return RD
 
+    def _init_layers(self):
+        """Stores the properties of the soil layers in arrays over the layers
+        and stacks the tables of their soil types, so that all layers are
+        interpolated in one call. Work arrays for the flows are preallocated.
+        """
+        p = self.params
+        layers = p.SOIL_LAYERS
+        if len(layers) != p.NSL:
+            msg = "Number of soil layers (%i) does not match NSL (%i)"
+            raise exc.WaterBalanceError(msg % (len(layers), p.NSL))
+
+        self._soiltypes = [layer['SOILTYPE'] for layer in layers]
+        self._TSL   = np.array([layer['TSL'] for layer in layers], dtype=np.float64)
+        self._LBSL  = np.array([layer['LBSL'] for layer in layers], dtype=np.float64)
+        self._SM0   = self._soiltype_values('SM0')
+        self._SMW   = self._soiltype_values('SMW')
+        self._SMFCF = self._soiltype_values('SMFCF')
+        self._SOPE  = self._soiltype_values('SOPE')
+
+        # Layer boundaries where the soil type changes, the flow under dry
+        # conditions is found by iteration for these boundaries.
+        groups = [layer['SOIL_GROUP_NO'] for layer in layers]
+        self._soiltype_changes = [il for il in range(1, p.NSL)
+                                  if groups[il-1] != groups[il]]
+
+        self._PFTAB  = self._stack_tables('PFTAB')
+        self._CONTAB = self._stack_tables('CONTAB')
+        self._MFPTAB = self._stack_tables('MFPTAB')
+        if p.GW:
+            self._WaterFromHeight = self._stack_tables('WaterFromHeight')
+            # conductivity of the bottom layer for evaluating the capillary
+            # rise from the groundwater at once
+            CONTAB = self._soiltypes[-1]['CONTAB']
+            self._SUBCONTAB = FastAfgen(np.column_stack([CONTAB.x_list,
+                                                         CONTAB.y_list]).ravel())
+
+        # state of the layers and layer weights
+        self._SM   = np.zeros(p.NSL)
+        self._WC   = np.zeros(p.NSL)
+        self._DWC  = np.zeros(p.NSL)
+        self._Wtop = np.zeros(p.NSL)
+        self._Wpot = np.zeros(p.NSL)
+        self._Wund = np.zeros(p.NSL)
+        # work arrays for calc_rates
+        self._NOTRA  = np.zeros(p.NSL)
+        self._EquilWater = np.zeros(p.NSL)
+        self._LIMWET = np.zeros(p.NSL)
+        self._LIMDRY = np.zeros(p.NSL)
+        self._EqualPotAmount = np.zeros(p.NSL)
+        self._EVSL   = np.zeros(p.NSL)
+        self._EVrest = np.zeros(p.NSL)
+        self._EVflow = np.zeros(p.NSL+1)
+        self._FlowMX = np.zeros(p.NSL+1)
+        self._Flow   = np.zeros(p.NSL+1)
+
+    def _soiltype_values(self, name):
+        """Returns an array with the value of soil parameter `name` for each
+        layer."""
+        return np.array([soiltype[name] for soiltype in self._soiltypes],
+                        dtype=np.float64)
+
+    def _stack_tables(self, name):
+        """Returns a BatchAfgen with the table `name` of the soil type of each
+        layer, it is called with an array of values for all layers or with
+        the values and indices of a subset of the layers."""
+        return BatchAfgen([soiltype[name] for soiltype in self._soiltypes])
+
+    def _find_layers(self, RD):
+        """Returns the deepest layer with roots (ILR) and the deepest layer
+        that will contain roots (ILM) for rooting depth RD.
+        """
+        NSL = self.params.NSL
+        ILR = min(int(np.searchsorted(self._LBSL, RD)), NSL-1)
+        ILM = min(int(np.searchsorted(self._LBSL, self.RDMSLB)), NSL-1)
+        return ILR, ILM
+
+    def _limit_dry_flow(self, il, PF1, PF2, MFP1, MFP2):
+        """Returns the flow under dry conditions through the top boundary of
+        layer il when the soil type of layer il-1 differs, and the amount
+        required for equal potential in case of upward flow.
+        """
+        upper = self._soiltypes[il-1]
+        lower = self._soiltypes[il]
+        TSL1 = self._TSL[il-1]
+        TSL2 = self._TSL[il]
+
+        # iterative search to PF at layer boundary (by bisection)
+        for i in range (0, self.MaxFlowIter):
+            PFx = (PF1 + PF2) / 2.0
+            Flow1 = 2.0 * (+ MFP1 - upper['MFPTAB'](PFx)) / TSL1
+            Flow2 = 2.0 * (- MFP2 + lower['MFPTAB'](PFx)) / TSL2
+            if abs(Flow1-Flow2) < self.TinyFlow: # sufficient accuracy
+                break
+            elif abs(Flow1) > abs(Flow2):
+                # flow in layer 1 is larger ; PFx must shift in the direction of PF1
+                PF2 = PFx
+            elif abs(Flow1) < abs(Flow2):
+                # flow in layer 2 is larger ; PFx must shift in the direction of PF2
+                PF1 = PFx
+        else:
+            msg = "LIMDRY flow iteration failed"
+            raise RuntimeError(msg)
+
+        LIMDRY = (Flow1 + Flow2) / 2.0
+        EqualPotAmount = 0.0
+        if LIMDRY < 0.0:
+            # upward flow rate ; amount required for equal potential is required below
+            WC1 = self._WC[il-1]
+            WC2 = self._WC[il]
+            Eq1 = -WC2
+            Eq2 = 0.0
+            for i in range (0, self.MaxFlowIter):
+                EqualPotAmount = (Eq1 + Eq2) / 2.0
+                SM1 = (WC1 - EqualPotAmount) / TSL1
+                SM2 = (WC2 + EqualPotAmount) / TSL2
+                PF1 = upper['PFTAB'](SM1)
+                PF2 = lower['PFTAB'](SM2)
+                if abs(Eq1-Eq2) < self.TinyFlow:     # sufficient accuracy
+                    break
+                elif PF1 > PF2: # suction in top layer larger; absolute amount should be larger
+                    Eq2 = EqualPotAmount
+                else:           # suction in bottom layer larger; absolute amount should be reduced
+                    Eq1 = EqualPotAmount
+            else:
+                msg = "Limiting amount iteration failed"
+                raise RuntimeError(msg)
+
+        return LIMDRY, EqualPotAmount
+
     def _layer_weights(self, RD, RDM, ILR, ILM):
         """Calculate weight factors for rooted- and sub-layer calculations
         """
@@ -1078,77 +1110,48 @@ class WaterbalanceLayered(SimulationObject):
         # ILM   deepest layer that will contain roots
         # RDM   max rooting depth aligned to soil layer boundary
         
-        # NSL   number of layers
         # TSL   the layerthickness
         # LBSL  the Lower Boundaries of the NSL soil layers
         # Wtop  weights for contribution to rootzone
         # Wpot  weights for contribution to potentially rooted zone
         # Wund  weights for contribution to never rooted layers
 
-        p   = self.params
-        s   = self.states
-        NSL = p.NSL
-        sl  = p.SOIL_LAYERS
+        TSL  = self._TSL
+        LBSL = self._LBSL
+        Wtop = self._Wtop
+        Wpot = self._Wpot
+        Wund = self._Wund
         
-        #print "---\nlayer_weights NSL: %i ILR: %i ILM: %i RD: %f RDM: %f\n---" % \
-        # (NSL, ILR, ILM, RD, RDM)
-
-        for il in range (0, NSL):
-            # rooted layer
-            if (il < ILR):                  
-                sl[il]['Wtop'] = 1.0
-                sl[il]['Wpot'] = 0.0
-                sl[il]['Wund'] = 0.0
-                
-            # partly rooted
-            elif (il == ILR and il < ILM):  # at the end fully rooted
-                sl[il]['Wtop'] = 1.0 - (sl[il]['LBSL']-RD) / sl[il]['TSL']
-                sl[il]['Wpot'] = 1.0 - sl[il]['Wtop']
-                sl[il]['Wund'] = 0.0
-            elif (il == ILR and il == ILM): # at the end partly rooted
-                sl[il]['Wtop'] = 1.0 - (sl[il]['LBSL']-RD) / sl[il]['TSL']
-                sl[il]['Wund'] = (sl[il]['LBSL']-RDM) / sl[il]['TSL']
-                sl[il]['Wpot'] = 1.0 - sl[il]['Wund'] - sl[il]['Wtop']
-                
-            # not rooted
-            elif (il < ILM):                # at the end fully rooted
-                sl[il]['Wtop'] = 0.0
-                sl[il]['Wpot'] = 1.0
-                sl[il]['Wund'] = 0.0
-            elif (il == ILM):               # at the end partly rooted
-                sl[il]['Wtop'] = 0.0
-                sl[il]['Wund'] = (sl[il]['LBSL']-RDM) / sl[il]['TSL']
-                sl[il]['Wpot'] = 1.0 - sl[il]['Wund']
-                
-            # never rooted
-            else:                           
-                sl[il]['Wtop'] = 0.0
-                sl[il]['Wpot'] = 0.0
-                sl[il]['Wund'] = 1.0
-                
-            #msg = 'layer %i: %f %f weights top %f pot %f und %f' % \
-            #       (il, sl[il]['TSL'], sl[il]['LBSL'], \
-            #        sl[il]['Wtop'], sl[il]['Wpot'], sl[il]['Wund'])
-            #print msg
+        #print "---\nlayer_weights ILR: %i ILM: %i RD: %f RDM: %f\n---" % \
+        # (ILR, ILM, RD, RDM)
+
+        # rooted layers, not rooted layers that will be rooted at the end and
+        # never rooted layers
+        Wtop[:] = 0.0
+        Wpot[:] = 0.0
+        Wund[:] = 0.0
+        Wtop[:ILR] = 1.0
+        Wpot[ILR+1:ILM] = 1.0
+        Wund[ILM+1:] = 1.0
+
+        # partly rooted
+        Wtop[ILR] = 1.0 - (LBSL[ILR]-RD) / TSL[ILR]
+        if ILR < ILM:   # at the end fully rooted
+            Wpot[ILR] = 1.0 - Wtop[ILR]
+            # not rooted, at the end partly rooted
+            Wund[ILM] = (LBSL[ILM]-RDM) / TSL[ILM]
+            Wpot[ILM] = 1.0 - Wund[ILM]
+        else:           # at the end partly rooted
+            Wund[ILR] = (LBSL[ILR]-RDM) / TSL[ILR]
+            Wpot[ILR] = 1.0 - Wund[ILR] - Wtop[ILR]
 
     def _SUBSOL(self, PF, D, CONTAB):
         """SUBSOL...
+
+        Returns the capillary rise (positive) from the groundwater at
+        distance D below a layer with suction PF, or the downward flow
+        (negative). CONTAB is evaluated for arrays.
         """
-        
-        DEL = np.zeros(4)
-        PFGAU = np.zeros(12)
-        HULP = np.zeros(12)
-        CONDUC = np.zeros(12)
-        
-        ELOG10 = 2.302585
-        LOGST4 = 2.518514
-        
-        START  = np.array([0, 45, 170, 330])
-        PFSTAN = np.array([0.705143, 1.352183, 1.601282, 1.771497, 2.031409, \
-                           2.192880, 2.274233, 2.397940, 2.494110])
-        PGAU = np.array([0.1127016654, 0.5, 0.8872983346])
-        WGAU = np.array([0.2777778, 0.4444444, 0.2777778])
-        
         # calculation of matric head and check on small pF
         PF1 = PF
         D1  = D
@@ -1159,40 +1162,26 @@ class WaterbalanceLayered(SimulationObject):
             K0   = exp(ELOG10 * CONTAB(-1))
             FLOW = K0 * (MH/D-1)
         else:
-            IINT = 0
-            
             # number and width of integration intervals
-            for I1 in range (0, 4):
-                if I1 <= 2:
-                    DEL[I1] = min(START[I1+1],MH)-START[I1]
-                elif I1 == 3:
-                    DEL[I1] = PF1-LOGST4
-                    
-                if DEL[I1] <= 0:
-                    break;
-                
-                IINT += 1
-    
-            # preparation of three-point Gaussian integration
-            for I1 in range (0, IINT):
-                for I2 in range (0, 3):
-                    I3 = (3*I1) + I2
-                    
-                    if I1 == IINT-1:
-                        # the three points in the last interval are calculated
-                        if IINT <= 3:
-                            PFGAU[I3] = log10 (START[IINT-1] + PGAU[I2] * DEL[IINT-1])
-                        elif IINT == 4:
-                            PFGAU[I3] = LOGST4 + PGAU[I2] * DEL[IINT-1]
-                    else:
-                        PFGAU[I3] = PFSTAN[I3]
+            DEL = np.empty(4)
+            DEL[:3] = np.minimum(SUBSOL_START[1:], MH) - SUBSOL_START[:3]
+            DEL[3] = PF1 - LOGST4
+            IINT = 4 if (DEL > 0).all() else int(np.argmin(DEL > 0))
+
+            # preparation of three-point Gaussian integration, the standard
+            # points of the complete intervals are fixed, the three points in
+            # the last interval are calculated
+            PFGAU = np.empty(3*IINT)
+            PFGAU[:-3] = PFSTAN[:3*IINT-3]
+            if IINT <= 3:
+                PFGAU[-3:] = np.log10(SUBSOL_START[IINT-1] + SUBSOL_PGAU * DEL[IINT-1])
+            else:
+                PFGAU[-3:] = LOGST4 + SUBSOL_PGAU * DEL[IINT-1]
 
-                    # variables needed in the loop below
-                    CONDUC[I3] = exp(ELOG10 * CONTAB(PFGAU[I3]))
-                    HULP[I3]   = DEL[I1] * WGAU[I2] * CONDUC[I3]
-                    
-                    if I3 > 8:
-                        HULP[I3] = HULP[I3] * ELOG10 * exp(ELOG10 * PFGAU[I3]);
+            # variables needed in the loop below
+            CONDUC = np.exp(ELOG10 * CONTAB(PFGAU))
+            HULP   = np.repeat(DEL[:IINT], 3) * np.tile(SUBSOL_WGAU, IINT) * CONDUC
+            HULP[9:] = HULP[9:] * ELOG10 * np.exp(ELOG10 * PFGAU[9:])
     
             # 15.5 setting upper and lower limit
             FU = 1.27
@@ -1201,17 +1190,13 @@ class WaterbalanceLayered(SimulationObject):
             if MH >= D1: FL = 0
             if MH != D1:
                 # Iteration loop
-                IMAX = 3 * IINT;
-                
                 for I1 in range (0, 15):
                     FLW = (FU+FL)/2
                     DF  = (FU-FL)/2
                     if DF < 0.01 and DF/abs(FLW) < 0.1: 
                         break
 
-                    Z = 0
-                    for I2 in range (0, IMAX):
-                        Z += HULP[I2]/(CONDUC[I2] + FLW)
+                    Z = (HULP/(CONDUC + FLW)).sum()
 
                     if Z >= D1: FL = FLW
                     if Z <= D1: FU = FLW
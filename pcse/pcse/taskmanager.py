@@ -9,6 +9,7 @@ Classes defined here:
 """
 
 import os
+import uuid
 import logging
 import sqlalchemy as sa
 from sqlalchemy import select, and_, MetaData, Table
@@ -21,8 +22,20 @@ class TaskManager:
 
     Public methods:
     get_task() - picks a 'Pending' task from the list
+    get_tasks(n) - claims a batch of at most n 'Pending' tasks at once
+    get_tasks_by(column, n) - claims the 'Pending' tasks with the first n
+        values of column, e.g. all tasks for a grid cell
     set_task_finished(task) - set the task status to 'Finished'
     set_task_error(task) - set the task status to 'Error occurred'
+    set_tasks_finished(tasks) - set the status of a batch to 'Finished'
+    set_tasks_error(tasks) - set the status of a batch to 'Error occurred'
+    release_tasks(tasks) - return claimed but unprocessed tasks to 'Pending'
+
+    Batches of tasks are claimed with a single UPDATE statement that tags the
+    claimed rows with a unique claim token in the 'comment' column. The rows
+    are then retrieved by that token. This avoids locking the entire
+    tasklist table for every task that is handed out, which becomes the
+    bottleneck when many workers are polling the same table.
     """
     validstatus = ['Pending', 'In progress', 'Finished',
                    'Error occurred']
@@ -118,22 +131,172 @@ class TaskManager:
         elif self.dbtype=="sqlite":
             pass # No locking needed for SQLite: assuming one client only.
         
+#-------------------------------------------------------------------------------
+    def get_tasks(self, n=100):
+        """Claims a batch of at most `n` 'Pending' tasks in one round trip.
+
+        :param n: the maximum number of tasks to claim
+        :returns: a list of task dictionaries, empty when no 'Pending'
+            tasks are left.
+
+        The tasks are reserved with a single UPDATE statement which tags
+        them with a unique claim token. For MySQL this is an
+        `UPDATE ... ORDER BY task_id LIMIT n` which only takes row locks,
+        for SQLite the task_ids are selected in a subquery of the same
+        statement. Oracle does not support either construct, so here the
+        table is locked once per batch instead of once per task.
+        """
+        n = int(n)
+        if n < 1:
+            msg = "Number of tasks to claim should be >= 1, got %s" % n
+            raise RuntimeError(msg)
+
+        tasklist = self.table_tasklist
+        token = "claim %s" % uuid.uuid4().hex
+        conn = self.engine.connect()
+        try:
+            if self.dbtype == "mysql":
+                sql = ("UPDATE %s SET status='In progress', hostname=:hostname, "
+                       "process_id=:process_id, comment=:token "
+                       "WHERE status='Pending' ORDER BY task_id LIMIT %i")
+                u = sa.text(sql % (self.tasklist_tablename, n))
+                conn.execute(u, hostname=self.hostname,
+                             process_id=self.process_id, token=token)
+            else:
+                self._lock_table(conn)
+                ids = select([tasklist.c.task_id],
+                             tasklist.c.status=='Pending',
+                             order_by=[tasklist.c.task_id], limit=n)
+                if self.dbtype == "oracle":
+                    # Materialize the ids as Oracle does not accept a
+                    # limited subquery on the table being updated
+                    ids = [row[0] for row in conn.execute(ids)]
+                if self.dbtype == "sqlite" or ids:
+                    u = tasklist.update(and_(tasklist.c.status=='Pending',
+                                             tasklist.c.task_id.in_(ids)))
+                    conn.execute(u, status='In progress',
+                                 hostname=self.hostname,
+                                 process_id=self.process_id, comment=token)
+                self._unlock_table(conn)
+
+            s = select([tasklist], and_(tasklist.c.status=='In progress',
+                                        tasklist.c.comment==token),
+                       order_by=[tasklist.c.task_id])
+            tasks = [dict(row) for row in conn.execute(s)]
+        finally:
+            conn.close()
+        return tasks
+
+#-------------------------------------------------------------------------------
+    def get_tasks_by(self, column, n=1):
+        """Claims all 'Pending' tasks with the first `n` values of `column`.
+
+        :param column: name of the column in the tasklist by which tasks are
+            grouped, e.g. a column identifying the grid cell of a task.
+        :param n: the maximum number of values of column to claim tasks for
+        :returns: a list of task dictionaries ordered by column and task_id,
+            empty when no 'Pending' tasks are left.
+
+        This allows a worker to run all tasks that share their inputs. The
+        tasks are tagged with a claim token as in `get_tasks()`. For MySQL
+        the values are selected without locking the table, so a concurrent
+        worker may claim part of the tasks for a value. The selection is
+        repeated when all tasks were claimed by other workers.
+        """
+        n = int(n)
+        if n < 1:
+            msg = "Number of values to claim tasks for should be >= 1, got %s" % n
+            raise RuntimeError(msg)
+
+        tasklist = self.table_tasklist
+        group = tasklist.c[column]
+        token = "claim %s" % uuid.uuid4().hex
+        conn = self.engine.connect()
+        try:
+            while True:
+                if self.dbtype != "mysql":
+                    self._lock_table(conn)
+                s = select([group], tasklist.c.status=='Pending',
+                           order_by=[group], limit=n, distinct=True)
+                values = [row[0] for row in conn.execute(s)]
+                claimed = 0
+                if values:
+                    u = tasklist.update(and_(tasklist.c.status=='Pending',
+                                             group.in_(values)))
+                    claimed = conn.execute(u, status='In progress',
+                                           hostname=self.hostname,
+                                           process_id=self.process_id,
+                                           comment=token).rowcount
+                if self.dbtype != "mysql":
+                    self._unlock_table(conn)
+                if claimed > 0 or not values:
+                    break
+
+            s = select([tasklist], and_(tasklist.c.status=='In progress',
+                                        tasklist.c.comment==token),
+                       order_by=[group, tasklist.c.task_id])
+            tasks = [dict(row) for row in conn.execute(s)]
+        finally:
+            conn.close()
+        return tasks
+
+#-------------------------------------------------------------------------------
+    def _set_status(self, tasks, status, comment):
+        """Updates the status and comment of the given tasks in a single
+        statement.
+
+        No table lock is taken: the tasks were claimed by this process
+        and no other process will touch these rows.
+        """
+        task_ids = [task["task_id"] for task in tasks]
+        if not task_ids:
+            return
+        tasklist = self.table_tasklist
+        conn = self.engine.connect()
+        try:
+            u = tasklist.update(tasklist.c.task_id.in_(task_ids))
+            conn.execute(u, status=status, comment=comment)
+        finally:
+            conn.close()
+
 #-------------------------------------------------------------------------------
     def set_task_finished(self, task, comment="OK"):
         "Sets a task to status 'Finished'"
-        
-        conn = self.engine.connect()
-        self._lock_table(conn)
-        u = self.table_tasklist.update(self.table_tasklist.c.task_id==task["task_id"])
-        conn.execute(u, status='Finished', comment=comment)
-        self._unlock_table(conn)
-        
+
+        self._set_status([task], 'Finished', comment)
+
 #-------------------------------------------------------------------------------
     def set_task_error(self, task, comment=None):
         "Sets a task to status 'Error occurred'"
-        
+
+        self._set_status([task], 'Error occurred', comment)
+
+#-------------------------------------------------------------------------------
+    def set_tasks_finished(self, tasks, comment="OK"):
+        "Sets a batch of tasks to status 'Finished'"
+
+        self._set_status(tasks, 'Finished', comment)
+
+#-------------------------------------------------------------------------------
+    def set_tasks_error(self, tasks, comment=None):
+        "Sets a batch of tasks to status 'Error occurred'"
+
+        self._set_status(tasks, 'Error occurred', comment)
+
+#-------------------------------------------------------------------------------
+    def release_tasks(self, tasks):
+        """Returns claimed tasks that were not processed to status 'Pending'
+        so that they can be picked up by other workers."""
+
+        task_ids = [task["task_id"] for task in tasks]
+        if not task_ids:
+            return
+        tasklist = self.table_tasklist
         conn = self.engine.connect()
-        self._lock_table(conn)
-        u = self.table_tasklist.update(self.table_tasklist.c.task_id==task["task_id"])
-        conn.execute(u, status='Error occurred', comment=comment)
-        self._unlock_table(conn)
+        try:
+            u = tasklist.update(and_(tasklist.c.task_id.in_(task_ids),
+                                     tasklist.c.status=='In progress'))
+            conn.execute(u, status='Pending', hostname=None, process_id=None,
+                         comment=None)
+        finally:
+            conn.close()
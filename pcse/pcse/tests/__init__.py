@@ -11,6 +11,17 @@ import test_evapotranspiration
 import test_respiration
 import test_wofost
 import test_penmanmonteith
+import test_taskmanager
+import test_hdf5reader
+import test_batch_engine
+import test_batch_phenology
+import test_states_rates
+import test_signals
+import test_engine
+import test_astro
+import test_afgen
+import test_leaf_dynamics
+import test_waterbalance_layered
 
 def test_all(dsn=None):
     allsuites = unittest.TestSuite([test_abioticdamage.suite(), 
@@ -19,5 +30,16 @@ def test_all(dsn=None):
                                     test_evapotranspiration.suite(),
                                     test_respiration.suite(),
                                     test_penmanmonteith.suite(),
+                                    test_taskmanager.suite(),
+                                    test_hdf5reader.suite(),
+                                    test_batch_engine.suite(),
+                                    test_batch_phenology.suite(),
+                                    test_states_rates.suite(),
+                                    test_signals.suite(),
+                                    test_engine.suite(),
+                                    test_astro.suite(),
+                                    test_afgen.suite(),
+                                    test_leaf_dynamics.suite(),
+                                    test_waterbalance_layered.suite(),
                                     test_wofost.suite(dsn)])
     unittest.TextTestRunner(verbosity=2).run(allsuites)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests FastAfgen against Afgen and its use for the AFGEN tables of
+ParamTemplate.
+"""
+import unittest
+import random
+
+import numpy as np
+
+from ..util import Afgen, FastAfgen
+from ..base_classes import ParamTemplate
+from ..traitlets import AfgenTrait, Float
+
+tables = [[0,0,1,1,5,10],
+          [0,0.01, 10,0.6, 15,1, 25,1, 35,0],
+          [-8, 0, -4, 0, 3, 1, 10, 1, 17, 0, 20, 0],
+          # closely spaced breakpoints, trailing (0, 0) pairs
+          [0,1, 1e-9,2, 1e-8,3, 0.001,4, 100,5, 0,0, 0,0],
+          [3., 4.]]
+
+class Test_FastAfgen(unittest.TestCase):
+
+    def _get_values(self, afgen):
+        random.seed(1)
+        x = [random.uniform(-10., 40.) for i in range(2000)]
+        for xp in afgen.x_list:
+            x.extend([xp, np.nextafter(xp, -1e9), np.nextafter(xp, 1e9)])
+        return x
+
+    def test_scalar(self):
+        for tbl in tables:
+            afgen = Afgen(tbl)
+            for size in (1, 7, 256):
+                fast = FastAfgen(tbl, size=size)
+                for x in self._get_values(afgen):
+                    self.assertEqual(fast(x), afgen(x))
+
+    def test_array(self):
+        for tbl in tables:
+            afgen = Afgen(tbl)
+            fast = FastAfgen(tbl)
+            x = np.array(self._get_values(afgen))
+            v = fast(x)
+            self.assertTrue(isinstance(v, np.ndarray))
+            self.assertTrue(np.all(v == [afgen(xi) for xi in x]))
+            self.assertTrue(np.all(fast(x[:6].reshape(2, 3)) ==
+                                   v[:6].reshape(2, 3)))
+
+    def test_parameters(self):
+        class Parameters(ParamTemplate):
+            TB = AfgenTrait()
+            A = Float()
+        params = Parameters({"TB":[0,0,1,1,5,10], "A":1.})
+        self.assertTrue(isinstance(params.TB, FastAfgen))
+        self.assertEqual(params.TB(1.5), 2.125)
+        afgen = Afgen([0,0,1,1])
+        params.TB = afgen
+        self.assertTrue(params.TB is afgen)
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_FastAfgen))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -2,10 +2,14 @@
 # Copyright (c) 2004-2014 Alterra, Wageningen-UR
 # Allard de Wit (allard.dewit@wur.nl), April 2014
 import unittest
-from datetime import date
+from datetime import date, timedelta
+
+import numpy as np
 
 from ..base_classes import VariableKiosk
-from ..crop.assimilation import WOFOST_Assimilation
+from ..crop import assimilation
+from ..crop.assimilation import WOFOST_Assimilation, totass
+from ..util import astro
 
 #-------------------------------------------------------------------------------
 class Test_WOFOST_Assimilation(unittest.TestCase):
@@ -57,10 +61,80 @@ class Test_WOFOST_Assimilation(unittest.TestCase):
             rpgass = self.assim(day, drv)
             self.assertAlmostEqual(rpgass, PGASS, 3)
 
+class Test_totass(unittest.TestCase):
+
+    def setUp(self):
+        # Combinations of astronomical conditions (latitude, day of year and
+        # radiation) and crop state, including those without assimilation.
+        args = []
+        for LAT in (-60., 0., 37.64, 52., 68.):
+            for IDAY in range(1, 366, 15):
+                for IRRAD in (1.e5, 5.e6, 1.5e7, 3.e7):
+                    day = date(2000, 12, 31) + timedelta(days=IDAY)
+                    r = astro(day, LAT, IRRAD)
+                    for LAI in (0., 0.3, 2., 6.):
+                        for AMAX in (0., 1.5, 35.):
+                            args.append((r.DAYL, AMAX, 0.45, LAI, 0.6, IRRAD,
+                                         r.DIFPP, r.DSINBE, r.SINLD, r.COSLD))
+        self.args = args
+        self.assim = WOFOST_Assimilation(date(2000, 1, 1), VariableKiosk(),
+                                         {"AMAXTB":[0,35.83, 2,4.48],
+                                          "EFFTB":[0.,0.45, 40.,0.45],
+                                          "KDIFTB":[0,0.6, 2,0.6],
+                                          "TMPFTB":[0,0.01, 35,0],
+                                          "TMNFTB":[0.,0., 3.,1.]})
+
+    def test_python(self):
+        DTGA = totass(*np.array(self.args).T)
+        self.assertEqual(DTGA.shape, (len(self.args),))
+        for args, dtga in zip(self.args, DTGA):
+            self.assertEqual(self.assim._totass(*args), dtga)
+
+    def test_broadcasting(self):
+        args = np.array(self.args[-12:]).T
+        DTGA = totass(*args)
+        self.assertTrue(np.all(totass(*[a.reshape(3, 4) for a in args]) ==
+                               DTGA.reshape(3, 4)))
+        # one day for several values of LAI
+        LAI = np.array([0., 0.3, 2., 6.])
+        dtga = totass(args[0,-1], 35., 0.45, LAI, *args[4:,-1])
+        for i in range(4):
+            self.assertEqual(dtga[i], self.assim._totass(args[0,-1], 35., 0.45,
+                                                         LAI[i], *args[4:,-1]))
+        self.assertEqual(totass(*self.args[0]).shape, (1,))
+
+    def test_broadcasting_2d(self):
+        # All elements assimilate, so no elements are masked
+        args = np.array([a for a in self.args if a[1] > 0. and a[3] > 0.
+                         and a[0] > 0.][:12]).T
+        DTGA = totass(*args)
+        self.assertTrue(np.all(DTGA > 0.))
+        for shape in [(3, 4), (4, 3), (2, 3, 2)]:
+            dtga = totass(*[a.reshape(shape) for a in args])
+            self.assertEqual(dtga.shape, shape)
+            self.assertTrue(np.all(dtga == DTGA.reshape(shape)))
+        # days along the rows broadcast against LAI along the columns
+        LAI = np.array([0.3, 2., 6.])
+        dtga = totass(args[0][:, None], 35., 0.45, LAI[None, :],
+                      *[a[:, None] for a in args[4:]])
+        self.assertEqual(dtga.shape, (12, 3))
+        for i in range(12):
+            for j in range(3):
+                self.assertEqual(dtga[i, j], self.assim._totass(
+                    args[0][i], 35., 0.45, LAI[j], *args[4:, i]))
+
+    def test_fortran(self):
+        if assimilation.ftotass is None:
+            self.skipTest("FORTRAN version of TOTASS is not available.")
+        DTGA = totass(*np.array(self.args).T)
+        for args, dtga in zip(self.args, DTGA):
+            self.assertAlmostEqual(assimilation.ftotass(*args), dtga, 3)
+
 def suite():
     """ This defines all the tests of a module"""
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(Test_WOFOST_Assimilation))
+    suite.addTest(unittest.makeSuite(Test_totass))
     return suite
 
 if __name__ == '__main__':
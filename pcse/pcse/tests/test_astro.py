@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests astro() and daylength() based on the astronomical tables against
+the array version in pcse.batch.util and the scalar daylength calculation.
+"""
+import unittest
+import datetime
+
+import numpy as np
+
+from .. import util
+from ..util import astro, daylength, astro_tables, doy
+from ..batch import util as batch_util
+
+latitudes = [-90., -66.6, -52.25, -0.25, 0., 23.5, 52., 67.75, 89.75, 90.]
+
+class Test_Astro(unittest.TestCase):
+
+    def test_astro(self):
+        days = [datetime.date(2000, 1, 1) + datetime.timedelta(days=i)
+                for i in range(0, 366, 5)]
+        IDAY = np.array([doy(day) for day in days])
+        for LAT in latitudes:
+            for radiation in [0., 1.e6, 1.5e7, 3.e7]:
+                r = batch_util.astro(IDAY, np.repeat(LAT, len(days)),
+                                     np.repeat(radiation, len(days)))
+                for i, day in enumerate(days):
+                    a = astro(day, LAT, radiation)
+                    for j, name in enumerate(a._fields):
+                        self.assertAlmostEqual(getattr(a, name), r[j][i], 7)
+
+    def test_daylength(self):
+        for LAT in latitudes:
+            for i in range(0, 366, 7):
+                day = datetime.date(2001, 1, 1) + datetime.timedelta(days=i)
+                self.assertAlmostEqual(daylength(day, LAT),
+                                       daylength(day, LAT, angle=-4.000001), 3)
+                self.assertEqual(daylength(day, LAT), astro(day, LAT, 1.e7).DAYLP)
+        self.assertRaises(RuntimeError, daylength, day, 91.)
+        self.assertRaises(RuntimeError, astro, day, -91., 0.)
+
+    def test_cache(self):
+        size = util.ASTRO_CACHE_SIZE
+        try:
+            util.ASTRO_CACHE_SIZE = 3
+            util._astro_tables.clear()
+            t0 = astro_tables(0.)
+            for LAT in [1., 2., 0., 3.]:
+                astro_tables(LAT)
+            self.assertEqual(util._astro_tables.keys(), [2., 0., 3.])
+            self.assertTrue(astro_tables(0.) is t0)
+            self.assertEqual(len(t0.DAYL), 367)
+        finally:
+            util.ASTRO_CACHE_SIZE = size
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_Astro))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the BatchEngine against the results of the scalar Engine for the
+crops in the demo database.
+"""
+import os
+import unittest
+import datetime
+
+from sqlalchemy import create_engine, MetaData
+
+from .. import db
+from ..engine import Engine
+from ..batch import BatchEngine
+from ..exceptions import PCSEError
+from ..settings import settings
+
+grid = 31031
+year = 2000
+crops = [1, 2, 3, 7, 10, 11]
+
+def get_cells(dsn):
+    """Returns the inputs for each crop in the database and for variants with
+    another crop calendar, day length sensitivity, vernalisation and oxygen
+    stress."""
+    metadata = MetaData(create_engine(dsn))
+    cells = []
+    for i, crop in enumerate(crops):
+        sitedata = db.pcse.fetch_sitedata(metadata, grid, year)
+        timerdata = db.pcse.fetch_timerdata(metadata, grid, year, crop)
+        cropdata = db.pcse.fetch_cropdata(metadata, grid, year, crop)
+        soildata = db.pcse.fetch_soildata(metadata, grid)
+        wdp = db.pcse.GridWeatherDataProvider(metadata, grid_no=grid,
+                startdate=timerdata["START_DATE"],
+                enddate=timerdata["END_DATE"])
+        cells.append((sitedata, timerdata, soildata, cropdata, wdp))
+
+        timer = dict(timerdata)
+        timer["CROP_START_TYPE"] = "sowing"
+        timer["CROP_START_DATE"] += datetime.timedelta(days=20)
+        cells.append((sitedata, timer, soildata, cropdata, wdp))
+
+        timer = dict(timerdata)
+        timer["CROP_END_TYPE"] = ["harvest", "earliest"][i % 2]
+        timer["CROP_END_DATE"] = timer["START_DATE"] + \
+                                 datetime.timedelta(days=100 + 40*i)
+        cells.append((sitedata, timer, soildata, cropdata, wdp))
+
+        crop = dict(cropdata, IDSL=2, DLO=16., DLC=10., VERNSAT=30.,
+                    VERNBASE=5., VERNDVS=0.3,
+                    VERNRTB=[-8, 0, -4, 0, 3, 1, 10, 1, 17, 0, 20, 0])
+        cells.append((sitedata, timerdata, soildata, crop, wdp))
+
+        crop = dict(cropdata, IOX=1)
+        soil = dict(soildata, CRAIRC=0.2)
+        cells.append((sitedata, timerdata, soil, crop, wdp))
+    return cells
+
+class Test_BatchEngine(unittest.TestCase):
+    dsn = "sqlite:///" + os.path.join(settings.PCSE_USER_HOME, "pcse.db")
+
+    def setUp(self):
+        self.cells = get_cells(self.dsn)
+
+    def _run_scalar(self, config):
+        output = []
+        for sitedata, timerdata, soildata, cropdata, wdp in self.cells:
+            engine = Engine(dict(sitedata), dict(timerdata), dict(soildata),
+                            dict(cropdata), wdp, config=config)
+            engine.run_till_terminate()
+            output.append((engine.get_output(), engine.get_summary_output()))
+        return output
+
+    def _run_batch(self, config):
+        inputs = zip(*self.cells)
+        engine = BatchEngine(*[list(x) for x in inputs], config=config)
+        engine.run_till_terminate()
+        return zip(engine.get_output(), engine.get_summary_output())
+
+    def _compare(self, config):
+        for (out1, smry1), (out2, smry2) in zip(self._run_scalar(config),
+                                                self._run_batch(config)):
+            self.assertEqual(len(out1), len(out2))
+            self.assertEqual(len(smry1), len(smry2))
+            for rec1, rec2 in zip(out1 + smry1, out2 + smry2):
+                self.assertEqual(sorted(rec1.keys()), sorted(rec2.keys()))
+                for key, value in rec1.items():
+                    if isinstance(value, float):
+                        self.assertAlmostEqual(value, rec2[key],
+                                               delta=1e-6*max(1., abs(value)))
+                    else:
+                        self.assertEqual(value, rec2[key])
+
+    def test_waterlimited(self):
+        self._compare("GGCMI_WLP.conf")
+
+    def test_potential(self):
+        self._compare("GGCMI_PP.conf")
+
+    def test_unsupported_config(self):
+        inputs = [list(x) for x in zip(*self.cells[:1])]
+        self.assertRaises(PCSEError, BatchEngine, *inputs,
+                          config="Wofost71_PhenoOnly.conf")
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_BatchEngine))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the batched phenology against running the Engine with
+Wofost71_PhenoOnly.conf for the crops in the demo database.
+"""
+import os
+import unittest
+import datetime
+
+from sqlalchemy import create_engine, MetaData
+
+from .. import db
+from ..engine import Engine
+from ..batch.phenology import calc_tsums, simulate_tsums, get_temperatures
+from ..settings import settings
+from ..exceptions import WeatherDataProviderError
+
+grid = 31031
+crops = [1, 2, 3, 7, 10, 11]
+
+def get_timerdata(start_type="sowing"):
+    """Returns timer data for crop calendars with the end of the crop cycle
+    before, around and after maturity and beyond the simulated period."""
+    timers = []
+    for k, duration in enumerate([100, 200, 300, 420]):
+        start = datetime.date(2000, 1, 1) + datetime.timedelta(days=40*k)
+        crop_end = start + datetime.timedelta(days=duration)
+        timers.append({"START_DATE":start,
+                       "CROP_START_DATE":start + datetime.timedelta(days=20),
+                       "CROP_START_TYPE":start_type,
+                       "CROP_END_DATE":crop_end,
+                       "CROP_END_TYPE":"earliest",
+                       "END_DATE":crop_end + datetime.timedelta(days=10),
+                       "MAX_DURATION":365})
+    return timers
+
+class Test_BatchPhenology(unittest.TestCase):
+    dsn = "sqlite:///" + os.path.join(settings.PCSE_USER_HOME, "pcse.db")
+
+    def setUp(self):
+        self.metadata = MetaData(create_engine(self.dsn))
+        self.wdp = db.pcse.GridWeatherDataProvider(self.metadata, grid,
+                        datetime.date(1999, 12, 1), datetime.date(2001, 11, 30))
+
+    def _run_engine(self, cropdata, timers):
+        summary = []
+        for timerdata in timers:
+            engine = Engine({}, dict(timerdata), {"SMFCF":0.4}, dict(cropdata),
+                            self.wdp, config="Wofost71_PhenoOnly.conf")
+            engine.run(days=366)
+            summary.append(engine.get_summary_output())
+        return summary
+
+    def _get_cropdata(self, crop):
+        return db.pcse.fetch_cropdata(self.metadata, grid, 2000, crop)
+
+    def test_simulate_tsums(self):
+        timers = get_timerdata()
+        for crop in crops:
+            cropdata = self._get_cropdata(crop)
+            tsums = simulate_tsums(cropdata, self.wdp, timers)
+            for summary, tsum in zip(self._run_engine(cropdata, timers), tsums):
+                if summary:
+                    self.assertAlmostEqual(summary[0]["TSUM"], tsum, 7)
+                else:
+                    self.assertTrue(tsum is None)
+
+    def test_weather_range(self):
+        # A series starting before the first day with weather data fails the
+        # whole call, so the series outside the weather data range should be
+        # skipped first as in the TSUM task runner.
+        timers = get_timerdata()[:3]
+        early = dict(timers[0])
+        for key in ["START_DATE", "CROP_START_DATE", "CROP_END_DATE", "END_DATE"]:
+            early[key] -= datetime.timedelta(days=60)
+        self.assertTrue(early["START_DATE"] < self.wdp.first_date)
+        cropdata = self._get_cropdata(crops[0])
+        self.assertRaises(WeatherDataProviderError, simulate_tsums, cropdata,
+                          self.wdp, timers + [early])
+
+        valid = [t for t in timers + [early]
+                 if t["START_DATE"] >= self.wdp.first_date and
+                 t["END_DATE"] <= self.wdp.last_date]
+        self.assertEqual(valid, timers)
+        tsums = simulate_tsums(cropdata, self.wdp, valid)
+        for timerdata, tsum in zip(timers, tsums):
+            self.assertEqual(simulate_tsums(cropdata, self.wdp, [timerdata]),
+                             [tsum])
+
+    def test_daylength_and_vernalisation(self):
+        timers = get_timerdata("emergence")[:3]
+        start_dates = [t["START_DATE"] for t in timers]
+        TEMP, DOY = get_temperatures(self.wdp, start_dates, 367)
+        LAT = [self.wdp(day).LAT for day in start_dates]
+        for crop in crops:
+            cropdata = dict(self._get_cropdata(crop), IDSL=2, DLO=16., DLC=10.,
+                            VERNSAT=30., VERNBASE=5., VERNDVS=0.3,
+                            VERNRTB=[-8, 0, -4, 0, 3, 1, 10, 1, 17, 0, 20, 0])
+            r = calc_tsums(cropdata, TEMP, [20]*3,
+                           [(t["CROP_END_DATE"] - t["START_DATE"]).days
+                            for t in timers],
+                           start_type="emergence", LAT=LAT, DOY=DOY)
+            for j, summary in enumerate(self._run_engine(cropdata, timers)):
+                self.assertTrue(r["FINISHED"][j])
+                self.assertAlmostEqual(summary[0]["TSUM"], r["TSUM"][j], 7)
+                self.assertAlmostEqual(summary[0]["DVS"], r["DVS"][j], 7)
+                DOM = summary[0]["DOM"]
+                if DOM is None:
+                    self.assertEqual(r["DOM"][j], -1)
+                else:
+                    self.assertEqual((DOM - start_dates[j]).days, r["DOM"][j])
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_BatchPhenology))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
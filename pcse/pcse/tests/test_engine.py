@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests running successive seasons with Engine.reset() against new engines,
+the caching of parameters by CachedParameters and of configurations by the
+ConfigurationLoader, the output of the Engine, the simulation of the days
+before the crop is started, of successive campaigns of a crop calendar and
+the crop-free soil trajectories shared between crops.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+import datetime
+
+from sqlalchemy import create_engine, MetaData
+
+from .. import db
+from ..engine import Engine
+from ..base_classes import ParamTemplate, CachedParameters
+from ..traitlets import Float, AfgenTrait
+from ..util import ConfigurationLoader, get_output_predicate
+from ..exceptions import PCSEError
+from ..settings import settings
+from ..benchmarks import get_inputs
+from ..base_classes import VariableKiosk
+from ..soil.classic_waterbalance import WaterbalanceFD, CropFreeTrajectory
+
+grid = 31031
+
+class Parameters(ParamTemplate):
+    A = Float(-99.)
+    TB = AfgenTrait()
+
+class Test_CachedParameters(unittest.TestCase):
+
+    def test_cache(self):
+        parvalues = CachedParameters({"A":1., "TB":[0, 0, 10, 1]})
+        p = Parameters(parvalues)
+        self.assertTrue(Parameters(parvalues) is p)
+        self.assertEqual(p.TB(5), 0.5)
+        self.assertFalse(Parameters(dict(parvalues)) is p)
+        parvalues["A"] = 2.
+        p2 = Parameters(parvalues)
+        self.assertFalse(p2 is p)
+        self.assertEqual(p2.A, 2.)
+        parvalues2 = copy.deepcopy(parvalues)
+        self.assertTrue(isinstance(parvalues2, CachedParameters))
+        self.assertEqual(parvalues2.templates, {})
+        self.assertEqual(parvalues2, parvalues)
+
+class Test_ConfigurationLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache(self):
+        mconf = ConfigurationLoader("GGCMI_WLP.conf")
+        self.assertTrue(ConfigurationLoader("GGCMI_WLP.conf") is mconf)
+        self.assertTrue(isinstance(mconf.OUTPUT_VARS, tuple))
+        self.assertRaises(AttributeError, setattr, mconf, "OUTPUT_VARS", ())
+        ConfigurationLoader("GGCMI_PP.conf")
+        self.assertEqual(len(mconf.defined_attr), len(set(mconf.defined_attr)))
+
+        # A modified file is loaded again
+        fname = os.path.join(self.tmpdir, "test.conf")
+        shutil.copy(mconf.model_config_file, fname)
+        mconf1 = ConfigurationLoader(fname)
+        with open(fname, "a") as fp:
+            fp.write("OUTPUT_INTERVAL = 'monthly'\n")
+        mtime = os.path.getmtime(fname) + 10
+        os.utime(fname, (mtime, mtime))
+        mconf2 = ConfigurationLoader(fname)
+        self.assertFalse(mconf2 is mconf1)
+        self.assertEqual(mconf2.OUTPUT_INTERVAL, "monthly")
+
+    def test_output_predicate(self):
+        day = datetime.date(2000, 1, 31)
+        self.assertTrue(get_output_predicate("daily", 3)(day, 6))
+        self.assertFalse(get_output_predicate("daily", 3)(day, 7))
+        self.assertTrue(get_output_predicate("weekly", 1, day.weekday())(day, 0))
+        self.assertFalse(get_output_predicate("weekly", 1, 6)(day, 0))
+        self.assertTrue(get_output_predicate("dekadal")(day, 0))
+        self.assertTrue(get_output_predicate("monthly")(day, 0))
+        self.assertRaises(PCSEError, get_output_predicate, "yearly")
+
+class Test_EngineReset(unittest.TestCase):
+    dsn = "sqlite:///" + os.path.join(settings.PCSE_USER_HOME, "pcse.db")
+
+    def setUp(self):
+        metadata = MetaData(create_engine(self.dsn))
+        self.wdp = db.pcse.GridWeatherDataProvider(metadata, grid,
+                        datetime.date(1999, 12, 1), datetime.date(2001, 11, 30))
+
+    def _get_timers(self, timerdata):
+        """Returns the crop calendar shifted by 0, 45 and 90 days."""
+        timers = []
+        for k in range(3):
+            shift = datetime.timedelta(days=45*k)
+            timers.append(dict(timerdata))
+            for key in ["START_DATE", "CROP_START_DATE", "CROP_END_DATE",
+                        "END_DATE"]:
+                timers[-1][key] = timerdata[key] + shift
+        return timers
+
+    def test_reset(self):
+        for sitedata, timerdata, soildata, cropdata, _ in get_inputs(crops=(1, 3)):
+            timers = self._get_timers(timerdata)
+            new = []
+            for timer in timers:
+                engine = Engine(dict(sitedata), dict(timer), dict(soildata),
+                                dict(cropdata), self.wdp, config="GGCMI_WLP.conf")
+                engine.run_till_terminate()
+                new.append((engine.get_output(), engine.get_summary_output()))
+
+            reused = []
+            engine = Engine(dict(sitedata), dict(timers[0]), dict(soildata),
+                            dict(cropdata), self.wdp, config="GGCMI_WLP.conf")
+            nstates = len(engine.kiosk.registered_states)
+            for timer in timers:
+                if timer is not timers[0]:
+                    engine.reset(dict(timer), dict(sitedata))
+                self.assertEqual(len(engine.kiosk.registered_states), nstates)
+                engine.run_till_terminate()
+                reused.append((engine.get_output(), engine.get_summary_output()))
+            self.assertEqual(new, reused)
+
+class Test_EngineOutput(unittest.TestCase):
+
+    def test_output(self):
+        for sitedata, timerdata, soildata, cropdata, wdp in get_inputs(crops=(1,)):
+            engine = Engine(sitedata, timerdata, soildata, cropdata, wdp,
+                            config="GGCMI_WLP.conf")
+            variables = engine.mconf.OUTPUT_VARS + engine.mconf.SUMMARY_OUTPUT_VARS
+            records = []
+            while not engine.flag_terminate:
+                engine.run()
+                # the resolved variables are equal to get_variable()
+                getters = [engine._get_variable_getter(var) for var in variables]
+                self.assertEqual([f() for f in getters],
+                                 [engine.get_variable(var) for var in variables])
+                records = engine.get_output()
+            self.assertTrue(len(records) > 10)
+            columns = engine.get_output_columns()
+            self.assertEqual(len(columns["day"]), len(records))
+            for i, record in enumerate(records):
+                self.assertEqual(record, dict((var, columns[var][i])
+                                              for var in columns))
+
+        # The columns are extended when needed
+        engine._output_size = 3
+        for column in engine._output_columns.values():
+            del column[3:]
+        engine._n_output = 3
+        engine._save_output(engine.day)
+        self.assertEqual(len(engine.get_output_columns()["day"]), 4)
+
+class Test_EngineCropFreeDays(unittest.TestCase):
+
+    def setUp(self):
+        self.fast = settings.FAST_CROP_FREE_DAYS
+
+    def tearDown(self):
+        settings.FAST_CROP_FREE_DAYS = self.fast
+
+    def test_crop_free_days(self):
+        inputs = get_inputs(crops=(3, 11), days_before_start=45)
+        for config in ["GGCMI_WLP.conf", "GGCMI_PP.conf", "Wofost71_WLP_FD.conf"]:
+            for inp in inputs:
+                output = []
+                for setting, days in [(False, None), (True, None), (True, 10)]:
+                    settings.FAST_CROP_FREE_DAYS = setting
+                    engine = Engine(*[dict(x) for x in inp[:4]] + [inp[4]],
+                                    config=config)
+                    if days is None:
+                        engine.run_till_terminate()
+                    else:
+                        engine.run(days)
+                        self.assertEqual(engine.day - inp[1]["START_DATE"],
+                                         datetime.timedelta(days=days))
+                        self.assertEqual(engine.agromanagement.duration, days + 1)
+                        while not engine.flag_terminate:
+                            engine.run(days)
+                    output.append((engine.get_output(),
+                                   engine.get_summary_output(),
+                                   engine.soil.states.SM, engine.kiosk["SM"]))
+                self.assertEqual(output[0], output[1])
+                self.assertEqual(output[0], output[2])
+
+    def _get_soil_state(self, engine):
+        soil = engine.soil
+        state = {"day": engine.day, "kiosk": dict(engine.kiosk),
+                 "DSLR": soil.DSLR, "RINold": soil.RINold, "RDold": soil.RDold}
+        for obj in (soil.states, soil.rates):
+            for name in obj._valid_vars:
+                state[name] = getattr(obj, name)
+        return state
+
+    def test_crop_free_states(self):
+        # All soil states and rates are identical after every month of a
+        # crop-free period of several months before the crop start.
+        for crop, days_before_start in [(3, 90), (11, 130)]:
+            inp = get_inputs(crops=(crop,), days_before_start=days_before_start)[0]
+            for config in ["GGCMI_WLP.conf", "Wofost71_WLP_FD.conf"]:
+                states = []
+                for setting in [False, True]:
+                    settings.FAST_CROP_FREE_DAYS = setting
+                    engine = Engine(*[dict(x) for x in inp[:4]] + [inp[4]],
+                                    config=config)
+                    states.append([self._get_soil_state(engine)])
+                    while engine.crop is None:
+                        engine.run(30)
+                        states[-1].append(self._get_soil_state(engine))
+                self.assertTrue(len(states[0]) > 3)
+                self.assertEqual(states[0], states[1])
+
+class Test_CropCalendar(unittest.TestCase):
+    dsn = "sqlite:///" + os.path.join(settings.PCSE_USER_HOME, "pcse.db")
+
+    def setUp(self):
+        metadata = MetaData(create_engine(self.dsn))
+        self.wdp = db.pcse.GridWeatherDataProvider(metadata, grid,
+                        datetime.date(1999, 12, 1), datetime.date(2001, 11, 30))
+
+    def _get_campaign(self, year):
+        crop_start_date = datetime.date(year, 3, 6)
+        return {"CAMPAIGNYEAR": year, "CROP_START_DATE": crop_start_date,
+                "CROP_START_TYPE": "emergence",
+                "CROP_END_DATE": datetime.date(year, 9, 30),
+                "CROP_END_TYPE": "earliest", "MAX_DURATION": 300,
+                "START_DATE": crop_start_date - datetime.timedelta(days=90),
+                "END_DATE": datetime.date(year, 10, 10)}
+
+    def test_crop_calendar(self):
+        sitedata, _, soildata, cropdata, _ = get_inputs(crops=(3,))[0]
+        campaigns = [self._get_campaign(2000), self._get_campaign(2001)]
+        timerdata = {"START_DATE": campaigns[0]["START_DATE"],
+                     "END_DATE": campaigns[-1]["END_DATE"],
+                     "CAMPAIGNS": campaigns}
+        for config in ["GGCMI_PP", "GGCMI_WLP"]:
+            seasons = []
+            for campaign in campaigns:
+                engine = Engine(dict(sitedata), dict(campaign), dict(soildata),
+                                dict(cropdata), self.wdp, config=config + ".conf")
+                engine.run_till_terminate()
+                seasons.append((engine.get_output(), engine.get_summary_output()))
+
+            engine = Engine(dict(sitedata), dict(timerdata), dict(soildata),
+                            dict(cropdata), self.wdp,
+                            config=config + "_CropCalendar.conf")
+            engine.run_till_terminate()
+            self.assertTrue(engine.crop is None)
+            summary = engine.get_summary_output()
+            self.assertEqual(len(summary), 2)
+            # The first season is identical as the soil starts from the same
+            # state, the soil of the potential production is always at field
+            # capacity so the second season is identical as well.
+            self.assertEqual(summary[0], seasons[0][1][0])
+            self.assertEqual(engine.get_output()[:len(seasons[0][0])], seasons[0][0])
+            if config == "GGCMI_PP":
+                self.assertEqual(summary[1], seasons[1][1][0])
+                self.assertEqual(engine.get_output(), seasons[0][0] + seasons[1][0])
+            self.assertEqual(engine.day, summary[1]["DOM"])
+
+        # The crop must be finished before the next campaign starts
+        campaigns[0]["CROP_END_DATE"] = campaigns[1]["CROP_START_DATE"]
+        campaigns[0]["MAX_DURATION"] = 365
+        self.assertRaises(PCSEError, Engine, dict(sitedata), dict(timerdata),
+                          dict(soildata), dict(cropdata), self.wdp,
+                          config="GGCMI_WLP_CropCalendar.conf")
+
+class Test_CropFreeTrajectory(unittest.TestCase):
+
+    def test_trajectory(self):
+        sitedata, timerdata, soildata, cropdata, wdp = \
+            get_inputs(crops=(3,), days_before_start=45)[0]
+        start_date = timerdata["START_DATE"]
+        trajectory = CropFreeTrajectory(start_date, cropdata, soildata,
+                                        sitedata, wdp)
+        self.assertEqual(trajectory.key, CropFreeTrajectory.get_key(
+                         dict(cropdata), dict(soildata), dict(sitedata)))
+        soil = WaterbalanceFD(start_date, VariableKiosk(), dict(cropdata),
+                              dict(soildata), dict(sitedata))
+        day = start_date
+        soil.calc_rates(day, wdp(day))
+        # States are requested out of order to grow the trajectory in steps
+        self.assertEqual(len(trajectory.get_state(day + datetime.timedelta(days=10),
+                                                  wdp)), 32)
+        for i in range(40):
+            self.assertEqual(trajectory.get_state(day, wdp),
+                             soil.get_crop_free_state())
+            day += datetime.timedelta(days=1)
+            soil.integrate(day)
+            soil.calc_rates(day, wdp(day))
+        self.assertRaises(PCSEError, trajectory.get_state,
+                          start_date - datetime.timedelta(days=1), wdp)
+
+    def test_key(self):
+        # RDMCR enters the key as the maximum rooting depth of the soil
+        sitedata, _, soildata, cropdata, _ = get_inputs(crops=(3,))[0]
+        key = CropFreeTrajectory.get_key(dict(cropdata), dict(soildata),
+                                         dict(sitedata))
+        RDM = max(cropdata["RDI"], min(soildata["RDMSOL"], cropdata["RDMCR"]))
+        for RDMCR, equal in [(RDM, True), (RDM + 10., RDM == soildata["RDMSOL"]),
+                             (RDM - 10., False)]:
+            cropdata2 = dict(cropdata, RDMCR=RDMCR)
+            self.assertEqual(CropFreeTrajectory.get_key(
+                cropdata2, dict(soildata), dict(sitedata)) == key, equal)
+
+    def test_engine(self):
+        # A season starting 20 days before the crop start with the soil state
+        # restored from a trajectory starting 45 days before the crop start
+        # equals a season starting 45 days before the crop start.
+        for inp, inp20 in zip(get_inputs(crops=(3, 11), days_before_start=45),
+                              get_inputs(crops=(3, 11), days_before_start=20)):
+            sitedata, timerdata, soildata, cropdata, wdp = inp
+            engine = Engine(dict(sitedata), dict(timerdata), dict(soildata),
+                            dict(cropdata), wdp, config="GGCMI_WLP.conf")
+            engine.run_till_terminate()
+
+            trajectory = CropFreeTrajectory(timerdata["START_DATE"], cropdata,
+                                            soildata, sitedata, wdp)
+            engine20 = Engine(dict(sitedata), dict(inp20[1]), dict(soildata),
+                              dict(cropdata), wdp, config="GGCMI_WLP.conf")
+            engine20.soil_trajectory = trajectory
+            engine20.run_till_terminate()
+            self.assertEqual(engine20.get_summary_output(),
+                             engine.get_summary_output())
+            self.assertEqual(engine20.soil.get_crop_free_state(),
+                             engine.soil.get_crop_free_state())
+
+            # A trajectory starting on the START_DATE of the season gives the
+            # same results as simulating the season.
+            engine45 = Engine(dict(sitedata), dict(timerdata), dict(soildata),
+                              dict(cropdata), wdp, config="GGCMI_WLP.conf")
+            engine45.soil_trajectory = trajectory
+            engine45.run_till_terminate()
+            self.assertEqual(engine45.get_output(), engine.get_output())
+            self.assertEqual(engine45.get_summary_output(),
+                             engine.get_summary_output())
+
+            # The trajectory only applies to WaterbalanceFD
+            engine_pp = Engine(dict(sitedata), dict(inp20[1]), dict(soildata),
+                               dict(cropdata), wdp, config="GGCMI_PP.conf")
+            engine_pp.soil_trajectory = trajectory
+            self.assertRaises(PCSEError, engine_pp.run_till_terminate)
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_CachedParameters))
+    suite.addTest(unittest.makeSuite(Test_ConfigurationLoader))
+    suite.addTest(unittest.makeSuite(Test_EngineReset))
+    suite.addTest(unittest.makeSuite(Test_EngineOutput))
+    suite.addTest(unittest.makeSuite(Test_EngineCropFreeDays))
+    suite.addTest(unittest.makeSuite(Test_CropCalendar))
+    suite.addTest(unittest.makeSuite(Test_CropFreeTrajectory))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Steven Hoek (steven.hoek@wur.nl), August 2014
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+import tables
+
+from ..fileinput.hdf5reader import Hdf5WeatherDataProvider, Hdf5RowReader
+from ..exceptions import WeatherDataProviderError
+
+variables = ["irrad", "tmin", "tmax", "vap", "rain", "e0", "es0", "et0", "wind"]
+
+def make_test_file(fname, first_day=date(2000,1,1), ndays=731):
+    """Writes a HDF5 weather file with 2 rows and 3 columns of 1 degree
+    cells. Cell (column 2, row 1) has no data and cell (column 0, row 0)
+    lacks the record for the 11th day.
+    """
+    f = tables.open_file(fname, "w")
+    attrs = f.root._v_attrs
+    attrs.ncols = 3
+    attrs.nrows = 2
+    attrs.xllcorner = 0.
+    attrs.yllcorner = 50.
+    attrs.cellsize = 1.
+    attrs.NODATA_value = -9999.
+    attrs.group_prefix = "row"
+    attrs.table_prefix = "col"
+    attrs.index_format = "%03i"
+    f.create_array(f.root, "variables", variables)
+
+    dtype = [("day", "i4")] + [(v, "f4") for v in variables]
+    days = np.arange(first_day.toordinal(), first_day.toordinal() + ndays)
+    for i in range(2):
+        grp = f.create_group(f.root, "row_%03i" % i)
+        for k in range(3):
+            if (k, i) == (2, 1):
+                continue
+            recs = np.zeros(ndays, dtype=dtype)
+            recs["day"] = days
+            for n, v in enumerate(variables):
+                recs[v] = 10*i + k + 0.01*n + np.sin(days/10.)
+            if (k, i) == (0, 0):
+                recs = np.delete(recs, 10)
+            tbl = f.create_table(grp, "col_%03i" % k, recs)
+            tbl._v_attrs.elevation = 100.*i + k
+    f.close()
+
+#----------------------------------------------------------------------------
+class Test_Hdf5WeatherDataProvider(unittest.TestCase):
+    """Unit test for retrieving daily weather from the array store of the
+    Hdf5WeatherDataProvider.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = "weather.hdf5"
+        make_test_file(os.path.join(self.tmpdir, self.fname))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def runTest(self):
+        wdp = Hdf5WeatherDataProvider(self.fname, 51.5, 0.5, fpath=self.tmpdir)
+        self.assertEqual(wdp.first_date, date(2000,1,1))
+        self.assertEqual(wdp.last_date, date(2001,12,31))
+        self.assertEqual(wdp.missing, 1)
+        self.assertRaises(WeatherDataProviderError, wdp, date(2000,1,11))
+        self.assertRaises(WeatherDataProviderError, wdp, date(1999,12,31))
+        self.assertRaises(WeatherDataProviderError, wdp, date(2002,1,1))
+
+        f = tables.open_file(os.path.join(self.tmpdir, self.fname))
+        recs = f.root.row_000.col_000.read()
+        f.close()
+        for rec in recs[::50]:
+            rec = tuple(rec)
+            drv = wdp(date.fromordinal(rec[0]))
+            self.assertEqual(drv.DAY, date.fromordinal(rec[0]))
+            self.assertEqual((drv.LAT, drv.LON, drv.ELEV), (51.5, 0.5, 0.))
+            for v, value in zip(variables, rec[1:]):
+                self.assertEqual(getattr(drv, v.upper()), float(value))
+            self.assertFalse(hasattr(drv, "TEMP"))
+
+        # Containers are reused, including variables added to them
+        drv = wdp("20000201")
+        drv.add_variable("TEMP", 12., "Celsius")
+        self.assertTrue(wdp(date(2000,2,1)) is drv)
+        self.assertEqual(wdp(date(2000,2,1)).TEMP, 12.)
+
+#----------------------------------------------------------------------------
+class Test_Hdf5RowReader(unittest.TestCase):
+    """Unit test for reading weather data per grid row from a HDF5 file.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = "weather.hdf5"
+        make_test_file(os.path.join(self.tmpdir, self.fname))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def runTest(self):
+        reader = Hdf5RowReader(self.fname, fpath=self.tmpdir, max_rows=1)
+        try:
+            for lat in (51.5, 50.5):
+                for lon in (0.5, 1.5):
+                    wdp_ref = Hdf5WeatherDataProvider(self.fname, lat, lon,
+                                                      fpath=self.tmpdir)
+                    wdp = Hdf5WeatherDataProvider(self.fname, lat, lon,
+                                                  rowreader=reader)
+                    self.assertEqual(wdp.elevation, wdp_ref.elevation)
+                    self.assertEqual(wdp.first_date, wdp_ref.first_date)
+                    self.assertEqual(wdp.last_date, wdp_ref.last_date)
+                    for day in (date(2000,1,2), date(2000,7,15), date(2001,12,31)):
+                        for v in variables:
+                            v = v.upper()
+                            self.assertEqual(getattr(wdp(day), v),
+                                             getattr(wdp_ref(day), v))
+                    self.assertEqual(len(reader._rows), 1)
+
+            # cell without data on the row in memory
+            self.assertRaises(tables.NoSuchNodeError, Hdf5WeatherDataProvider,
+                              self.fname, 50.5, 2.5, rowreader=reader)
+        finally:
+            reader.close()
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_Hdf5WeatherDataProvider))
+    suite.addTest(unittest.makeSuite(Test_Hdf5RowReader))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the leaf classes of WOFOST_Leaf_Dynamics in the Engine.
+"""
+import unittest
+
+import numpy as np
+
+from ..engine import Engine
+from ..benchmarks import get_inputs
+
+class Test_WOFOST_Leaf_Dynamics(unittest.TestCase):
+
+    def setUp(self):
+        inputs = get_inputs(crops=(1,))[0]
+        self.engine = Engine(*[dict(x) for x in inputs[:4]] + [inputs[4]],
+                             config="GGCMI_WLP.conf")
+        timerdata = inputs[1]
+        days = (timerdata["CROP_START_DATE"] - timerdata["START_DATE"]).days
+        self.engine.run(days=days + 100)
+        self.leaf = self.engine.crop.lv_dynamics
+
+    def test_leaf_classes(self):
+        s = self.leaf.states
+        self.assertTrue(len(s.LV) > 1)
+        self.assertEqual(len(s.LV), len(s.SLA))
+        self.assertEqual(len(s.LV), len(s.LVAGE))
+        self.assertEqual(s.LVAGE[0], 0.)
+        self.assertTrue(np.all(np.diff(s.LVAGE) >= 0.))
+        self.assertEqual(s.LASUM, sum([lv*sla for lv, sla in zip(s.LV, s.SLA)]))
+        self.assertEqual(s.WLV, sum(s.LV))
+        self.assertEqual(s.LAI, self.engine.kiosk["LAI"])
+
+    def test_saved_states(self):
+        # Values from get_variable() do not change with the leaf classes
+        s = self.leaf.states
+        states = [self.engine.get_variable(v) for v in ("LV", "SLA", "LVAGE")]
+        saved = [a.copy() for a in states]
+        self.engine.set_variable("LAI", 0.9*s.LAI)
+        self.engine.run(days=5)
+        for a, b in zip(states, saved):
+            self.assertTrue(np.all(a == b))
+        self.assertFalse(np.all(s.LVAGE[-len(saved[2]):] == saved[2]))
+
+    def test_readonly_states(self):
+        # The leaf class states are read-only views for the current day
+        s = self.leaf.states
+        for a in (s.LV, s.SLA, s.LVAGE):
+            self.assertFalse(a.flags.writeable)
+            self.assertRaises(ValueError, a.__setitem__, 0, 1.)
+        LV, SLA, LVAGE = self.leaf._get_leaf_classes()
+        self.assertTrue(np.all(s.LV == LV))
+
+    def test_buffer(self):
+        # Leaf classes are kept in order when the buffer is shifted or grown
+        leaf = self.leaf
+        leaf._init_leaf_classes(0., 0., capacity=4)
+        leaf._hi -= 1
+        for n, remove in enumerate([0, 0, 1, 0, 0, 2, 0, 0, 0, 0, 0, 0]):
+            leaf._hi -= remove
+            leaf._add_leaf_class(n + 1., 1./(n + 1.))
+        LV, SLA, LVAGE = leaf._get_leaf_classes()
+        self.assertEqual(list(LV), [12., 11., 10., 9., 8., 7., 6., 5., 4.])
+        self.assertTrue(np.all(LV*SLA == 1.))
+        self.assertEqual(leaf._leaf.shape[1], 16)
+
+    def test_set_variable_LAI(self):
+        s = self.leaf.states
+        oLAI, oWLV, oLV = s.LAI, s.WLV, s.LV.copy()
+        SAI = self.engine.kiosk["SAI"]
+        PAI = self.engine.kiosk["PAI"]
+        increments = self.engine.set_variable("LAI", 1.2*oLAI)
+        rLAI = (1.2*oLAI - SAI - PAI)/(oLAI - SAI - PAI)
+        self.assertTrue(np.all(s.LV == oLV*rLAI))
+        self.assertAlmostEqual(s.LAI, 1.2*oLAI, 7)
+        self.assertEqual(s.WLV, sum(s.LV))
+        self.assertAlmostEqual(increments["LAI"], s.LAI - oLAI, 10)
+        self.assertAlmostEqual(increments["WLV"], s.WLV - oWLV, 10)
+        # The simulation continues with the adjusted leaf classes
+        self.engine.run(days=10)
+        self.assertEqual(s.LASUM, sum([lv*sla for lv, sla in zip(s.LV, s.SLA)]))
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_WOFOST_Leaf_Dynamics))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
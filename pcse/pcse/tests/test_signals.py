@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the SignalDispatcher that delivers the signals within a PCSE
+instance.
+"""
+import unittest
+
+from ..base_classes import SignalDispatcher, VariableKiosk
+from ..engine import Engine
+from ..benchmarks import get_inputs
+
+mysignal = "MYSIGNAL"
+
+class Receiver(object):
+
+    def __init__(self, received):
+        self.received = received
+
+    def on_signal(self, arg1, arg2=None):
+        self.received.append((self, arg1, arg2))
+
+    def on_signal_kwargs(self, **kwargs):
+        self.received.append((self, sorted(kwargs)))
+
+class Test_SignalDispatcher(unittest.TestCase):
+
+    def test_arguments(self):
+        received = []
+        d = SignalDispatcher()
+        r = Receiver(received)
+        d.connect(r.on_signal, mysignal)
+        d.send(mysignal, None, arg1=1, extra_arg="extra")
+        self.assertEqual(received.pop(), (r, 1, None))
+        d.send(mysignal, None, 2, arg2=3)
+        self.assertEqual(received.pop(), (r, 2, 3))
+        self.assertRaises(TypeError, d.send, mysignal, None, arg2=3)
+        d.connect(r.on_signal_kwargs, "OTHER")
+        d.send("OTHER", None, day=1)
+        self.assertEqual(received.pop(), (r, ["day", "sender", "signal"]))
+
+    def test_receivers(self):
+        received = []
+        d = SignalDispatcher()
+        r1 = Receiver(received)
+        r2 = Receiver(received)
+        d.connect(r1.on_signal, mysignal)
+        d.connect(r2.on_signal, mysignal)
+        # Connecting again moves the receiver to the end
+        d.connect(r1.on_signal, mysignal)
+        d.send(mysignal, None, arg1=1)
+        self.assertEqual([x[0] for x in received], [r2, r1])
+        del received[:]
+        # Receivers are weakly referenced
+        del r2
+        d.send(mysignal, None, arg1=1)
+        self.assertEqual(len(received), 1)
+        d.disconnect(r1)
+        d.send(mysignal, None, arg1=1)
+        self.assertEqual(len(received), 1)
+
+    def test_kiosks(self):
+        received = []
+        k1 = VariableKiosk()
+        k2 = VariableKiosk()
+        r = Receiver(received)
+        k1.dispatcher.connect(r.on_signal, mysignal)
+        k2.dispatcher.send(mysignal, k2, arg1=1)
+        self.assertEqual(received, [])
+
+    def test_engine(self):
+        inputs = get_inputs(crops=(1,))[0]
+        receivers = []
+        for _ in range(3):
+            engine = Engine(*[dict(x) for x in inputs[:4]] + [inputs[4]],
+                            config="GGCMI_WLP.conf")
+            engine.run_till_terminate()
+            dispatcher = engine.kiosk.dispatcher
+            receivers.append(sum(len(r) for r in dispatcher._receivers.values()))
+            self.assertTrue(engine.flag_terminate)
+        self.assertEqual(receivers[0], receivers[-1])
+
+    def test_engine_close(self):
+        inputs = get_inputs(crops=(1,))[0]
+        count = lambda d: sum(len(r) for r in d._receivers.values())
+        for _ in range(20):
+            engine = Engine(*[dict(x) for x in inputs[:4]] + [inputs[4]],
+                            config="GGCMI_WLP.conf")
+            dispatcher = engine.kiosk.dispatcher
+            n_start = count(dispatcher)
+            engine.run_till_terminate()
+            # Reset drops the receivers of the previous season
+            engine.reset(dict(inputs[1]))
+            self.assertEqual(count(dispatcher), n_start)
+            engine.run_till_terminate()
+            engine.close()
+            self.assertEqual(count(dispatcher), 0)
+            self.assertTrue(len(engine.get_summary_output()) > 0)
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_SignalDispatcher))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
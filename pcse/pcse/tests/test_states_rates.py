@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the fast states/rates classes (settings.FAST_STATES_RATES) against
+the default StatesTemplate and RatesTemplate.
+"""
+import unittest
+import datetime
+
+from ..base_classes import VariableKiosk, StatesTemplate, RatesTemplate
+from ..traitlets import Float, Int, Bool, Instance
+from ..exceptions import PCSEError
+from ..engine import Engine
+from ..settings import settings
+from ..benchmarks import get_inputs
+
+class StateVariables(StatesTemplate):
+    A = Float(-99.)
+    B = Int(-99)
+    C = Instance(datetime.date)
+
+class RateVariables(RatesTemplate):
+    RA = Float(-99.)
+    RB = Bool()
+
+class Test_FastStatesRates(unittest.TestCase):
+
+    def setUp(self):
+        self.fast = settings.FAST_STATES_RATES
+        settings.FAST_STATES_RATES = True
+
+    def tearDown(self):
+        settings.FAST_STATES_RATES = self.fast
+
+    def test_states(self):
+        kiosk = VariableKiosk()
+        s = StateVariables(kiosk, publish="A", A=1, B=2, C=None)
+        self.assertTrue(isinstance(s, StateVariables))
+        self.assertTrue("B" in type(s).__slots__)
+        # Validated at initialization
+        self.assertTrue(isinstance(s.A, float))
+        self.assertEqual(kiosk["A"], 1.)
+        self.assertTrue(kiosk.variable_exists("B"))
+        self.assertFalse("B" in kiosk)
+        s.A = 5.
+        self.assertEqual(kiosk["A"], 5.)
+        kiosk.flush_states()
+        s.touch()
+        self.assertEqual(kiosk["A"], 5.)
+        self.assertRaises(PCSEError, StateVariables, VariableKiosk(), A=1.,
+                          B=2)
+        self.assertRaises(PCSEError, StateVariables, VariableKiosk(),
+                          publish="D", A=1., B=2, C=None)
+        s._delete()
+        self.assertFalse(kiosk.variable_exists("A"))
+
+    def test_rates(self):
+        kiosk = VariableKiosk()
+        r = RateVariables(kiosk, publish=["RA"])
+        self.assertEqual(r.RA, 0.)
+        self.assertEqual(r.RB, False)
+        self.assertFalse("RA" in kiosk)
+        r.RA = 3.
+        self.assertEqual(kiosk["RA"], 3.)
+        r.zerofy()
+        self.assertEqual(r.RA, 0.)
+        # Classes are generated per set of published variables
+        r2 = RateVariables(VariableKiosk())
+        r2.RA = 4.
+        self.assertEqual(r.RA, 0.)
+        self.assertNotEqual(type(r), type(r2))
+
+    def test_engine(self):
+        for config in ["GGCMI_WLP.conf", "Wofost71_WLP_FD.conf"]:
+            for inputs in get_inputs(crops=(1, 3)):
+                output = []
+                for setting in (False, True):
+                    settings.FAST_STATES_RATES = setting
+                    engine = Engine(*[dict(x) for x in inputs[:4]] + [inputs[4]],
+                                    config=config)
+                    engine.run_till_terminate()
+                    output.append((engine.get_output(),
+                                   engine.get_summary_output()))
+                self.assertEqual(output[0], output[1])
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_FastStatesRates))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
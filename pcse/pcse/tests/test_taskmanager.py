@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+import os
+import unittest
+import tempfile
+
+import sqlalchemy as sa
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, select
+
+from ..taskmanager import TaskManager
+
+#----------------------------------------------------------------------------
+class Test_TaskManager_Batches(unittest.TestCase):
+    """Unit test for claiming and updating batches of tasks with the
+    TaskManager on an SQLite tasklist.
+    """
+    ntasks = 25
+
+    def setUp(self):
+        fd, self.dbfile = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = sa.create_engine("sqlite:///" + self.dbfile)
+        metadata = MetaData(self.engine)
+        tasklist = Table("tasklist", metadata,
+                         Column("task_id", Integer, primary_key=True),
+                         Column("status", String(16)),
+                         Column("hostname", String(50)),
+                         Column("crop_no", Integer),
+                         Column("tsum1", Float),
+                         Column("process_id", Integer),
+                         Column("comment", String(70)))
+        metadata.create_all()
+        recs = [{"task_id":i, "status":"Pending", "crop_no":1, "tsum1":1000.}
+                for i in range(1, self.ntasks + 1)]
+        tasklist.insert().execute(recs)
+        self.tasklist = tasklist
+        self.taskmanager = TaskManager(self.engine, dbtype="SQLite")
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.dbfile)
+
+    def _status(self):
+        s = select([self.tasklist.c.task_id, self.tasklist.c.status])
+        return dict(self.engine.execute(s).fetchall())
+
+    def runTest(self):
+        tm = self.taskmanager
+        batch1 = tm.get_tasks(10)
+        batch2 = tm.get_tasks(10)
+        batch3 = tm.get_tasks(10)
+        self.assertEqual([t["task_id"] for t in batch1], range(1, 11))
+        self.assertEqual([t["task_id"] for t in batch2], range(11, 21))
+        self.assertEqual([t["task_id"] for t in batch3], range(21, 26))
+        self.assertEqual(tm.get_tasks(10), [])
+        for task in batch1:
+            self.assertEqual(task["status"], "In progress")
+            self.assertEqual(task["process_id"], os.getpid())
+
+        tm.set_tasks_finished(batch1)
+        tm.set_tasks_error(batch2[:3], comment="PCSE Error")
+        tm.release_tasks(batch2[3:])
+        tm.set_task_finished(batch3[0])
+        status = self._status()
+        self.assertTrue(all(status[i] == "Finished" for i in range(1, 11)))
+        self.assertTrue(all(status[i] == "Error occurred" for i in (11, 12, 13)))
+        self.assertTrue(all(status[i] == "Pending" for i in range(14, 21)))
+        self.assertEqual(status[21], "Finished")
+
+        # Released tasks can be claimed again
+        batch4 = tm.get_tasks(100)
+        self.assertEqual([t["task_id"] for t in batch4], range(14, 21))
+        self.assertEqual(tm.get_task(), None)
+
+#----------------------------------------------------------------------------
+class Test_TaskManager_Groups(unittest.TestCase):
+    """Unit test for claiming all tasks for a grid cell with the TaskManager
+    on an SQLite tasklist.
+    """
+
+    def setUp(self):
+        fd, self.dbfile = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = sa.create_engine("sqlite:///" + self.dbfile)
+        metadata = MetaData(self.engine)
+        tasklist = Table("tasklist", metadata,
+                         Column("task_id", Integer, primary_key=True),
+                         Column("status", String(16)),
+                         Column("hostname", String(50)),
+                         Column("crop_no", Integer),
+                         Column("cell_id", Integer),
+                         Column("process_id", Integer),
+                         Column("comment", String(70)))
+        metadata.create_all()
+        # Three crops for each of four cells, the tasks of cell 20 are not
+        # contiguous
+        recs = []
+        for task_id, (cell_id, crop_no) in enumerate(
+                [(10, 1), (10, 2), (20, 1), (30, 1), (30, 2), (20, 2),
+                 (40, 1), (40, 2), (10, 3), (20, 3), (30, 3), (40, 3)]):
+            recs.append({"task_id":task_id + 1, "status":"Pending",
+                         "crop_no":crop_no, "cell_id":cell_id})
+        tasklist.insert().execute(recs)
+        self.taskmanager = TaskManager(self.engine, dbtype="SQLite")
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.dbfile)
+
+    def runTest(self):
+        tm = self.taskmanager
+        batch1 = tm.get_tasks_by("cell_id", 2)
+        self.assertEqual([t["task_id"] for t in batch1], [1, 2, 9, 3, 6, 10])
+        self.assertEqual([t["cell_id"] for t in batch1], [10]*3 + [20]*3)
+        for task in batch1:
+            self.assertEqual(task["status"], "In progress")
+
+        # Tasks released for one crop of a cell are claimed with that cell
+        tm.set_tasks_finished(batch1[:4])
+        tm.release_tasks(batch1[4:])
+        batch2 = tm.get_tasks_by("cell_id", 2)
+        self.assertEqual([t["task_id"] for t in batch2], [6, 10, 4, 5, 11])
+        batch3 = tm.get_tasks_by("cell_id", 2)
+        self.assertEqual([t["task_id"] for t in batch3], [7, 8, 12])
+        self.assertEqual(tm.get_tasks_by("cell_id"), [])
+        self.assertRaises(RuntimeError, tm.get_tasks_by, "cell_id", 0)
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_TaskManager_Batches))
+    suite.addTest(unittest.makeSuite(Test_TaskManager_Groups))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2004-2014 Alterra, Wageningen-UR
+# Allard de Wit (allard.dewit@wur.nl), April 2014
+"""Tests the layer arrays of WaterbalanceLayered on a synthetic soil profile
+without a crop.
+"""
+import unittest
+import datetime
+
+import numpy as np
+
+from ..base_classes import VariableKiosk
+from ..util import Afgen
+from ..soil.waterbalance import WaterbalanceLayered
+
+def get_soiltype(scale):
+    """Returns the soil parameters and tables of a synthetic soil type, the
+    matric flux potential is integrated with the trapezoidal rule."""
+    PF = [-1.0, 0.0, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.2, 6.0]
+    SM = [0.45, 0.44, 0.42, 0.39, 0.35, 0.29, 0.22, 0.16, 0.10, 0.01]
+    LOGK = [1.5, 1.2, 0.5, 0.0, -0.7, -1.6, -2.6, -3.6, -5.0, -9.0]
+    SM = [scale*sm for sm in SM]
+    K = [10**(logk + pf)*np.log(10.) for pf, logk in zip(PF, LOGK)]
+    MFP = [0.]
+    for i in range(len(PF)-2, -1, -1):
+        MFP.insert(0, MFP[0] + 0.5*(K[i] + K[i+1])*(PF[i+1] - PF[i]))
+    return {"SMTAB":Afgen(sum(zip(PF, SM), ())),
+            "PFTAB":Afgen(sum(zip(SM[::-1], PF[::-1]), ())),
+            "CONTAB":Afgen(sum(zip(PF, LOGK), ())),
+            "MFPTAB":Afgen(sum(zip(PF, MFP), ())),
+            "SM0":SM[0], "SMW":SM[-2], "SMFCF":SM[4], "SOPE":10.,
+            "K0":10., "KSUB":10., "CRAIRC":0.05}
+
+def get_soildata(groups):
+    soiltypes = {1:get_soiltype(1.0), 2:get_soiltype(0.8)}
+    layers = []
+    LBSL = 0.
+    for TSL, group in zip([10., 10., 20., 20., 40., 50.], groups):
+        LBSL += TSL
+        layers.append({"TSL":TSL, "LBSL":LBSL, "SOIL_GROUP_NO":group,
+                       "SOILTYPE":soiltypes[group]})
+    return {"NSL":len(layers), "SOIL_LAYERS":layers, "GW":0, "ZTI":999,
+            "DD":0}
+
+class Driver(object):
+    def __init__(self, day):
+        self.RAIN = [0., 0., 0.2, 0., 1.5, 0., 0., 3.][day % 8]
+        self.E0 = 0.4
+        self.ES0 = 0.3
+
+class Test_WaterbalanceLayered(unittest.TestCase):
+
+    def _get_waterbalance(self, groups):
+        cropdata = {"IAIRDU":0, "RDMCR":100., "RDI":10.}
+        sitedata = {"IFUNRN":0, "SSMAX":1., "SSI":0., "WAV":10., "NOTINF":0.,
+                    "SMLIM":0.4}
+        return WaterbalanceLayered(datetime.date(2000, 1, 1), VariableKiosk(),
+                                   cropdata, get_soildata(groups), sitedata, {})
+
+    def test_balance(self):
+        for groups in [(1, 1, 1, 1, 1, 1), (1, 1, 2, 2, 1, 1)]:
+            wb = self._get_waterbalance(groups)
+            day = datetime.date(2000, 1, 1)
+            for i in range(120):
+                wb.calc_rates(day, Driver(i))
+                wb.integrate(day)
+                day += datetime.timedelta(days=1)
+            s = wb.states
+            self.assertTrue(np.all(wb._SM == wb._WC/wb._TSL))
+            self.assertAlmostEqual(s.W, np.dot(wb._WC, wb._Wtop), 10)
+            self.assertAlmostEqual(s.WLOW, np.dot(wb._WC, wb._Wpot), 10)
+            self.assertTrue(s.PERCT > 0. and s.EVST > 0.)
+            # finalize raises an error when the water balance does not close
+            wb.finalize(day)
+            self.assertTrue(abs(s.WBALRT) < 0.0001)
+            self.assertTrue(abs(s.WBALTT) < 0.0001)
+
+    def test_layer_weights(self):
+        wb = self._get_waterbalance((1, 1, 1, 1, 1, 1))
+        for RD in [10., 15., 20., 35., 60., 99., 100.]:
+            ILR, ILM = wb._find_layers(RD)
+            self.assertTrue(wb._LBSL[ILR] >= RD)
+            self.assertTrue(ILR == 0 or wb._LBSL[ILR-1] < RD)
+            self.assertEqual(wb._LBSL[ILM], 100.)
+            wb._layer_weights(RD, wb.RDMSLB, ILR, ILM)
+            W = wb._Wtop + wb._Wpot + wb._Wund
+            self.assertTrue(np.allclose(W, 1.))
+            self.assertAlmostEqual(np.dot(wb._Wtop, wb._TSL), RD, 10)
+            self.assertAlmostEqual(np.dot(wb._Wtop + wb._Wpot, wb._TSL), 100., 10)
+
+def suite():
+    """ This defines all the tests of a module"""
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(Test_WaterbalanceLayered))
+    return suite
+
+if __name__ == '__main__':
+   unittest.TextTestRunner(verbosity=2).run(suite())
@@ -3,11 +3,10 @@
 # Allard de Wit (allard.dewit@wur.nl), April 2014
 import datetime
 
-from .pydispatch import dispatcher
 from .base_classes import AncillaryObject, VariableKiosk
 from .traitlets import HasTraits, Instance, Bool, Int, Enum
 from . import signals
-from .util import is_a_dekad, is_a_month, is_a_week, ConfigurationLoader
+from .util import ConfigurationLoader
 
 
 class Timer(AncillaryObject):
@@ -112,18 +111,8 @@ class Timer(AncillaryObject):
         elif not self._in_crop_cycle and self.output_only_in_crop_cycle:
         # Not in crop cycle and output only for crop cycle
             output = False
-        elif self.interval_type == "daily":
-            if (self.day_counter % self.interval_days) == 0:
-                output = True
-        elif self.interval_type == "weekly":
-            if is_a_week(self.current_date, self.output_weekday):
-                output = True
-        elif self.interval_type == "dekadal":
-            if is_a_dekad(self.current_date):
-                output = True
-        elif self.interval_type == "monthly":
-            if is_a_month(self.current_date):
-                output = True
+        elif self.mconf.is_output_day(self.current_date, self.day_counter):
+            output = True
 
         # Send output signal if True
         if output:
@@ -137,6 +126,29 @@ class Timer(AncillaryObject):
             
         return self.current_date
 
+    def quiet_days(self, days):
+        """Returns the number of following days, up to `days`, on which the
+        timer sends no OUTPUT or TERMINATE signals.
+
+        Assumes that the crop cycle does not start or finish on these days.
+        """
+        days = min(days, (self.final_date - self.current_date).days - 1)
+        if self.generate_output and \
+           (self._in_crop_cycle or not self.output_only_in_crop_cycle):
+            for i in range(1, days + 1):
+                if self.mconf.is_output_day(self.current_date + i*self.time_step,
+                                            self.day_counter + i):
+                    return i - 1
+        return max(days, 0)
+
+    def advance(self, days):
+        """Advances the timer with the given number of days without sending
+        signals and returns the new current date, see `quiet_days()`."""
+        self.current_date += days*self.time_step
+        self.day_counter += days
+        self.logger.debug("Model time advanced to: %s" % self.current_date)
+        return self.current_date
+
 
 def simple_test():
     "Only used for testing timer routine"
@@ -150,8 +162,7 @@ def simple_test():
     Start = datetime.date(2000,1,1)
     End = datetime.date(2000,2,1)
     kiosk = VariableKiosk()
-    dispatcher.connect(on_OUTPUT, signal=signals.output,
-                       sender=dispatcher.Any)
+    kiosk.dispatcher.connect(on_OUTPUT, signal=signals.output)
 
     mconf = Container()
     mconf.OUTPUT_INTERVAL = "dekadal"
@@ -73,7 +73,7 @@ from . import py3compat
 SequenceTypes = (list, tuple, set, frozenset)
 
 # Import needed for addition of AfgenTrait type
-from .util import Afgen
+from .util import Afgen, FastAfgen
 
 #-----------------------------------------------------------------------------
 # Basic classes
@@ -886,7 +886,7 @@ class AfgenTrait(TraitType):
         if isinstance(value, Afgen):
             return value
         elif isinstance(value, Iterable):
-            return Afgen(value)
+            return FastAfgen(value)
         self.error(obj, value)
 
 class Int(TraitType):
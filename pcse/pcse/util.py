@@ -7,7 +7,7 @@ import os, sys
 import datetime
 import copy
 from math import log10, cos, sin, asin, sqrt, exp
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from bisect import bisect_left
 try:
     # support both python2 and python3
@@ -413,7 +413,139 @@ def limit(min, max, v):
         return max
 
 
-def daylength(day, latitude, angle=-4, _cache={}):
+def limit_array(vmin, vmax, v):
+    """Array version of `limit`: limits the range of v between vmin and
+    vmax.
+    """
+    return np.where(v < vmin, vmin, np.where(v < vmax, v, vmax))
+
+
+# Maximum number of latitudes for which astro_tables() keeps the tables
+ASTRO_CACHE_SIZE = 64
+_astro_tables = OrderedDict()
+
+AstroTables = namedtuple("AstroTables", "DAYL, DAYLP, SINLD, COSLD, DSINBE, "
+                                        "SC, ANGOT")
+AstroResults = namedtuple("AstroResults", "DAYL, DAYLP, SINLD, COSLD, DIFPP, "
+                                          "ATMTR, DSINBE, ANGOT")
+
+def astro_tables(latitude):
+    """Returns the part of `astro()` that does not depend on radiation for
+    all days of the year at latitude.
+
+    :param latitude:    latitude of location
+
+    Returns a namedtuple `AstroTables` with lists of DAYL, DAYLP, SINLD,
+    COSLD, DSINBE (see `astro()`), the solar constant SC (J m-2 s-1) and
+    ANGOT indexed by day-of-year (index 0 is not used). The tables are
+    calculated at once with NumPy and are kept for the `ASTRO_CACHE_SIZE`
+    latitudes used most recently.
+    """
+    try:
+        tables = _astro_tables.pop(latitude)
+    except KeyError:
+        tables = _calc_astro_tables(latitude)
+        if len(_astro_tables) >= ASTRO_CACHE_SIZE:
+            _astro_tables.popitem(last=False)
+    _astro_tables[latitude] = tables
+    return tables
+
+def _calc_astro_tables(latitude):
+    t = astro_array(np.arange(367), latitude)
+    return AstroTables(*[v.tolist() for v in t])
+
+def _sinld_cosld(IDAY, LAT):
+    """Returns the seasonal offset and amplitude of the sine of solar height
+    (SINLD, COSLD) for arrays of day-of-year IDAY and latitude LAT."""
+    RAD = 0.0174533
+    PI = 3.1415926
+    DEC = -np.arcsin(np.sin(23.45*RAD)*np.cos(2.*PI*(IDAY+10.)/365.))
+    SINLD = np.sin(RAD*LAT)*np.sin(DEC)
+    COSLD = np.cos(RAD*LAT)*np.cos(DEC)
+    return SINLD, COSLD
+
+def _photoperiod(SINLD, COSLD, ANGLE):
+    """Returns the daylength for which the sun is less than ANGLE degrees
+    under the horizon, given SINLD and COSLD."""
+    RAD = 0.0174533
+    PI = 3.1415926
+    AOB = (-np.sin(ANGLE*RAD)+SINLD)/COSLD
+    return np.where(np.abs(AOB) <= 1.0,
+                    12.0*(1.+2.*np.arcsin(np.clip(AOB, -1., 1.))/PI),
+                    np.where(AOB > 1.0, 24.0, 0.0))
+
+def daylength_array(iday, latitude, angle=-4):
+    """Array version of `daylength()`.
+
+    :param iday:        array with day-of-year values
+    :param latitude:    array with latitudes, or a single latitude
+    :param angle:       The photoperiodic daylength starts/ends when the sun
+        is `angle` degrees under the horizon. Default is -4 degrees.
+    """
+    if np.any(np.abs(latitude) > 90.):
+        msg = "Latitude not between -90 and 90"
+        raise RuntimeError(msg)
+    IDAY = np.asarray(iday, dtype=np.float64)
+    SINLD, COSLD = _sinld_cosld(IDAY, latitude)
+    return _photoperiod(SINLD, COSLD, angle)
+
+def astro_array(iday, latitude):
+    """Array version of the part of `astro()` that does not depend on
+    radiation.
+
+    :param iday:        array with day-of-year values
+    :param latitude:    array with latitudes, or a single latitude
+
+    Returns a namedtuple `AstroTables` with arrays of DAYL, DAYLP, SINLD,
+    COSLD, DSINBE, SC and ANGOT, see `astro_tables()`. Both the tables and
+    the BatchEngine (`pcse.batch.util.astro`) are calculated with it.
+    """
+    if np.any(np.abs(latitude) > 90.):
+        msg = "Latitude not between -90 and 90"
+        raise RuntimeError(msg)
+
+    # constants
+    PI = 3.1415926
+
+    # Declination and solar constant for this day
+    IDAY = np.asarray(iday, dtype=np.float64)
+    SC  = 1370.*(1.+0.033*np.cos(2.*PI*IDAY/365.))
+
+    # calculation of daylength from intermediate variables
+    # SINLD, COSLD and AOB
+    SINLD, COSLD = _sinld_cosld(IDAY, latitude)
+    AOB = SINLD/COSLD
+
+    # For very high latitudes and days in summer and winter a limit is
+    # inserted to avoid math errors when daylength reaches 24 hours in
+    # summer or 0 hours in winter.
+
+    # Calculate solution for base=0 degrees
+    in_range = np.abs(AOB) <= 1.0
+    AOBC = np.clip(AOB, -1., 1.)
+    DAYL = np.where(in_range, 12.0*(1.+2.*np.arcsin(AOBC)/PI),
+                    np.where(AOB > 1.0, 24.0, 0.0))
+    # integrals of sine of solar height. Squares are taken with np.power,
+    # like x**2 in the scalar code, to get identical results.
+    SINLD2 = np.power(SINLD, 2.)
+    COSLD2 = np.power(COSLD, 2.)
+    SQAOB = np.sqrt(1.-np.power(AOBC, 2.))
+    DSINB = np.where(in_range, 3600.*(DAYL*SINLD+24.*COSLD*SQAOB/PI),
+                     3600.*(DAYL*SINLD))
+    DSINBE = np.where(in_range,
+                      3600.*(DAYL*(SINLD+0.4*(SINLD2+COSLD2*0.5))+
+                      12.*COSLD*(2.+3.*0.4*SINLD)*SQAOB/PI),
+                      3600.*(DAYL*(SINLD+0.4*(SINLD2+COSLD2*0.5))))
+
+    # Calculate solution for base=-4 degrees
+    DAYLP = _photoperiod(SINLD, COSLD, -4.)
+
+    # extraterrestrial radiation
+    ANGOT = SC*DSINB
+
+    return AstroTables(DAYL, DAYLP, SINLD, COSLD, DSINBE, SC, ANGOT)
+
+def daylength(day, latitude, angle=-4):
     """Calculates the daylength for a given day, altitude and base.
 
     :param day:         date/datetime object
@@ -422,9 +554,11 @@ def daylength(day, latitude, angle=-4, _cache={}):
         is `angle` degrees under the horizon. Default is -4 degrees.
     
     Derived from the WOFOST routine ASTRO.FOR and simplified to include only
-    daylength calculation. Results are being cached for performance
+    daylength calculation. For the default angle the daylength is taken from
+    `astro_tables()`.
     """
-    #from unum.units import h
+    if angle == -4:
+        return astro_tables(latitude).DAYLP[doy(day)]
 
     # Check for range of latitude
     if abs(latitude) > 90.:
@@ -434,14 +568,6 @@ def daylength(day, latitude, angle=-4, _cache={}):
     # Calculate day-of-year from date object day
     IDAY = doy(day)
     
-    # Test if daylength for given (day, latitude, angle) was already calculated
-    # in a previous run. If not (e.g. KeyError) calculate the daylength, store
-    # in cache and return the value.
-    try:
-        return _cache[(IDAY, latitude, angle)]
-    except KeyError:
-        pass
-    
     # constants
     RAD = 0.0174533
     PI = 3.1415926
@@ -468,13 +594,10 @@ def daylength(day, latitude, angle=-4, _cache={}):
     else:
         DAYLP =  0.0
 
-    # store results in cache
-    _cache[(IDAY, latitude, angle)] = DAYLP
-    
     return DAYLP
 
 
-def astro(day, latitude, radiation, _cache={}):
+def astro(day, latitude, radiation):
     """python version of ASTRO routine by Daniel van Kraalingen.
     
     This subroutine calculates astronomic daylength, diurnal radiation
@@ -496,6 +619,9 @@ def astro(day, latitude, radiation, _cache={}):
         DSINBE    Daily total of effective solar height         s
         ANGOT     Angot radiation at top of atmosphere       J m-2 d-1
  
+    The variables that do not depend on radiation are taken from
+    `astro_tables()`.
+
     Authors: Daniel van Kraalingen
     Date   : April 1991
  
@@ -504,78 +630,18 @@ def astro(day, latitude, radiation, _cache={}):
     Date        : January 2011
     """
 
-    # Check for range of latitude
-    if abs(latitude) > 90.:
-        msg = "Latitude not between -90 and 90"
-        raise RuntimeError(msg)
-    LAT = latitude
-        
     # Determine day-of-year (IDAY) from day
     IDAY = doy(day)
-    
+    t = astro_tables(latitude)
+
     # reassign radiation
     AVRAD = radiation
 
-    # Test if variables for given (day, latitude, radiation) were already calculated
-    # in a previous run. If not (e.g. KeyError) calculate the variables, store
-    # in cache and return the value.
-    try:
-        return _cache[(IDAY, LAT, AVRAD)]
-    except KeyError:
-        pass
-
-    # constants
-    RAD = 0.0174533
-    PI = 3.1415926
-    ANGLE = -4.
+    DAYL = t.DAYL[IDAY]
+    ANGOT = t.ANGOT[IDAY]
+    SC = t.SC[IDAY]
 
-    # map python functions to capitals
-    SIN = sin
-    COS = cos
-    ASIN = asin
-    REAL = float
-    SQRT = sqrt
-    ABS = abs
-
-    # Declination and solar constant for this day
-    DEC = -ASIN(SIN(23.45*RAD)*COS(2.*PI*(REAL(IDAY)+10.)/365.))
-    SC  = 1370.*(1.+0.033*COS(2.*PI*REAL(IDAY)/365.))
-
-    # calculation of daylength from intermediate variables
-    # SINLD, COSLD and AOB
-    SINLD = SIN(RAD*LAT)*SIN(DEC)
-    COSLD = COS(RAD*LAT)*COS(DEC)
-    AOB = SINLD/COSLD
-
-    # For very high latitudes and days in summer and winter a limit is
-    # inserted to avoid math errors when daylength reaches 24 hours in 
-    # summer or 0 hours in winter.
-
-    # Calculate solution for base=0 degrees
-    if abs(AOB) <= 1.0:
-        DAYL  = 12.0*(1.+2.*ASIN(AOB)/PI)
-        # integrals of sine of solar height
-        DSINB  = 3600.*(DAYL*SINLD+24.*COSLD*SQRT(1.-AOB**2)/PI)
-        DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5))+
-                 12.*COSLD*(2.+3.*0.4*SINLD)*SQRT(1.-AOB**2)/PI)
-    else:
-        if AOB >  1.0: DAYL = 24.0
-        if AOB < -1.0: DAYL = 0.0
-        # integrals of sine of solar height	
-        DSINB = 3600.*(DAYL*SINLD)
-        DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5)))
-
-    # Calculate solution for base=-4 (ANGLE) degrees
-    AOB_CORR = (-SIN(ANGLE*RAD)+SINLD)/COSLD
-    if abs(AOB_CORR) <= 1.0:
-        DAYLP = 12.0*(1.+2.*ASIN(AOB_CORR)/PI)
-    elif AOB_CORR > 1.0:
-        DAYLP = 24.0
-    elif AOB_CORR < -1.0:
-        DAYLP = 0.0
-
-    # extraterrestrial radiation and atmospheric transmission
-    ANGOT = SC*DSINB
+    # atmospheric transmission
     # Check for DAYL=0 as in that case the angot radiation is 0 as well
     if DAYL > 0.0:
         ATMTR = AVRAD/ANGOT
@@ -594,13 +660,8 @@ def astro(day, latitude, radiation, _cache={}):
 
     DIFPP = FRDIF*ATMTR*0.5*SC
     
-    # Pack return values in namedtuple, add to cache and return
-    astro_nt = namedtuple("AstroResults","DAYL, DAYLP, SINLD, COSLD, DIFPP, "
-                                         "ATMTR, DSINBE, ANGOT")
-    retvalue = astro_nt(DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT)
-    _cache[(IDAY, LAT, AVRAD)] = retvalue
-
-    return retvalue
+    return AstroResults(DAYL, t.DAYLP[IDAY], t.SINLD[IDAY], t.COSLD[IDAY],
+                        DIFPP, ATMTR, t.DSINBE[IDAY], ANGOT)
 
 #-------------------------------------------------------------------------------
 class Afgen(object):
@@ -692,6 +753,150 @@ class Afgen(object):
 
         return v
 
+#-------------------------------------------------------------------------------
+class FastAfgen(Afgen):
+    """Afgen with a uniform grid lookup of the interval and array evaluation.
+
+    :param tbl_xy: List or array of XY value pairs, see `Afgen`.
+    :param size: number of cells of the uniform grid over the X range,
+        defaults to four times the number of intervals of the table.
+
+    The X range of the table is divided in `size` cells of equal width. For
+    each cell the interval of the table at the start of the cell is stored,
+    so a scalar is evaluated by looking up its cell and stepping to the next
+    interval when the cell contains a breakpoint, instead of by bisection.
+    NumPy arrays are interpolated at once. Results are identical to `Afgen`,
+    units are not supported.
+
+    `ParamTemplate` and the `AfgenTrait` create a FastAfgen for the tables
+    in the parameter values.
+
+    example::
+
+        >>> f = FastAfgen([0,0,1,1,5,10])
+        >>> f(1.5)
+        2.125
+        >>> f(np.array([-1., 0.5, 1.5, 6.]))
+        array([ 0.   ,  0.5  ,  2.125, 10.   ])
+    """
+
+    def __init__(self, tbl_xy, size=None):
+        Afgen.__init__(self, tbl_xy)
+
+        x_list = self.x_list
+        self._x0 = x_list[0]
+        self._y0 = self.y_list[0]
+        self._xn = x_list[-1]
+        self._yn = self.y_list[-1]
+        # Intervals as (index, x1, x2, y1, slope). Cell k gets the interval
+        # at the start of cell k-1 to be safe from round-off in the cell
+        # number, the extra cell at the end is for round-off just below xn.
+        self._intervals = intervals = \
+            zip(range(len(self.slopes)), x_list, x_list[1:], self.y_list,
+                self.slopes)
+        self._grid = []
+        if intervals:
+            if size is None:
+                size = 4*len(intervals)
+            self._scale = size/(self._xn - self._x0)
+            for k in range(size + 1):
+                i = bisect_left(x_list, self._x0 + (k - 1)/self._scale) - 1
+                self._grid.append(intervals[max(0, i)])
+
+    def __call__(self, x):
+
+        try:
+            if x <= self._x0:
+                return self._y0
+            if x >= self._xn:
+                return self._yn
+        except ValueError:
+            # The truth value of a comparison with an array is ambiguous
+            return self._interp(x)
+
+        i, x1, x2, y1, slope = self._grid[int((x - self._x0)*self._scale)]
+        while x > x2:
+            i, x1, x2, y1, slope = self._intervals[i+1]
+        return y1 + slope * (x - x1)
+
+    def _interp(self, x):
+        """Returns the interpolated values for array x."""
+        x = np.asarray(x, dtype=np.float64)
+        xp = np.array(self.x_list)
+        yp = np.array(self.y_list)
+        if len(xp) == 1:
+            return np.where(x <= xp[0], yp[0], yp[-1])
+        i = np.clip(np.searchsorted(xp, x, side="left") - 1, 0, len(xp) - 2)
+        v = yp[i] + np.array(self.slopes)[i] * (x - xp[i])
+        return np.where(x <= xp[0], yp[0], np.where(x >= xp[-1], yp[-1], v))
+
+#-------------------------------------------------------------------------------
+class BatchAfgen(object):
+    """Evaluates an AFGEN table for each cell of a batch.
+
+    :param tables: list with for each cell an XY table or an `Afgen` instance.
+
+    The tables are parsed with `Afgen` and stored as padded arrays,
+    interpolation gives the same results as `Afgen` for the table of each
+    cell. When all cells share the same table the lookup is done on a single
+    table.
+
+    example::
+
+        >>> tbl = BatchAfgen([[0,0,1,1,5,10], [0,2,10,12]])
+        >>> tbl(np.array([0.5, 2.5]))
+        array([0.5, 4.5])
+        >>> tbl(np.array([2.5]), idx=np.array([1]))
+        array([4.5])
+    """
+
+    def __init__(self, tables):
+        afgens = [t if isinstance(t, Afgen) else Afgen(t) for t in tables]
+        if len(afgens) == 0:
+            raise RuntimeError("No AFGEN tables specified.")
+        n = max(2, max([len(a.x_list) for a in afgens]))
+        x = np.empty((len(afgens), n))
+        y = np.empty((len(afgens), n))
+        slopes = np.zeros((len(afgens), n))
+        for i, a in enumerate(afgens):
+            k = len(a.x_list)
+            x[i, :k] = a.x_list
+            x[i, k:] = a.x_list[-1]
+            y[i, :k] = a.y_list
+            y[i, k:] = a.y_list[-1]
+            slopes[i, :k-1] = a.slopes
+        self.shared = bool((x == x[0]).all() and (y == y[0]).all())
+        if self.shared:
+            x, y, slopes = x[0], y[0], slopes[0]
+        self.x = x
+        self.y = y
+        self.slopes = slopes
+
+    def __call__(self, v, idx=None):
+        """Returns the interpolated values for v.
+
+        :param v: array with the abscissa values.
+        :param idx: indices of the cells that v belongs to, defaults to all
+            cells.
+        """
+        v = np.asarray(v, dtype=np.float64)
+        if self.shared:
+            x, y, s = self.x, self.y, self.slopes
+            i = np.searchsorted(x, v, side="left") - 1
+            i = np.clip(i, 0, len(x) - 2)
+            r = y[i] + s[i] * (v - x[i])
+            return np.where(v <= x[0], y[0], np.where(v >= x[-1], y[-1], r))
+
+        x, y, s = self.x, self.y, self.slopes
+        if idx is not None:
+            x, y, s = x[idx], y[idx], s[idx]
+        i = (x < v[:, np.newaxis]).sum(axis=1) - 1
+        i = np.clip(i, 0, x.shape[1] - 2)
+        rows = np.arange(len(v))
+        r = y[rows, i] + s[rows, i] * (v - x[rows, i])
+        return np.where(v <= x[:, 0], y[:, 0],
+                        np.where(v >= x[:, -1], y[:, -1], r))
+
 #-------------------------------------------------------------------------------
 class Afgen2(object):
     """Emulates the AFGEN function in TTUTIL with Numpy.interp
@@ -819,14 +1024,46 @@ class ConfigurationLoader(object):
     """Class for loading the model configuration from a PCSE configuration files
 
         :param config: string given file name containing model configuration
-        """
+
+    Configurations are cached by file name and modification time: creating a
+    ConfigurationLoader for a file that was loaded before returns the same
+    instance without reading the file again. Therefore, the attributes of
+    a ConfigurationLoader cannot be changed and lists in the configuration
+    file are converted to tuples.
+
+    Besides the attributes from the configuration file, the function
+    `is_output_day(day, day_counter)` is available that returns True when
+    output should be generated according to OUTPUT_INTERVAL.
+    """
     _required_attr = ("CROP", "SOIL", "AGROMANAGEMENT", "OUTPUT_VARS", "OUTPUT_INTERVAL",
                       "OUTPUT_INTERVAL_DAYS", "SUMMARY_OUTPUT_VARS")
-    defined_attr = []
+    # Loaded configurations by file name: (modification time, instance)
+    _cache = {}
+    _frozen = False
+    defined_attr = ()
     model_config_file = None
     description = None
 
+    def __new__(cls, config):
+
+        model_config_file = cls._get_config_file(config)
+        mtime = os.path.getmtime(model_config_file)
+        key = (cls, model_config_file)
+        if key in cls._cache and cls._cache[key][0] == mtime:
+            return cls._cache[key][1]
+
+        self = object.__new__(cls)
+        self._load(model_config_file)
+        self._frozen = True
+        cls._cache[key] = (mtime, self)
+        return self
+
     def __init__(self, config):
+        # The configuration is loaded by __new__()
+        pass
+
+    @staticmethod
+    def _get_config_file(config):
 
         if not isinstance(config, str):
             msg = ("Keyword 'config' should provide the name of the file " +
@@ -849,6 +1086,10 @@ class ConfigurationLoader(object):
         if not os.path.exists(model_config_file):
             msg = "PCSE model configuration file does not exist: %s" % model_config_file
             raise exc.PCSEError(msg)
+        return model_config_file
+
+    def _load(self, model_config_file):
+
         # store for later use
         self.model_config_file = model_config_file
 
@@ -871,10 +1112,14 @@ class ConfigurationLoader(object):
                     self.description += "\n"
 
         # Loop through the attributes in the configuration file
+        defined_attr = []
         for key, value in loc.items():
             if key.isupper():
-                self.defined_attr.append(key)
+                if isinstance(value, list):
+                    value = tuple(value)
+                defined_attr.append(key)
                 setattr(self, key, value)
+        self.defined_attr = tuple(defined_attr)
 
         # Check for any missing compulsary attributes
         req = set(self._required_attr)
@@ -883,6 +1128,17 @@ class ConfigurationLoader(object):
             msg = "One or more compulsary configuration items missing: %s" % list(diff)
             raise exc.PCSEError(msg)
 
+        self.is_output_day = get_output_predicate(self.OUTPUT_INTERVAL,
+                                                  self.OUTPUT_INTERVAL_DAYS,
+                                                  getattr(self, "OUTPUT_WEEKDAY", 0))
+
+    def __setattr__(self, attr, value):
+        if self._frozen:
+            msg = "Configuration loaded from '%s' cannot be changed." % \
+                  self.model_config_file
+            raise AttributeError(msg)
+        object.__setattr__(self, attr, value)
+
     def __str__(self):
         msg = "PCSE ConfigurationLoader from file:\n"
         msg += "  %s\n\n" % self.model_config_file
@@ -940,6 +1196,27 @@ def is_a_dekad(day):
 
     return False
 
+def get_output_predicate(interval_type, interval_days=1, weekday=0):
+    """Returns a function f(day, day_counter) that returns True on the days
+    that output should be generated.
+
+    :param interval_type: one of "daily", "weekly", "dekadal" or "monthly"
+    :param interval_days: generate output every interval_days for "daily",
+        day_counter counts the days since the start of the simulation
+    :param weekday: day of the week to generate output for "weekly"
+    """
+    interval_type = interval_type.lower()
+    if interval_type == "daily":
+        return lambda day, day_counter: day_counter % interval_days == 0
+    elif interval_type == "weekly":
+        return lambda day, day_counter: is_a_week(day, weekday)
+    elif interval_type == "dekadal":
+        return lambda day, day_counter: is_a_dekad(day)
+    elif interval_type == "monthly":
+        return lambda day, day_counter: is_a_month(day)
+    msg = "Unknown output interval '%s'." % interval_type
+    raise exc.PCSEError(msg)
+
 def load_SQLite_dump_file(dump_file_name, SQLite_db_name):
     """Build an SQLite database <SQLite_db_name> from dump file <dump_file_name>.
     """
@@ -21,6 +21,8 @@ output_folder = os.path.normpath(output_folder)
 output_file_template = "ggcmi_results_task_%010i.pkl"
 shelve_folder = os.path.join(data_dir, "../..", "shelves")
 shelve_folder = os.path.normpath(shelve_folder)
+results_store_folder = os.path.join(data_dir, "../..", "results_store")
+results_store_folder = os.path.normpath(results_store_folder)
 
 # Number of CPU's to use for simulations
 # Several has options are possible:
@@ -79,7 +79,8 @@ class CropSimOutputWorker():
         
     def close(self):
         self._db_engine = None
-        self._joint_shelves.close()
+        if self._joint_shelves is not None:
+            self._joint_shelves.close()
         self._joint_shelves = None
         del self._joint_shelves
     
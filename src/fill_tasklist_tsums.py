@@ -14,6 +14,7 @@ from pcse.exceptions import PCSEError
 from numpy import arange
 
 import run_settings
+from results_store import get_row_and_col, cellsize
 DeclarativeBase = declarative_base()
 
 class Task(DeclarativeBase):
@@ -28,8 +29,9 @@ class Task(DeclarativeBase):
     tsum2 = Column(Float, nullable=True)
     process_id = Column(Integer, nullable=True)
     comment = Column(String(70), nullable=True)
+    cell_id = Column(Integer, nullable=True)
     
-    def __init__(self, task_id, status, hostname, crop_no, longitude, latitude, tsum1, tsum2, process_id, comment):
+    def __init__(self, task_id, status, hostname, crop_no, longitude, latitude, tsum1, tsum2, process_id, comment, cell_id=None):
         self.task_id = task_id
         self.status = status
         self.hostname = hostname
@@ -40,6 +42,7 @@ class Task(DeclarativeBase):
         self.tsum2 = tsum2
         self.process_id = process_id
         self.comment = comment;
+        self.cell_id = cell_id
         
     def as_dict(self):
         # Return the values of the fields in a dictionary
@@ -50,7 +53,24 @@ class Task(DeclarativeBase):
             result[fldname] = inspected_obj.attrs._data[fldname].value
         return result; 
                         
+def get_cell_id(lon, lat):
+    """Returns the number of the grid cell which houses lon, lat, counted
+    row-wise from the north-west corner of the GGCMI grid. Workers read the
+    weather per grid row, so cells are numbered by latitude first."""
+    row, col = get_row_and_col(lon, lat)
+    return row*int(round(360./cellsize)) + col
+
 def main():
+    """Fills the tasklist with a task for each crop and grid cell.
+
+    With run_settings.cell_major_tasks each task gets the cell_id of its
+    cell, by which the workers claim the tasks of a cell, and the tasks for
+    all crops of a cell get consecutive task_ids. The tasklist should then
+    have this column:
+    ALTER TABLE tasklist ADD COLUMN cell_id INT, ADD INDEX (cell_id)
+    Otherwise the tasks are written crop by crop while they are found and
+    the tasklist needs no cell_id column.
+    """
     # Initialise
     db_engine = None;
     tasks = []
@@ -58,22 +78,68 @@ def main():
         db_engine = sa_engine.create_engine(run_settings.connstr)
         db_metadata = MetaData(db_engine)
         task_id = 15051
-        for crop_no in range(19, 29):
-            # Report which crop is next
-            crop_name, mgmt_code = select_crop(db_engine, crop_no)
-            msg = "About to get TSUM values for " + crop_name + " (" + mgmt_code + ")"
-            logging.info(msg)
-            print msg
-            
-            # Now retrieve how to divide over TSUM1 and TSUM2
-            cip = CropInfoProvider(crop_name, mgmt_code, run_settings.data_dir)
-            cropdata = cip.getCropData();
-            nvlp = cip.getExtent()
-
-            # Get the relevant spatial range and loop through
-            y_range = get_range(db_engine, crop_no, nvlp.dy)
-            x_range = arange(nvlp.getMinX() + 0.5*nvlp.dx, nvlp.getMaxX() + 0.5*nvlp.dy, nvlp.dx); 
-            taskdict = {"task_id":1, "status":"Pending" , "hostname":"None", "crop_no":1, "longitude":0.0, "latitude": 0.0, "tsum1":0.0, "tsum2":0.0, "process_id":1, "comment":""}
+        combinations = iter_combinations(db_engine, range(19, 29))
+
+        # Cell-major: the tasks for a cell follow each other in crop order,
+        # otherwise the tasks are stored while the combinations are found
+        taskdict = {"task_id":1, "status":"Pending" , "hostname":"None", "crop_no":1, "longitude":0.0, "latitude": 0.0, "tsum1":0.0, "tsum2":0.0, "process_id":1, "comment":""}
+        if run_settings.cell_major_tasks:
+            combinations = sorted(combinations, key=lambda c: get_cell_id(c[1], c[2]))
+            taskdict["cell_id"] = 0
+
+        for crop_no, lon, lat in combinations:
+            # tsum = get_tsum_from_db(db_engine, crop_no, lon, lat)
+            tsum1, tsum2 = (0, 0) # split_tsum(cropdata, tsum)
+
+            # Create a task and append it
+            cell_id = get_cell_id(lon, lat) if run_settings.cell_major_tasks else None
+            task = Task(task_id, "Pending", "None", crop_no, lon, lat, tsum1, tsum2, 0, "", cell_id)
+            record = task.as_dict()
+            if cell_id is None:
+                # Without cell-major tasks the tasklist has no cell_id column
+                del record["cell_id"]
+            tasks.append(record)
+            task_id = task_id + 1
+
+            # Once in a while, write them to the database
+            if (task_id % 1000 == 0):
+                store_to_database(db_engine, tasks, db_metadata, taskdict)
+                del tasks[:]
+                print "Thousand records saved to database. Current latitude is %s" % lat
+        store_to_database(db_engine, tasks, db_metadata, taskdict)
+        print "Another %s records saved to database." % len(tasks)
+        del tasks[:]
+
+    except SQLAlchemyError, inst:
+        print ("Database error: %s" % inst)
+
+    except PCSEError, inst:
+        print "Error in PCSE: %s" % inst
+
+    except BaseException, inst:
+        print ("General error: %s" % inst)
+    finally:
+        if db_engine != None: db_engine.dispose()
+
+def iter_combinations(db_engine, crop_nos):
+    """Yields (crop_no, lon, lat) for each crop and grid cell for which a
+    task is needed, crop by crop."""
+    for crop_no in crop_nos:
+        # Report which crop is next
+        crop_name, mgmt_code = select_crop(db_engine, crop_no)
+        msg = "About to get TSUM values for " + crop_name + " (" + mgmt_code + ")"
+        logging.info(msg)
+        print msg
+        
+        # Now retrieve how to divide over TSUM1 and TSUM2
+        cip = CropInfoProvider(crop_name, mgmt_code, run_settings.data_dir)
+        cropdata = cip.getCropData();
+        nvlp = cip.getExtent()
+
+        # Get the relevant spatial range and loop through
+        y_range = get_range(db_engine, crop_no, nvlp.dy)
+        x_range = arange(nvlp.getMinX() + 0.5*nvlp.dx, nvlp.getMaxX() + 0.5*nvlp.dy, nvlp.dx); 
+        try:
             for lat in y_range:
                 # Retrieve the lat-lon combinations for which there are records in the table TSUM
                 lons_with_tsums = get_places_with_tsums(db_engine, crop_no, lat)
@@ -86,36 +152,11 @@ def main():
                     start_doy, end_doy = cip.getSeasonDates(lon, lat);
                     if (start_doy == -99) or (end_doy == -99):
                         continue;
-
-                    # tsum = get_tsum_from_db(db_engine, crop_no, lon, lat)
-                    tsum1, tsum2 = (0, 0) # split_tsum(cropdata, tsum)
-                    
-                    # Create a task and append it
-                    task = Task(task_id, "Pending", "None", crop_no, lon, lat, tsum1, tsum2, 0, "")
-                    tasks.append(task.as_dict())
-                    task_id = task_id + 1
-                    
-                    # Once in a while, write them to the database
-                    if (task_id % 1000 == 0):
-                        store_to_database(db_engine, tasks, db_metadata, taskdict)
-                        del tasks[:]
-                        print "Thousand records saved to database. Current latitude is %s" % lat
+                    yield crop_no, lon, lat
                 # end lon
             # end lat
-            store_to_database(db_engine, tasks, db_metadata, taskdict)
-            print "Another %s records saved to database." % len(tasks)
-            del tasks[:]        
-                    
-    except SQLAlchemyError, inst:
-        print ("Database error: %s" % inst)
-
-    except PCSEError, inst:
-        print "Error in PCSE: %s" % inst
-
-    except BaseException, inst:
-        print ("General error: %s" % inst)
-    finally:
-        if db_engine != None: db_engine.dispose()
+        finally:
+            cip.close()
     
 def split_tsum(cropdata, tsum):
     try:   
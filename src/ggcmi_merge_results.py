@@ -0,0 +1,187 @@
+"""Assembles the GGCMI netCDF files from the results store.
+
+The workers write the summary results of their tasks to HDF5 files in the
+results store (see results_store.py). For each crop, the records of all
+committed files are read, converted to the GGCMI output variables and
+written to netCDF4 files based on the output template.
+"""
+import conv_settings
+import sys
+sys.path.append(conv_settings.pcse_dir)
+import logging
+from datetime import date
+from multiprocessing import Pool
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from crop_sim_output_worker import CropSimOutputWorker
+from joint_netcdf4_raster import JointNetcdf4Raster
+from output_converter import determine_CPUs, init_worker
+from results_store import read_results
+
+# Constants
+nrows = 360
+ncols = 720
+xll = -180.0
+yll = 90.0
+cellsize = 0.5
+nodatavalue = 1.e+20
+
+# Number of grid rows that are read from the results store and kept in
+# memory at a time
+rows_per_block = 10
+
+# Dates are stored as ordinals, 0 means no date.
+_epoch = date(1970, 1, 1).toordinal()
+
+def days_between(x, y):
+    """Returns the number of days between the dates x and y."""
+    result = (x - y).astype(np.float64)
+    result[(x == 0) | (y == 0)] = np.nan
+    return result
+
+def day_of_year(x):
+    days = (x - _epoch).astype("datetime64[D]")
+    result = (days - days.astype("datetime64[Y]")).astype(np.float64) + 1
+    result[x == 0] = np.nan
+    return result
+
+def length_of_season(records, worker):
+    """Days from planting to harvest, or to maturity when the crop was not
+    harvested. If neither occurred, the season ends at the end of the crop
+    calendar."""
+    end = np.where(records["DOH"] != 0, records["DOH"], records["DOM"])
+    result = days_between(end, records["DOS"])
+    for i in np.flatnonzero((end == 0) & (records["DOS"] != 0)):
+        dos = date.fromordinal(records["DOS"][i])
+        result[i] = worker._get_length_of_season(None, None, dos,
+                                                 records["task_id"][i])
+    return result
+
+# GGCMI output variables, their description :: units and a function that
+# derives them from the records in the results store. As in output_converter,
+# EVST is not part of the summary output so aet is based on CTRAT only.
+variables = {"yield":     ("Crop yield (dry matter) :: t ha-1 yr-1",
+                           lambda r, w: 0.001*r["TWSO"]),
+             "biom":      ("Total Above ground biomass yield :: t ha-1 yr-1",
+                           lambda r, w: 0.001*r["TAGP"]),
+             "aet":       ("Actual growing season evapotranspiration :: mm yr-1",
+                           lambda r, w: 10*r["CTRAT"]),
+             "plant-day": ("Actual planting date :: day of year",
+                           lambda r, w: day_of_year(r["DOS"])),
+             "anth-day":  ("Days from planting to anthesis :: days",
+                           lambda r, w: days_between(r["DOA"], r["DOS"])),
+             "maty-day":  ("Days from planting to maturity :: days",
+                           length_of_season)
+            }
+
+def _merge_records(joint_netcdf4, records, worker, start_year):
+    """Converts records to the GGCMI output variables and assigns them to the
+    output rasters in the order of the records."""
+    values = {}
+    for var, (_, conv) in variables.items():
+        v = conv(records, worker)
+        v[np.isnan(v)] = nodatavalue
+        values[var] = v
+
+    # All years of a task are assigned to the grid cell of the task in one go
+    yrcount = records["year"] - start_year
+    _, first, counts = np.unique(records["task_id"], return_index=True,
+                                 return_counts=True)
+    for i, n in sorted(zip(first, counts)):
+        s = slice(i, i + n)
+        task_values = dict((var, v[s]) for var, v in values.items())
+        joint_netcdf4.set_data(yrcount[s], records["longitude"][i],
+                               records["latitude"][i], task_values)
+
+def merge_results(crop_no, model, climate, clim_scenario, sim_scenario,
+                  start_year, end_year):
+    """Writes the GGCMI netCDF files for crop_no from the results store."""
+    worker = CropSimOutputWorker(crop_no, model, climate, clim_scenario,
+                                 sim_scenario, start_year, end_year)
+    joint_netcdf4 = None
+    try:
+        path2template = worker._get_path_to_template()
+        ncdf_pattern = worker._get_output_filename_pattern()
+        joint_netcdf4 = JointNetcdf4Raster(path2template, conv_settings.results_folder,
+                                           ncdf_pattern, variables.keys(), chunked=True)
+        if not joint_netcdf4.open('a', start_year, end_year, ncols, nrows, xll,
+                                  yll, cellsize, nodatavalue, window=rows_per_block):
+            raise RuntimeError()
+        for var, (description, _) in variables.items():
+            # The crop_label has to be added to the name
+            name = var + "_" + worker._crop_label
+            long_name, units = [s.strip() for s in description.split("::")]
+            joint_netcdf4.writeheader(var, name, long_name, units)
+
+        # Rows are written in the order of the template, which may start in
+        # the south. Results are read and assigned in blocks of rows in that
+        # order, so only a block of rows is kept in memory.
+        msg = "About to write output in netcdf4 format for crop %s (%s)"
+        print msg % (worker._crop_label, worker._mgmt_code)
+        north_first = joint_netcdf4.getColAndRowIndex(0., 90. - 0.5*cellsize)[1] == 0
+        blocks = range(0, nrows, rows_per_block)
+        if not north_first:
+            blocks.reverse()
+        nrecords = 0
+        for start in blocks:
+            records = read_results(conv_settings.results_store_folder, crop_no,
+                                   rows=(start, start + rows_per_block))
+            records = records[(records["year"] >= start_year) &
+                              (records["year"] <= end_year)]
+            if not north_first:
+                records = records[::-1]
+            _merge_records(joint_netcdf4, records, worker, start_year)
+            nrecords += len(records)
+
+        joint_netcdf4.flush()
+        msg = "Finished writing %i records in netcdf4 format for crop %s (%s)"
+        print msg % (nrecords, worker._crop_label, worker._mgmt_code)
+
+    except SQLAlchemyError:
+        msg = "Database error on crop %i." % crop_no
+        print msg
+        logging.exception(msg)
+    except RuntimeError:
+        msg = "Error opening netCDF4 dataset on crop %i." % crop_no
+        print msg
+        logging.exception(msg)
+    finally:
+        if joint_netcdf4 is not None:
+            joint_netcdf4.close()
+        worker.close()
+
+def merge_crop(crop_no):
+    # Constants needed to write output files
+    model = "cgms-wofost"
+    climate = "WFDEI"
+    start_year = 1979
+    end_year = 2012
+    clim_scenario = "hist"
+    sim_scenario = "default"
+
+    merge_results(crop_no, model, climate, clim_scenario, sim_scenario,
+                  start_year, end_year)
+
+def main():
+    crops = range(6, 20)
+    number_of_CPU = determine_CPUs()
+    if number_of_CPU == 1:
+        for crop_no in crops:
+            merge_crop(crop_no)
+        return
+
+    # One crop per process, the processes only read the results store
+    p = Pool(min(number_of_CPU, len(crops)), init_worker)
+    try:
+        # A timeout is needed to receive KeyboardInterrupt while waiting
+        p.map_async(merge_crop, crops, chunksize=1).get(7*24*3600)
+    except KeyboardInterrupt:
+        print "Terminating merge on user request ..."
+    finally:
+        p.terminate()
+        p.join()
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ sys.path.append(run_settings.pcse_dir)
 from ggcmi_task_runner import task_runner
 from pcse.exceptions import PCSEError
 from pcse.taskmanager import TaskManager
+from worker_resources import WorkerResources
+from results_store import ResultsWriter
 
 def run_with_taskmanager():
     """Main script for running PCSE/WOFOST with the task manager.
@@ -16,64 +18,109 @@ def run_with_taskmanager():
     All configuration options are retrieved from run_settings.py
     """
 
-    logger = logging.getLogger("GGCMI Task Runner")
-
     # Open database connection and empty output table
     db_engine = sa_engine.create_engine(run_settings.connstr)
 
     # Initialise task manager
     taskmanager = TaskManager(db_engine, dbtype="MySQL")
 
-    # Loop until no tasks are left
-    task = taskmanager.get_task()
+    # Crop information and weather data are kept open across tasks
+    resources = WorkerResources()
+    results_writer = ResultsWriter(run_settings.results_store_folder,
+                                   run_settings.results_tasks_per_file)
+    try:
+        _run_tasks(db_engine, taskmanager, resources, results_writer)
+    finally:
+        resources.close()
+        results_writer.close()
+
+def _run_tasks(db_engine, taskmanager, resources, results_writer):
+    """Claims batches of tasks from the taskmanager and runs them until no
+    tasks are left or run_settings.max_tasks_per_worker is reached.
+
+    Tasks are reported as finished once their results are committed to the
+    results store, which happens when run_settings.results_tasks_per_file
+    tasks have been run and when the worker stops.
+
+    With run_settings.cell_major_tasks all tasks of run_settings.cells_per_claim
+    grid cells are claimed at a time, so that the weather, soil and site data
+    of a cell are loaded once for all crops of the cell. The status of the
+    tasks is still reported per task.
+    """
+    logger = logging.getLogger("GGCMI Task Runner")
+
+    def claim_tasks():
+        if run_settings.cell_major_tasks:
+            return taskmanager.get_tasks_by("cell_id", run_settings.cells_per_claim)
+        return taskmanager.get_tasks(run_settings.tasks_per_claim)
+
+    # Loop until no tasks are left, tasks are claimed in batches and
+    # finished tasks are reported back per batch.
     ntasks = 0
-    while task is not None and ntasks < run_settings.max_tasks_per_worker:
-        ntasks += 1
-        try:
-            task_id = task["task_id"]
-            print "Running task: %i" % task_id
-            task_runner(db_engine, task)
-
-            # Set status of current task to 'Finished'
-            taskmanager.set_task_finished(task)
-
-        except SQLAlchemyError as inst:
-            msg = "Database error on task_id %i." % task_id
-            logger.exception(msg)
-            # Break because of error in the database connection
-            break
-
-        except PCSEError:
-            msg = "Error in PCSE on task_id %i." % task_id
-            logger.exception(msg)
-            # Set status of current task to 'Error'
-            taskmanager.set_task_error(task, comment="PCSE Error")
-
-        except tables.NoSuchNodeError:
-            msg = "No weather data found for lat/lon: %s/%s"
-            logger.error(msg, task["latitude"], task["longitude"])
-            taskmanager.set_task_error(task, comment="No weather data")
-
-        except run_settings.NoFAOSoilError as e:
-            msg = "No soil data: %s" % e
-            logger.error(msg)
-            taskmanager.set_task_error(task, comment="No soil data")
-
-        except Exception:
-            msg = "General error on task_id %i" % task_id
-            logger.exception(msg)
-            # Set status of current task to 'Error'
-            taskmanager.set_task_error(task, comment="General error, see log.")
-
-        except KeyboardInterrupt:
-            msg = "Terminating on user request!"
-            logger.error(msg)
-            taskmanager.set_task_error(task, comment=msg)
-            sys.exit()
-
-        finally:
-            #Get new task
-            task = taskmanager.get_task()
+    tasks = claim_tasks()
+    while tasks and ntasks < run_settings.max_tasks_per_worker:
+        while tasks:
+            task = tasks.pop(0)
+            ntasks += 1
+            try:
+                task_id = task["task_id"]
+                print "Running task: %i" % task_id
+                task_runner(db_engine, task, resources, results_writer)
+
+            except SQLAlchemyError as inst:
+                msg = "Database error on task_id %i." % task_id
+                logger.exception(msg)
+                # Stop because of error in the database connection, try to
+                # report the tasks finished so far.
+                try:
+                    taskmanager.set_tasks_finished(results_writer.commit())
+                    taskmanager.release_tasks(tasks)
+                except SQLAlchemyError:
+                    logger.exception("Failed to update tasklist.")
+                return
+
+            except PCSEError:
+                msg = "Error in PCSE on task_id %i." % task_id
+                logger.exception(msg)
+                # Set status of current task to 'Error'
+                taskmanager.set_task_error(task, comment="PCSE Error")
+
+            except tables.NoSuchNodeError:
+                msg = "No weather data found for lat/lon: %s/%s"
+                logger.error(msg, task["latitude"], task["longitude"])
+                taskmanager.set_task_error(task, comment="No weather data")
+
+            except run_settings.NoFAOSoilError as e:
+                msg = "No soil data: %s" % e
+                logger.error(msg)
+                taskmanager.set_task_error(task, comment="No soil data")
+
+            except Exception:
+                msg = "General error on task_id %i" % task_id
+                logger.exception(msg)
+                # Set status of current task to 'Error'
+                taskmanager.set_task_error(task, comment="General error, see log.")
+
+            except KeyboardInterrupt:
+                msg = "Terminating on user request!"
+                logger.error(msg)
+                taskmanager.set_task_error(task, comment=msg)
+                taskmanager.set_tasks_finished(results_writer.commit())
+                taskmanager.release_tasks(tasks)
+                sys.exit()
+
+            if ntasks >= run_settings.max_tasks_per_worker:
+                # Hand back what is left of the batch to other workers
+                taskmanager.release_tasks(tasks)
+                tasks = []
+
+        # Set status of committed tasks to 'Finished' and get new tasks
+        if results_writer.is_full():
+            taskmanager.set_tasks_finished(results_writer.commit())
+        if ntasks < run_settings.max_tasks_per_worker:
+            tasks = claim_tasks()
+
+    taskmanager.set_tasks_finished(results_writer.commit())
 
 if __name__ == "__main__":
     run_with_taskmanager()
@@ -3,34 +3,55 @@ import os
 import time
 import logging
 import cPickle
-from datetime import datetime
+from datetime import datetime, timedelta
+from bisect import bisect_right
 import pdb
 
 import run_settings
 sys.path.append(run_settings.pcse_dir)
 from pcse.base_classes import WeatherDataProvider
-from pcse.fileinput.hdf5reader import Hdf5WeatherDataProvider
 from pcse.engine import Engine as wofostEngine
 from pcse.exceptions import PCSEError
+from pcse.soil.classic_waterbalance import CropFreeTrajectory
 from cropinforeader import CropInfoProvider
+from worker_resources import CellInputs
 
-def task_runner(sa_engine, task):
+def task_runner(sa_engine, task, resources=None, results_writer=None):
+    """Runs the simulations for all available years for the crop and location
+    given by `task` and stores the results.
+
+    If `resources` (a WorkerResources instance) is given, the crop information
+    and the weather data are taken from the resources that the worker keeps
+    open across tasks. Otherwise they are opened for this task only. With
+    run_settings.cell_major_tasks the weather, soil and site data of the cell
+    are kept by the resources as well and are shared by the tasks for the
+    crops of the cell.
+
+    If `results_writer` (a ResultsWriter instance) is given, the summary
+    results are added to the results store of the worker. Otherwise the
+    results are pickled to run_settings.output_folder.
+    """
     # Get crop_name and mgmt_code
     crop_no = task["crop_no"]
     lat = float(task["latitude"])
     lon = float(task["longitude"])
     year = 1900
     cip = None
-    wdp = None
+    cell = None
     logger = logging.getLogger("GGCMI Task Runner")
     logger.info("Starting task runner for task %i" % task["task_id"])
     
     # Get a crop info provider
     try:
         t1 = time.time()
-        cropname, watersupply = select_crop(sa_engine, crop_no)
-        cip = CropInfoProvider(cropname, watersupply, )
-        cropdata = cip.getCropData()
+        if resources is None:
+            cropname, watersupply = select_crop(sa_engine, crop_no)
+            cip = CropInfoProvider(cropname, watersupply)
+        else:
+            cropname, watersupply = resources.get_crop(sa_engine, crop_no, select_crop)
+            cip = resources.get_crop_info_provider(cropname, watersupply)
+        # Copy: the crop data are shared by the tasks for this crop
+        cropdata = dict(cip.getCropData())
         if (not task.has_key("tsum1")) or (not task.has_key("tsum2")):
             msg = "Location specific values for crop parameter(s) missing: TSUM1 and/or TSUM2"
             raise PCSEError(msg)
@@ -46,17 +67,34 @@ def task_runner(sa_engine, task):
         # landmask was checked. Also we assume that the data on the growing
         # season were checked. These are represented by day-of-year values.
 
-        # Get the weather data
+        # Get the weather data, soil and site data
         t2 = time.time()
-        wdp = Hdf5WeatherDataProvider(run_settings.hdf5_meteo_file, lat, lon)
+        if resources is None:
+            cell = CellInputs(run_settings.hdf5_meteo_file, lon, lat)
+        elif run_settings.cell_major_tasks:
+            cell = resources.get_cell_inputs(run_settings.hdf5_meteo_file, lon, lat)
+        else:
+            rowreader = resources.get_rowreader(run_settings.hdf5_meteo_file)
+            cell = CellInputs(run_settings.hdf5_meteo_file, lon, lat, rowreader)
+        wdp = cell.wdp
         available_years = get_available_years(wdp)
         msg = "Retrieving weather data for lat-lon %s, %s took %6.1f seconds" 
         logger.debug(msg % (str(lat), str(lon), time.time()-t2))
+        msg = "Setup for task %i took %6.3f seconds"
+        logger.info(msg % (task["task_id"], time.time()-t1))
 
-        # Loop over the years
-        t3 = time.time()
-        allresults = []
-        msg = None
+        # Copy: the soil and site data may be shared by the tasks for the cell
+        soildata = dict(cell.soildata)
+        sitedata = dict(cell.sitedata)
+
+        # Run simulation
+        if watersupply == 'ir':
+            configFile = 'GGCMI_PP.conf'
+        else:
+            configFile = 'GGCMI_WLP.conf'
+
+        # Timer data for the years for which weather data are available
+        seasons = []
         for year in available_years:
             # Get timer data for the current year
             timerdata = cip.getTimerData(start_doy, end_doy, year)
@@ -68,38 +106,46 @@ def task_runner(sa_engine, task):
                 continue
             if timerdata['END_DATE'] > wdp.last_date:
                 continue
-            # Get soil and site data
-
-            soildata = run_settings.get_soil_data(lon, lat)
-            sitedata = run_settings.get_site_data(soildata)
-
-            # Run simulation
-            if watersupply == 'ir':
-                configFile = 'GGCMI_PP.conf'
-            else:
-                configFile = 'GGCMI_WLP.conf'
+            seasons.append((year, timerdata))
 
-            if msg is None:
-                msg = "Starting simulation for %s-%s (%5.2f, %5.2f), planting " \
-                      "at: %s, final harvest at: %s"
-                msg = msg % (cropname, watersupply, lon, lat, timerdata['CROP_START_DATE'],
-                             timerdata['CROP_END_DATE'])
-                logger.info(msg)
+        if len(seasons) > 0:
+            timerdata = seasons[0][1]
+            msg = "Starting simulation for %s-%s (%5.2f, %5.2f), planting " \
+                  "at: %s, final harvest at: %s"
+            msg = msg % (cropname, watersupply, lon, lat, timerdata['CROP_START_DATE'],
+                         timerdata['CROP_END_DATE'])
+            logger.info(msg)
 
-            wofost = wofostEngine(sitedata, timerdata, soildata, cropdata, wdp,
-                                  config=configFile)
-            wofost.run_till_terminate()
-            results = wofost.get_output()
-            sumresults = wofost.get_summary_output()
+        t3 = time.time()
+        if run_settings.continuous_run:
+            seasonresults = run_continuous(seasons, sitedata, soildata, cropdata,
+                                           wdp, configFile)
+        else:
+            # Without irrigation the soil water balance before the crop start
+            # only depends on the weather and the soil, so it is shared by
+            # the crops of the cell with the same season START_DATE.
+            soil_trajectories = None
+            if run_settings.soil_trajectory_cache and watersupply != 'ir':
+                soil_trajectories = [get_soil_trajectory(resources, wdp,
+                                        timerdata, sitedata, soildata, cropdata)
+                                     for _, timerdata in seasons]
+            seasonresults = run_seasons(seasons, sitedata, soildata, cropdata,
+                                        wdp, configFile, soil_trajectories)
+        allresults = []
+        for year, results, sumresults in seasonresults:
             if (len(results) > 0) and (len(sumresults) > 0):
                 allresults.append({"year":year, "summary":sumresults,
                                    "results":results})
             else:
                 msg = "Insufficient results for crop/year/lat/lon: %s/%s/%s/%s"
                 logger.error(msg, crop_no, year, lat, lon)
-        # end year    
             
-        if len(allresults) > 0:
+        if len(allresults) > 0 and results_writer is not None:
+            results_writer.add(task, allresults)
+
+            msg = "Simulating for lat-lon (%s, %s) took %6.1f seconds"
+            logger.info( msg % (str(lat), str(lon), time.time()-t3))
+        elif len(allresults) > 0:
             # pickle all results
             task_id = task["task_id"]
             obj = {"task_id":task_id, "crop_no":crop_no, "longitude":lon, "latitude":lat}
@@ -129,11 +175,103 @@ def task_runner(sa_engine, task):
             raise PCSEError(msg)
 
     finally:
-        if wdp is not None:
-            wdp.close()
-        if cip is not None:
+        # Resources of the worker remain open for the next task
+        if cell is not None and (resources is None or
+                                 not run_settings.cell_major_tasks):
+            cell.close()
+        if cip is not None and resources is None:
             cip.close()
 
+def run_seasons(seasons, sitedata, soildata, cropdata, wdp, configFile,
+                soil_trajectories=None):
+    """Runs each of the seasons given as (year, timerdata) separately and
+    returns (year, output, summary output) for each season.
+
+    The engine is created for the first season and reset for the following
+    seasons. If `soil_trajectories` (a CropFreeTrajectory for each season) are
+    given, the soil state before the crop start is taken from them, see
+    `get_soil_trajectory`.
+    """
+    seasonresults = []
+    wofost = None
+    for i, (year, timerdata) in enumerate(seasons):
+        if wofost is None:
+            wofost = wofostEngine(sitedata, timerdata, soildata, cropdata, wdp,
+                                  config=configFile)
+        else:
+            wofost.reset(timerdata)
+        if soil_trajectories is not None:
+            wofost.soil_trajectory = soil_trajectories[i]
+        wofost.run_till_terminate()
+        seasonresults.append((year, wofost.get_output(),
+                              wofost.get_summary_output()))
+    if wofost is not None:
+        wofost.close()
+    return seasonresults
+
+def run_continuous(seasons, sitedata, soildata, cropdata, wdp, configFile):
+    """Runs the seasons given as (year, timerdata) in one continuous run and
+    returns (year, output, summary output) for each season like
+    `run_seasons()`.
+
+    The seasons are the campaigns of a crop calendar (see the
+    _CropCalendar version of configFile), so the soil state is carried
+    over from one season to the next and each day is simulated once. The
+    crop of a season is finished at the latest on the day before the next
+    season starts.
+    """
+    if len(seasons) == 0:
+        return []
+    campaigns = [dict(timerdata) for _, timerdata in seasons]
+    for campaign, next_campaign in zip(campaigns, campaigns[1:]):
+        last_day = next_campaign["CROP_START_DATE"] - timedelta(days=1)
+        campaign["CROP_END_DATE"] = min(campaign["CROP_END_DATE"], last_day)
+        campaign["MAX_DURATION"] = min(campaign["MAX_DURATION"],
+                                       (last_day - campaign["CROP_START_DATE"]).days)
+    timerdata = {"START_DATE": campaigns[0]["START_DATE"],
+                 "END_DATE": campaigns[-1]["END_DATE"],
+                 "CAMPAIGNS": campaigns}
+    config = os.path.splitext(configFile)[0] + "_CropCalendar.conf"
+    wofost = wofostEngine(sitedata, timerdata, soildata, cropdata, wdp,
+                          config=config)
+    wofost.run_till_terminate()
+    wofost.close()
+
+    # One summary is saved for each campaign, the output is assigned to the
+    # campaigns by date.
+    sumresults = wofost.get_summary_output()
+    if len(sumresults) != len(campaigns):
+        msg = "Summary output for %i campaigns expected, %i found."
+        raise PCSEError(msg % (len(campaigns), len(sumresults)))
+    start_dates = [c["CROP_START_DATE"] for c in campaigns]
+    results = [[] for _ in campaigns]
+    for record in wofost.get_output():
+        i = bisect_right(start_dates, record["day"]) - 1
+        if i >= 0:
+            results[i].append(record)
+    return [(year, results[i], [sumresults[i]])
+            for i, (year, _) in enumerate(seasons)]
+
+def get_soil_trajectory(resources, wdp, timerdata, sitedata, soildata,
+                        cropdata):
+    """Returns the crop-free soil water trajectory for the cell of `wdp`
+    starting on the START_DATE of the season in `timerdata`, so that the
+    results equal those of simulating the season without it.
+
+    The trajectory is taken from the resources of the worker when it was
+    created for an earlier task on the same cell with the same weather file,
+    START_DATE and soil water parameters. The engine passes its own weather
+    data provider to the trajectory to simulate further days.
+    """
+    start_date = timerdata["START_DATE"]
+    def create():
+        return CropFreeTrajectory(start_date, cropdata, soildata, sitedata, wdp)
+    if resources is None:
+        return create()
+    key = (run_settings.hdf5_meteo_file, wdp.longitude, wdp.latitude,
+           start_date, CropFreeTrajectory.get_key(cropdata, soildata, sitedata))
+    return resources.get_soil_trajectory(key, create)
+
 def get_available_years(wdp):
     result = []
     if isinstance(wdp, WeatherDataProvider):
@@ -1,15 +1,59 @@
 from pcse.geo.netcdf4raster import Netcdf4Raster
+from netCDF4 import Dataset
 import os, shutil
 import numpy as np
 
+def create_from_template(path2template, fp, varname, dtype=np.float32, complevel=4):
+    """Creates a netCDF4 file with the dimensions, coordinate variables and
+    attributes of the template. Variable varname is created with the given
+    dtype, compressed and in chunks of one row (latitude) for all years."""
+    src = Dataset(path2template, 'r')
+    dst = Dataset(fp, 'w', format='NETCDF4')
+    try:
+        dst.setncatts(dict((a, src.getncattr(a)) for a in src.ncattrs()))
+        for name, dim in src.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+        for name, var in src.variables.items():
+            attrs = dict((a, var.getncattr(a)) for a in var.ncattrs() if a != "_FillValue")
+            fill_value = getattr(var, "_FillValue", None)
+            if name == varname:
+                chunksizes = [1 if d == Netcdf4Raster.LAT else max(1, len(src.dimensions[d]))
+                              for d in var.dimensions]
+                v = dst.createVariable(name, dtype, var.dimensions, zlib=True,
+                                       complevel=complevel, chunksizes=chunksizes,
+                                       fill_value=fill_value)
+            else:
+                v = dst.createVariable(name, var.dtype, var.dimensions,
+                                       fill_value=fill_value)
+                v[:] = var[:]
+            v.setncatts(attrs)
+    finally:
+        src.close()
+        dst.close()
+
 class JointNetcdf4Raster():
-    _datasets = {}
-    _rasters = {}
-    _currow = 0;
+    """Writes the output rasters for a set of variables (keys) to netCDF4
+    files, one per variable, based on a template.
+
+    Values are kept in memory for a window of rows. By default the window
+    holds all rows and the rows are written by calling `writenext` for each
+    row once all values are set. When `open` is given a smaller window, the
+    values must be set in row order: rows that are complete are written when
+    values are set for a row beyond the window. With `chunked=True` the
+    variables are created as compressed float32, chunked by row.
+    """
     _startyear = 1945
     _end_year = 2050
     
-    def __init__(self, path2template, fpath=os.getcwd(), pattern="part1_*_part2.nc4", keys=[]):
+    def __init__(self, path2template, fpath=os.getcwd(), pattern="part1_*_part2.nc4", keys=[], chunked=False):
+        # Datasets and rasters are per instance, several instances can be
+        # used in the same process
+        self._datasets = {}
+        self._rasters = {}
+        self._currow = 0
+        self._window = 0
+        self._nrows = 0
+        self._nodatavalue = -9999.0
         # Locate the template file
         path2template = os.path.normpath(path2template)
         if not os.path.exists(path2template):
@@ -18,19 +62,26 @@ class JointNetcdf4Raster():
         for key in keys:
             # Compose the name - copy the template file to a file with the right name
             fp = os.path.join(fpath, pattern.replace("*", key))
-            shutil.copyfile(path2template, fp)
+            if chunked:
+                create_from_template(path2template, fp, Netcdf4Raster._original_name)
+            else:
+                shutil.copyfile(path2template, fp)
             os.chmod(fp, 0664)
             self._datasets[key] = Netcdf4Raster(fp)
             
-    def open(self, mode, start_year, end_year, ncols=1, nrows=1, xll=0, yll=0, cellsize=1, nodatavalue=-9999.0):
+    def open(self, mode, start_year, end_year, ncols=1, nrows=1, xll=0, yll=0, cellsize=1, nodatavalue=-9999.0, window=None):
         self._startyear = start_year
         self._end_year = end_year
+        self._nrows = nrows
+        self._window = nrows if window is None else min(window, nrows)
+        self._nodatavalue = nodatavalue
         for key in self._datasets.keys():
             ds = self._datasets[key]
             if mode[0] == 'a': 
                 if ds.open('a', ncols, nrows, xll, yll, cellsize, nodatavalue):
                     nyears = end_year - start_year + 1
-                    self._rasters[key] = np.empty((nyears, nrows, ncols), dtype=np.float)
+                    # Rows are kept in slot row % window
+                    self._rasters[key] = np.empty((nyears, self._window, ncols), dtype=np.float32)
                     self._rasters[key][:, :, :] = nodatavalue
                 else:
                     raise IOError("File %s could not be opened" % ds.name)
@@ -41,25 +92,42 @@ class JointNetcdf4Raster():
                     raise IOError("File %s could not be opened" % ds.name)
         return True
 
+    def getColAndRowIndex(self, lon, lat):
+        ds = self._datasets.values()[0]
+        return ds.getColAndRowIndex(lon, lat)
+
     def set_data(self, yrcount, lon, lat, valueDict):
         # Input is a dictionary
         keys = valueDict.keys()
         ds = self._datasets[keys[0]]
         k, i = ds.getColAndRowIndex(lon, lat)
+        if i < self._currow:
+            raise ValueError("Row %i was already written" % i)
+        while i >= self._currow + self._window:
+            self.writenext()
         for key in keys:
             raster = self._rasters[key]
-            raster[yrcount, i, k] = valueDict[key] 
+            raster[yrcount, i % self._window, k] = valueDict[key] 
         
     def writenext(self):
+        slot = self._currow % self._window
         for key in self._datasets.keys():
-            values = self._rasters[key][:, self._currow,  :] 
+            values = self._rasters[key][:, slot,  :] 
             self._datasets[key].writenext(values)
+            values[:, :] = self._nodatavalue
         self._currow += 1
+
+    def flush(self):
+        """Writes the remaining rows."""
+        while self._currow < self._nrows:
+            self.writenext()
     
     def writeheader(self, key, name, long_name, units):
         self._datasets[key].writeheader(name, long_name, units)
     
     def close(self):
+        if self._datasets is None:
+            return
         for key in self._datasets.keys():
             self._datasets[key].close()
         self._datasets = None
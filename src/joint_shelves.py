@@ -1,10 +1,20 @@
 import shelve
 import os, glob
+import cPickle
+import logging
 
 class JointShelves():
-    _shelves = []
-    _last_index = 0
-    
+    """Read access to the results stored in a set of shelves.
+
+    When the shelves are opened, an index from key to shelve is built and
+    stored in `index_fname` next to the shelves. Lookups go straight to the
+    shelve that holds the key. The stored index is reused for shelves that
+    did not change since it was written, so only new shelves are indexed.
+    The index only holds the keys of each shelve, in storage order, so
+    building it does not read the results themselves, see `iter_keys`.
+    """
+    index_fname = "joint_shelves_keys.idx"
+
     def __init__(self, fpath=os.getcwd(), pattern="*.shelve"):
         # Return the shelve files - with the most recent one first
         fn = os.path.join(fpath, pattern)
@@ -13,36 +23,87 @@ class JointShelves():
         # Sort the files by the name
         #files.sort(key=lambda x: os.path.getmtime(x)) # last modified date
         files.sort(key=lambda x: os.path.basename(x))
-        # Note that duplicate keys can exist in different shelves
-        # currently only the first key is found and the value is returned.
-        # you could sort in reverse order though.
-        # files = reversed(files)
+        self._fnames = files
+        self._shelves = []
         for fn in files:
             self._shelves.append(shelve.open(fn, flag="r"))
 
+        # Note that duplicate keys can exist in different shelves
+        # only the value in the first shelve is returned.
+        self._index_fp = os.path.join(fpath, self.index_fname)
+        self._entries = self._get_index()
+        self._index = {}
+        for i, keys in enumerate(self._entries):
+            for key in keys:
+                self._index.setdefault(key, i)
+
+    def _get_stamp(self, fn):
+        st = os.stat(fn)
+        return (os.path.basename(fn), st.st_size, st.st_mtime)
+
+    def _get_index(self):
+        """Returns per shelve the keys in storage order, taken from the
+        stored index or read from the shelve."""
+        stored = {}
+        if os.path.exists(self._index_fp):
+            with open(self._index_fp, "rb") as f:
+                stored = cPickle.load(f)
+
+        index = {}
+        result = []
+        for fn, shlv in zip(self._fnames, self._shelves):
+            stamp = self._get_stamp(fn)
+            if stamp in stored:
+                entries = stored[stamp]
+            else:
+                entries = shlv.keys()
+            index[stamp] = entries
+            result.append(entries)
+
+        if index != stored:
+            self._write_index(index)
+        return result
+
+    def _write_index(self, index):
+        # Write to .tmp and rename, other processes may read the index
+        tmp_fp = self._index_fp + ".tmp"
+        try:
+            with open(tmp_fp, "wb") as f:
+                cPickle.dump(index, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_fp, self._index_fp)
+        except (IOError, OSError):
+            msg = "Failed to write index of shelves to %s" % self._index_fp
+            logging.warn(msg)
+
     def __getitem__(self, key):
         if not isinstance(key, str):
             msg = "Key should be of type string!"
             raise RuntimeError(msg)
-        
-        # First try to get it from the shelve used last
-        shlv = self._shelves[self._last_index]
-        if shlv.has_key(key):
-            return shlv[key]
-        
-        # Otherwise loop over all the shelves
-        i = 0
-        for shlv in self._shelves:
-            if shlv.has_key(key):
-                self._last_index = i
-                return shlv[key]
-            i += 1
-        raise KeyError()
-    
+        shlv = self._shelves[self._index[key]]
+        return shlv[key]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def has_key(self, key):
+        return key in self._index
+
+    def iter_keys(self, keys):
+        """Yields the results for the given keys shelve by shelve, in the
+        order in which they are stored. Keys that are not found are skipped."""
+        keys = set(keys)
+        for i, entries in enumerate(self._entries):
+            shlv = self._shelves[i]
+            for key in entries:
+                if key in keys and self._index[key] == i:
+                    yield shlv[key]
+
     def __setitem__(self, key, value):
         raise NotImplementedError()
 
     def close(self):
+        if self._shelves is None:
+            return
         for s in self._shelves:
             if s != None: s.close()
         self._shelves = None
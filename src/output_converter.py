@@ -2,6 +2,7 @@ import conv_settings
 import sys
 sys.path.append(conv_settings.pcse_dir)
 import logging
+import signal
 from sqlalchemy.exc import SQLAlchemyError
 from crop_sim_output_worker import CropSimOutputWorker
 from joint_netcdf4_raster import JointNetcdf4Raster
@@ -112,13 +113,17 @@ class OutputConverter():
                 parts = cvt[0].split("::") # separate description from units
                 self._joint_netcdf4.writeheader(var, name, parts[0].strip(), parts[1].strip())
              
-            # For each task, prepare a dictionary with relevant output
-            rows = worker._get_finished_tasks(worker._crop_no)
-            for task_id in rows:
+            # For each finished task, prepare a dictionary with relevant output.
+            # The results are read in the order in which they are stored.
+            key_fmt = "%010i"
+            finished = set(worker._get_finished_tasks(worker._crop_no))
+            keys = [key_fmt % task_id for task_id in finished]
+            retrieved = set()
+            for simresult in self._joint_shelves.iter_keys(keys):
+                task_id = simresult["task_id"]
+                retrieved.add(task_id)
                 # Convert WOFOST output to the desired output format
                 print "About to retrieve output from task %s" % task_id
-                simresult = worker._get_simresult(task_id)
-                if not simresult: continue 
                 lon = simresult["longitude"]
                 lat = simresult["latitude"]
                 allresults = simresult["allresults"]
@@ -176,6 +181,12 @@ class OutputConverter():
                     yrcount = yrcount + 1
                     prevyear = curyear
 
+            missing = len(finished - retrieved)
+            if missing > 0:
+                msg = "No results found for %i finished tasks of crop %i"
+                print msg % (missing, worker._crop_no)
+                logging.warn(msg % (missing, worker._crop_no))
+
             # Now write
             print "Stored values will now be written to the netCDF4 files ..."
             for _ in range(nrows):
@@ -232,20 +243,33 @@ def determine_CPUs():
     else:
         return max(1, user_CPU + nCPU)
         
+def init_worker():
+    # Interrupts are handled by the main process, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
 def main():
-    #===========================================================================
-    #number_of_CPU = determine_CPUs()
-    #p = Pool(number_of_CPU)
     crops = range(6, 20)
-    for crop in crops:
-        convert_to_nc4(crop)
-    #p.map(convert_to_nc4, crops)
-    # return
-    #===========================================================================
-    #p= Process(target=convert_to_nc4, args=(1,))
-    #p.start()
-    #p.join()
-    #convert_to_nc4(1)
+
+    # Build or update the index of the shelves before the workers open
+    # them, so that the workers only read the shelves and the index.
+    JointShelves(conv_settings.shelve_folder).close()
+
+    number_of_CPU = determine_CPUs()
+    if number_of_CPU == 1:
+        for crop in crops:
+            convert_to_nc4(crop)
+        return
+
+    # One crop per process, crops differ in size so hand them out one by one
+    p = Pool(min(number_of_CPU, len(crops)), init_worker)
+    try:
+        # A timeout is needed to receive KeyboardInterrupt while waiting
+        p.map_async(convert_to_nc4, crops, chunksize=1).get(7*24*3600)
+    except KeyboardInterrupt:
+        print "Terminating conversion on user request ..."
+    finally:
+        p.terminate()
+        p.join()
 
 if (__name__ == "__main__"):
     main()
@@ -0,0 +1,184 @@
+"""Store for the simulation results of the GGCMI workers.
+
+Each worker appends the summary results of its tasks to its own HDF5 file,
+one record per cell and year indexed by crop_no, (row, col) on the 0.5
+degree GGCMI grid and year. A file is written under a temporary name and
+is renamed when it is committed, so readers only see complete files and
+tasks are only reported as finished once their results are on disk. The
+merge step (ggcmi_merge_results.py) assembles the GGCMI netCDF files from
+the committed files.
+"""
+import os
+import glob
+import socket
+import logging
+from datetime import datetime
+
+import numpy as np
+import tables
+
+# Summary output of GGCMI_WLP.conf and GGCMI_PP.conf that is stored. Dates
+# are stored as proleptic Gregorian ordinals, 0 means no date, missing values
+# are stored as NaN.
+summary_variables = ["DVS", "LAIMAX", "TAGP", "TWSO", "TWLV", "TWST", "TWRT",
+                     "CTRAT", "CEVST", "RD", "GSRAINSUM", "GSTEMPSUM",
+                     "GSRADIATIONSUM"]
+date_variables = ["DOS", "DOE", "DOA", "DOM", "DOH"]
+
+# GGCMI grid
+nrows = 360
+cellsize = 0.5
+xll = -180.0
+ytop = 90.0
+
+file_suffix = ".h5"
+tmp_suffix = ".tmp"
+
+def _get_description():
+    description = {"task_id": tables.Int64Col(pos=0),
+                   "crop_no": tables.Int16Col(pos=1),
+                   "row": tables.Int16Col(pos=2),
+                   "col": tables.Int16Col(pos=3),
+                   "year": tables.Int16Col(pos=4),
+                   "longitude": tables.Float32Col(pos=5),
+                   "latitude": tables.Float32Col(pos=6)}
+    pos = len(description)
+    for name in summary_variables:
+        description[name] = tables.Float64Col(pos=pos, dflt=np.nan)
+        pos += 1
+    for name in date_variables:
+        description[name] = tables.Int32Col(pos=pos)
+        pos += 1
+    return description
+
+def get_row_and_col(lon, lat):
+    """Returns the zero-based row (counted from the north) and column of the
+    grid cell which houses lon, lat."""
+    row = int(np.floor((ytop - lat)/cellsize))
+    col = int(np.floor((lon - xll)/cellsize))
+    return row, col
+
+
+class ResultsWriter:
+    """Appends the summary results of the tasks of a worker to HDF5 files in
+    `folder`.
+
+    Results are written to a file with a temporary name. The method `commit`
+    closes the file, renames it and returns the tasks of which the results
+    were committed. A new file is started with the next task. Call `is_full`
+    to check whether `tasks_per_file` tasks are waiting to be committed.
+    """
+
+    def __init__(self, folder, tasks_per_file=25, complevel=1):
+        if not os.path.isdir(folder):
+            msg = "Folder for results store does not exist: %s" % folder
+            raise RuntimeError(msg)
+        self.folder = folder
+        self.tasks_per_file = tasks_per_file
+        self.filters = tables.Filters(complevel=complevel, complib="zlib")
+        self.prefix = "ggcmi_results_%s_%i" % (socket.gethostname(), os.getpid())
+        self.logger = logging.getLogger("GGCMI Results Writer")
+        self._nfiles = 0
+        self._h5file = None
+        self._table = None
+        self._fname = None
+        self.pending = []
+
+    def _open(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        fname = "%s_%s_%04i%s" % (self.prefix, timestamp, self._nfiles, file_suffix)
+        self._fname = os.path.join(self.folder, fname)
+        self._nfiles += 1
+        self._h5file = tables.open_file(self._fname + tmp_suffix, "w",
+                                        filters=self.filters)
+        self._table = self._h5file.create_table("/", "summary", _get_description(),
+                                                "GGCMI summary results",
+                                                expectedrows=30*self.tasks_per_file)
+
+    def add(self, task, allresults):
+        """Appends the summary results of all years in `allresults` (as
+        produced by ggcmi_task_runner) for `task`."""
+        if self._h5file is None:
+            self._open()
+        lon = float(task["longitude"])
+        lat = float(task["latitude"])
+        row, col = get_row_and_col(lon, lat)
+        record = self._table.row
+        for result in allresults:
+            summary = result["summary"]
+            if isinstance(summary, list):
+                summary = summary[0]
+            record["task_id"] = task["task_id"]
+            record["crop_no"] = task["crop_no"]
+            record["row"] = row
+            record["col"] = col
+            record["year"] = result["year"]
+            record["longitude"] = lon
+            record["latitude"] = lat
+            for name in summary_variables:
+                value = summary.get(name)
+                record[name] = np.nan if value is None else value
+            for name in date_variables:
+                value = summary.get(name)
+                record[name] = 0 if value is None else value.toordinal()
+            record.append()
+        self.pending.append(task)
+
+    def is_full(self):
+        return len(self.pending) >= self.tasks_per_file
+
+    def commit(self):
+        """Closes the current file, makes it available to readers and returns
+        the tasks of which the results were committed."""
+        committed = self.pending
+        self.pending = []
+        if self._h5file is None:
+            return committed
+        self._table.cols.crop_no.create_index()
+        self._table.cols.row.create_index()
+        self._h5file.close()
+        self._h5file = None
+        self._table = None
+        os.rename(self._fname + tmp_suffix, self._fname)
+        msg = "Committed results of %i tasks to %s"
+        self.logger.info(msg, len(committed), self._fname)
+        return committed
+
+    def close(self):
+        """Commits pending results, returns the committed tasks."""
+        return self.commit()
+
+
+def get_result_files(folder):
+    """Returns the committed result files in folder, oldest first."""
+    fnames = glob.glob(os.path.join(folder, "ggcmi_results_*" + file_suffix))
+    return sorted(fnames, key=os.path.getmtime)
+
+def read_results(folder, crop_no, rows=None):
+    """Returns the records for crop_no from all committed result files in
+    folder as a structured array sorted by row, task_id and year.
+
+    If `rows` is given as (start, stop), only the records for the grid rows
+    start up to stop are returned. When the results of a task were committed
+    more than once, only the first committed results are returned.
+    """
+    condition = "(crop_no == %i)" % crop_no
+    if rows is not None:
+        condition += " & (row >= %i) & (row < %i)" % tuple(rows)
+    parts = []
+    tasks_seen = set()
+    for fname in get_result_files(folder):
+        with tables.open_file(fname, "r") as h5file:
+            records = h5file.root.summary.read_where(condition)
+        if len(records) == 0:
+            continue
+        task_ids = np.unique(records["task_id"])
+        duplicate = np.in1d(task_ids, list(tasks_seen))
+        if duplicate.any():
+            records = records[~np.in1d(records["task_id"], task_ids[duplicate])]
+        tasks_seen.update(task_ids[~duplicate].tolist())
+        parts.append(records)
+    if not parts:
+        return np.empty(0, dtype=tables.Description(_get_description())._v_dtype)
+    records = np.concatenate(parts)
+    return records[np.lexsort((records["year"], records["task_id"], records["row"]))]
@@ -6,7 +6,7 @@ from cropinforeader import CropInfoProvider;
 #from pcse.pcse.models import Wofost71_PP;
 from pcse.base_classes import WeatherDataProvider
 from pcse.fileinput.hdf5reader import Hdf5WeatherDataProvider
-from pcse.engine import Engine as wofostEngine;
+from pcse.batch.phenology import simulate_tsums;
 #from AgmerraNetcdfReader import AgmerraWeatherDataProvider;
 from numpy import arange, mean, std;  
 from datetime import datetime, date;
@@ -81,32 +81,32 @@ def task_runner(sa_engine, task):
                     # Retrieve the relevant weather data
                     wdp = Hdf5WeatherDataProvider(fn, lat, lon, datadir);
                     
-                    # Loop over the years
+                    # Collect the timer data for the years
                     t2 = time.time()
-                    tsums = [];
+                    timers = [];
                     for year in get_available_years(wdp):
                         try:
                             # Get timer data for the current year
                             timerdata = cip.getTimerData(start_day, end_day, year);
-                            sitedata = {};
-                            soildata = {"SMFCF":0.4};
-                        
-                            # Run simulation
-                            pheno = wofostEngine(sitedata, timerdata, soildata, cropdata, wdp, config="Wofost71_PhenoOnly.conf")
-                            pheno.run(days=366)
-                            
-                            # Retrieve result
-                            results = pheno.get_output()
-                            #if (results != None) and isinstance(results, list):
-                            #    print results[-1];
-                            sumresults = pheno.get_summary_output();
-                            print sumresults;
-                            if isinstance(sumresults[0], dict) and isinstance(sumresults[0]["TSUM"], float):
-                                tsums.append(sumresults[0]["TSUM"]);
+
+                            # Skip years of which START_DATE falls before the first
+                            # or END_DATE beyond the last day with weather data, as
+                            # the years are simulated together in one call.
+                            if timerdata['START_DATE'] < wdp.first_date:
+                                continue
+                            if timerdata['END_DATE'] > wdp.last_date:
+                                continue
+                            timers.append(timerdata);
                         except Exception, e:
                             print str(e);
                         # end try  
                     # end year 
+
+                    # Simulate the phenology of all years at once
+                    tsums = [];
+                    for tsum in simulate_tsums(cropdata, wdp, timers):
+                        if isinstance(tsum, float):
+                            tsums.append(tsum);
                     
                     # Insert average etc. into database
                     if len(tsums) > 0:
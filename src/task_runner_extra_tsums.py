@@ -4,7 +4,7 @@ from cropinforeader import CropInfoProvider
 from pcse.base_classes import WeatherDataProvider
 from pcse.fileinput.hdf5reader import Hdf5WeatherDataProvider
 from pcse.exceptions import PCSEError
-from pcse.engine import Engine as wofostEngine
+from pcse.batch.phenology import simulate_tsums
 from numpy import mean, std
 from datetime import datetime
 from sqlalchemy.schema import MetaData
@@ -41,9 +41,9 @@ def task_runner(sa_engine, task):
         # Get the weather data
         wdp = Hdf5WeatherDataProvider(run_settings.hdf5_meteo_file, lat, lon)
 
-        # Loop over the years
+        # Collect the timer data for the years with available weather
         t2 = time.time()
-        tsums = []
+        timers = []
         for year in get_available_years(wdp):
             # Get timer data for the current year
             timerdata = cip.getTimerData(start_doy, end_doy, year)
@@ -53,23 +53,16 @@ def task_runner(sa_engine, task):
             # weather data.
             if timerdata['START_DATE'] < wdp.first_date: continue
             if timerdata['END_DATE'] > wdp.last_date: continue
+            timers.append(timerdata)
 
-            sitedata = {}
-            soildata = {"SMFCF":0.4}
-
-            # Run simulation
-            pheno = wofostEngine(sitedata, timerdata, soildata, cropdata, wdp,
-                        config="Wofost71_PhenoOnly.conf")
-            pheno.run(days=366)
-
-            sumresults = pheno.get_summary_output()
-            if len(sumresults) > 0:
-                tsums.append(sumresults[0]["TSUM"])
+        # Simulate the phenology of all years at once
+        tsums = []
+        for timerdata, tsum in zip(timers, simulate_tsums(cropdata, wdp, timers)):
+            if tsum is not None:
+                tsums.append(tsum)
             else:
                 msg = "No summary results for crop/year/lat/lon: %s/%s/%s/%s"
-                logging.error(msg, crop_no, year, lat, lon)
-
-        # end year
+                logging.error(msg, crop_no, timerdata["CAMPAIGNYEAR"], lat, lon)
 
         # Insert average etc. into database
         if len(tsums) > 0:
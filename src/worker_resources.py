@@ -0,0 +1,143 @@
+"""Resources that are shared by all tasks that a worker runs.
+
+Opening the crop information (CABO file and growing season netCDF file) and
+the HDF5 weather file is expensive compared to the simulation of a single
+task. Consecutive tasks of a worker mostly concern the same crop and
+neighbouring cells, so these resources are kept open by the worker and are
+reused across tasks.
+
+The crop-free soil water trajectories of the cells (see
+pcse.soil.classic_waterbalance.CropFreeTrajectory) are kept as well, so that
+they are shared by the rain-fed crops of a cell with the same season start.
+
+With cell-major tasks (run_settings.cell_major_tasks) consecutive tasks
+concern the crops of the same cell, so the weather, soil and site data of
+the last cell are kept as well (see CellInputs).
+"""
+import logging
+from collections import OrderedDict
+
+import run_settings
+from pcse.fileinput.hdf5reader import Hdf5RowReader, Hdf5WeatherDataProvider
+from cropinforeader import CropInfoProvider
+
+class ResourceCache:
+    """Keeps at most `max_size` resources created by `factory` open.
+
+    Resources are looked up by key, the least recently used resource is closed
+    and evicted when a new resource is added to a full cache.
+    """
+
+    def __init__(self, factory, max_size):
+        if max_size < 1:
+            msg = "Size of resource cache should be >= 1, got %s" % max_size
+            raise RuntimeError(msg)
+        self.factory = factory
+        self.max_size = max_size
+        self._resources = OrderedDict()
+        self.logger = logging.getLogger("GGCMI Resource Cache")
+
+    def get(self, *key):
+        """Returns the resource for key, creating it if needed."""
+        if key in self._resources:
+            resource = self._resources.pop(key)
+        else:
+            while len(self._resources) >= self.max_size:
+                self.evict(next(iter(self._resources)))
+            resource = self.factory(*key)
+            self.logger.debug("Opened resource for %s", key)
+        self._resources[key] = resource
+        return resource
+
+    def __contains__(self, key):
+        return key in self._resources
+
+    def evict(self, key):
+        """Closes the resource for key and removes it from the cache."""
+        resource = self._resources.pop(key, None)
+        if resource is not None:
+            resource.close()
+            self.logger.debug("Closed resource for %s", key)
+
+    def close(self):
+        """Closes all resources in the cache."""
+        for key in list(self._resources):
+            self.evict(key)
+
+
+class CellInputs:
+    """Weather, soil and site data of the grid cell at `longitude`,
+    `latitude`, which are the same for all crops simulated for the cell.
+
+    The weather data are read from the HDF5 file `fname` using `rowreader`
+    if given, the soil and site data are built with run_settings.
+    """
+
+    def __init__(self, fname, longitude, latitude, rowreader=None):
+        self.soildata = run_settings.get_soil_data(longitude, latitude)
+        self.sitedata = run_settings.get_site_data(self.soildata)
+        self.wdp = Hdf5WeatherDataProvider(fname, latitude, longitude,
+                                           rowreader=rowreader)
+
+    def close(self):
+        self.wdp.close()
+
+
+class WorkerResources:
+    """Provides the crop information and weather data for the tasks of a
+    worker.
+
+    CropInfoProviders are cached by crop name and water supply, the HDF5
+    weather file is kept open by a Hdf5RowReader. The crop name and water
+    supply for a crop number are only retrieved once from the database.
+    The last run_settings.max_soil_trajectories crop-free soil trajectories
+    that were used are kept, as well as the inputs of the last grid cell.
+    """
+
+    def __init__(self):
+        self.crop_info = ResourceCache(CropInfoProvider,
+                                       run_settings.max_crop_info_providers)
+        self.weather = ResourceCache(self._open_rowreader, 1)
+        self.cells = ResourceCache(self._open_cell, 1)
+        self._crops = {}
+        self._soil_trajectories = OrderedDict()
+
+    def _open_rowreader(self, fname):
+        return Hdf5RowReader(fname, max_rows=run_settings.hdf5_rows_in_memory)
+
+    def _open_cell(self, fname, longitude, latitude):
+        return CellInputs(fname, longitude, latitude, self.get_rowreader(fname))
+
+    def get_crop(self, sa_engine, crop_no, select_crop):
+        """Returns crop name and water supply for crop_no, using the function
+        `select_crop` to retrieve them from the database."""
+        if crop_no not in self._crops:
+            self._crops[crop_no] = select_crop(sa_engine, crop_no)
+        return self._crops[crop_no]
+
+    def get_crop_info_provider(self, cropname, watersupply):
+        return self.crop_info.get(cropname, watersupply)
+
+    def get_rowreader(self, fname):
+        return self.weather.get(fname)
+
+    def get_cell_inputs(self, fname, longitude, latitude):
+        return self.cells.get(fname, longitude, latitude)
+
+    def get_soil_trajectory(self, key, factory):
+        """Returns the soil trajectory for key, calling `factory()` to create
+        it when it is not available."""
+        if key in self._soil_trajectories:
+            trajectory = self._soil_trajectories.pop(key)
+        else:
+            while len(self._soil_trajectories) >= run_settings.max_soil_trajectories:
+                self._soil_trajectories.popitem(last=False)
+            trajectory = factory()
+        self._soil_trajectories[key] = trajectory
+        return trajectory
+
+    def close(self):
+        self.crop_info.close()
+        self.cells.close()
+        self.weather.close()
+        self._soil_trajectories.clear()